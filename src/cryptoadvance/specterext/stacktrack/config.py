@@ -6,6 +6,40 @@ Here Configuration of your Extension takes place
 class BaseConfig:
     """ This is an extension-based Config which is used as Base """
     STACKTRACK_SOMEKEY = "some value"
+    # How often the background job brings the per-wallet rollups up to date
+    STACKTRACK_ROLLUP_INTERVAL_MINUTES = 5
+    # Its first run waits this long after startup, so it doesn't slow down the server's first requests
+    STACKTRACK_ROLLUP_START_DELAY_SECONDS = 60
+    # Render charts in the browser from the JSON series endpoints instead of shipping server-rendered plotly divs
+    STACKTRACK_CLIENT_SIDE_CHARTS = True
+    # The wallets overview refreshes up to this many wallets at the same time ...
+    STACKTRACK_REFRESH_WORKERS = 8
+    # ... and waits at most this many seconds for them. Slower wallets are shown with stale data.
+    STACKTRACK_REFRESH_TIMEOUT = 10
+    # Wallets with at least this many txs are kept in a memory mapped store under the extension's data folder
+    STACKTRACK_TX_STORE_MIN_TXS = 10_000
+    # Charts of custom time ranges (start/end query parameters) pick the interval which gives about this many bars
+    STACKTRACK_CHART_POINTS = 60
+    # First day of the week for weekly bars: 0 for Monday, 6 for Sunday
+    STACKTRACK_WEEK_START = 0
+    # Live charts check for new txs and blocks this often ...
+    STACKTRACK_EVENTS_POLL_SECONDS = 5
+    # ... and their event streams end after this many seconds, the browser then reconnects
+    STACKTRACK_EVENTS_MAX_SECONDS = 300
+    # Lets Prometheus scrape /metrics with this bearer token. Without it, only logged in admins see the metrics.
+    STACKTRACK_METRICS_TOKEN = None
+    # Server-side charts are rendered by this many worker processes, so they don't hold the web process' GIL. 0 renders
+    # them in the web process.
+    STACKTRACK_RENDER_PROCESSES = 0
+    # At most this many charts are handed to the workers at a time, further ones are rendered in the web process ...
+    STACKTRACK_RENDER_MAX_PENDING = 4
+    # ... as are charts the workers haven't rendered after this many seconds
+    STACKTRACK_RENDER_TIMEOUT = 30
+    # Show a sparkline of the last year's balance for every wallet on the wallets overview
+    STACKTRACK_SPARKLINES = True
+    # Charts bin and label txs by the days, weeks and months of this IANA timezone (e.g. "Europe/Berlin"), unless a
+    # user picks another one in the extension's settings. None uses the server's local time.
+    STACKTRACK_TIMEZONE = None
 
 
 class ProductionConfig(BaseConfig):
@@ -1,21 +1,53 @@
+from __future__ import annotations
+
+import calendar
+import functools
+import hashlib
+import hmac
+import importlib.metadata
+import importlib.util
 import logging
+import os
 import random
+import zoneinfo
+from typing import TYPE_CHECKING, Optional
 
-from flask import current_app as app, render_template, request, redirect, url_for, flash
-from flask_login import login_required
-import plotly.graph_objects as go
+from flask import (
+    current_app as app, render_template, request, redirect, url_for, flash, jsonify, make_response,
+    send_from_directory, Response, stream_with_context, g
+)
+from flask_login import current_user, login_required
 
 from cryptoadvance.specter.server_endpoints.wallets.wallets_vm import WalletsOverviewVm
 from cryptoadvance.specter.services import callbacks
 from cryptoadvance.specter.specter import Specter
 from cryptoadvance.specter.wallet import Wallet
 
-from .helpers import plot
+from .helpers import metrics
+from .helpers.core import Interval
+from .helpers.txs import merge_txlists, net_transfers, split_unconfirmed, tx_fingerprint
 from .service import StacktrackService
 
+if TYPE_CHECKING:
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    from .helpers.tx_series import TxSeries
+
+# The chart helpers pull in pandas, numpy and plotly. They're imported by the functions which use them, so Specter's
+# startup and pages without a chart don't load them.
+
 logger = logging.getLogger(__name__)
 rand = random.randint(0, 1e32)  # to force style refresh
 
+DEFAULT_SPAN = "1y"
+
+CHART_ERROR = "There was an error while creating the chart. See the logs for details"
+
+# One year, see static_plotly_js()
+PLOTLY_JS_MAX_AGE = 365 * 24 * 60 * 60
+PLOTLY_VERSION = importlib.metadata.version("plotly")
+
 # TODO Check whether this is correct. I don't see a blueprint attribute on StacktrackService.
 stacktrack_endpoint = StacktrackService.blueprint
 
@@ -37,6 +69,7 @@ def inject_common_stuff():
         "ext_wallettabs": specter().service_manager.execute_ext_callbacks(
             callbacks.add_wallettabs
         ),
+        "plotly_js_url": url_for(f"{StacktrackService.get_blueprint_name()}.static_plotly_js", v=PLOTLY_VERSION),
     }
 
 
@@ -45,42 +78,108 @@ def inject_common_stuff():
 def index():
     show_overview_chart: str = StacktrackService.get_show_overview_chart()
     print(show_overview_chart)
+    service_data = StacktrackService.get_current_user_service_data() or {}
     return render_template(
         "stacktrack/index.jinja",
         show_overview_chart=show_overview_chart,
+        timezone=service_data.get(StacktrackService.TIMEZONE, ""),
+        default_timezone=StacktrackService.default_timezone(),
+        timezones=sorted(zoneinfo.available_timezones()),
     )
 
 @stacktrack_endpoint.route("/settings", methods=["POST"])
 @login_required
 def settings_post():
+    from .helpers import dtutil
+
     show_overview_chart = request.form["show_overview_chart"]
     print(show_overview_chart)
     StacktrackService.set_show_overview_chart(show_overview_chart)
+    timezone = request.form.get("timezone", "")
+    try:
+        dtutil.check_timezone(timezone or None)
+        StacktrackService.set_timezone(timezone)
+    except ValueError as e:
+        flash(str(e), "error")
     return redirect(url_for(f"{StacktrackService.get_blueprint_name()}.index"))
 
 
+def _profileable(view):
+    """
+    Lets admins profile a view by adding ?profile=1 to its URL. The response is then the profiler's report instead of
+    the page, and the report is also stored under the extension's data folder. Without the parameter, this only costs a
+    lookup in the query string.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.args.get("profile") != "1":
+            return view(*args, **kwargs)
+        if not getattr(current_user, "is_admin", False):
+            return jsonify(error="Only admins can profile requests"), 403
+        from .helpers import profiling
+
+        _, report = profiling.profile_call(view, *args, **kwargs)
+        path = profiling.store_report(os.path.join(ext().data_folder, "profiles"), request.endpoint, report)
+        logger.info(f"Stored the profile of {request.full_path} in {path}")
+        return Response(report, mimetype="text/plain")
+
+    return wrapper
+
+
 @stacktrack_endpoint.route("/wallets_overview")
 @login_required
+@_profileable
 def wallets_overview():
     show_overview_chart = StacktrackService.get_show_overview_chart() == "yes"
+    chart = None
+    series_url = None
+    export_url = None
+    stale_wallets = []
+    wallet_sparklines = []
+    # Replace the default tx table with one that includes a chart.
+    view_model = WalletsOverviewVm()
+    view_model.tx_table_include = "stacktrack/wallet/overview/overview_chart_and_tx_table.jinja"
+    span, window = None, None
+    if show_overview_chart:
+        try:
+            span, window = _chart_request()
+        except ValueError as e:
+            flash(f"Can't show that chart: {e}", "error")
+            return redirect(url_for(".wallets_overview"))
     try:
-        span: str = request.args.get("span")
-        span = "1y" if span is None else span
-        specter().check_blockheight()
-        # Replace the default tx table with one that includes a chart.
-        view_model = WalletsOverviewVm()
-        view_model.tx_table_include = "stacktrack/wallet/overview/overview_chart_and_tx_table.jinja"
-
+        with _stage("check_blockheight"):
+            specter().check_blockheight()
         wallets: list[Wallet] = list(specter().wallet_manager.wallets.values())
-        for wallet in wallets:
-            wallet.update_balance()
-            wallet.check_utxo()
-        txs: list = _extract_txs(wallets)
-        chart: go.Figure = plot.build_chart(span, txs)
+        # The refresh comes first, so the page and its chart show the wallets' current txs
+        with _stage("refresh"):
+            stale_wallets = ext().wallet_refresher.refresh(wallets)
+        txlists, pending_lists = _load_txlists(wallets)
     except Exception as e:
+        # The wallets are still listed, only without the chart and the sparklines
         logger.exception(e)
-        flash("(Probably) Due to https://github.com/cryptoadvance/specterext-stacktrack/issues/12 the chart is not available for unconfirmed transactions in the wallet-overview. Check the logs for details", "error")
-        chart = None
+        flash(CHART_ERROR, "error")
+        wallets = None
+
+    if wallets is not None:
+        if _show_sparklines():
+            from .helpers import sparklines
+
+            try:
+                with _stage("sparklines"):
+                    sparkline_window = sparklines.sparkline_window(tz=_timezone())
+                    wallet_sparklines = _wallet_sparklines(wallets, txlists, sparkline_window)
+            except Exception as e:
+                logger.exception(e)
+        if show_overview_chart:
+            export_url = url_for(".stacktrack_wallets_overview_export", **_chart_args(span))
+            if _client_side_charts():
+                series_url = url_for(".stacktrack_wallets_overview_series", **_chart_args(span))
+            else:
+                try:
+                    chart: go.Figure = _chart_html(_overview_frame(txlists, pending_lists, span, window))
+                except Exception as e:
+                    logger.exception(e)
+                    flash(CHART_ERROR, "error")
 
     return render_template(
         "wallet/overview/wallets_overview.jinja",
@@ -89,23 +188,41 @@ def wallets_overview():
         services=specter().service_manager.services,
         wallets_overview_vm=view_model,
         active_span=span,
-        chart=chart if show_overview_chart else None,
+        chart=chart,
+        series_url=series_url,
+        export_url=export_url,
+        chart_layout=_chart_layout(series_url),
+        stale_wallets=stale_wallets,
+        wallet_sparklines=wallet_sparklines,
         url_path="wallets_overview",
     )
 
 
 @stacktrack_endpoint.route("/wallet/<wallet_alias>/chart", methods=["GET"])
 @login_required
+@_profileable
 def stacktrack_wallet_chart(wallet_alias: str) -> str:
+    chart = None
+    series_url = None
+    events_url = None
+    export_url = None
+    try:
+        span, window = _chart_request()
+    except ValueError as e:
+        flash(f"Can't show that chart: {e}", "error")
+        return redirect(url_for(".stacktrack_wallet_chart", wallet_alias=wallet_alias))
     try:
-        span: str = request.args.get("span")
-        span = "1y" if span is None else span
         wallet: Wallet = app.specter.wallet_manager.get_by_alias(wallet_alias)
-        chart: go.Figure = plot.build_chart(span, wallet.txlist())
+        txs, pending = _load_txs(wallet)
+        export_url = url_for(".stacktrack_wallet_export", wallet_alias=wallet_alias, **_chart_args(span))
+        if _client_side_charts():
+            series_url = url_for(".stacktrack_wallet_series", wallet_alias=wallet_alias, **_chart_args(span))
+            events_url = url_for(".stacktrack_wallet_events", wallet_alias=wallet_alias, **_chart_args(span))
+        else:
+            chart: go.Figure = _chart_html(_wallet_frame(wallet, txs, pending, span, window))
     except Exception as e:
         logger.exception(e)
-        flash("There was an error while creating the chart. See the logs for details", "error")
-        chart = None
+        flash(CHART_ERROR, "error")
 
     return render_template(
         "stacktrack/wallet/chart/wallet_chart.jinja",
@@ -114,16 +231,440 @@ def stacktrack_wallet_chart(wallet_alias: str) -> str:
         ext_wallettabs=app.specter.service_manager.execute_ext_callbacks(callbacks.add_wallettabs),
         active_span=span,
         chart=chart,
+        series_url=series_url,
+        events_url=events_url,
+        export_url=export_url,
+        chart_layout=_chart_layout(series_url),
         url_path="chart",
     )
 
 
+@stacktrack_endpoint.route("/api/wallets_overview/series", methods=["GET"])
+@login_required
+def stacktrack_wallets_overview_series():
+    try:
+        span, window = _chart_request()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    try:
+        wallets: list[Wallet] = list(specter().wallet_manager.wallets.values())
+        txlists, pending_lists = _load_txlists(wallets)
+        etag = _overview_etag(wallets, txlists, pending_lists, span, window)
+        if _not_modified(etag):
+            return _not_modified_response(etag)
+        return _cacheable(_series_response(_overview_frame(txlists, pending_lists, span, window)), etag)
+    except Exception as e:
+        logger.exception(e)
+        return jsonify(error=CHART_ERROR), 500
+
+
+@stacktrack_endpoint.route("/api/wallet/<wallet_alias>/series", methods=["GET"])
+@login_required
+def stacktrack_wallet_series(wallet_alias: str):
+    try:
+        span, window = _chart_request()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    try:
+        wallet: Wallet = app.specter.wallet_manager.get_by_alias(wallet_alias)
+        txs, pending = _load_txs(wallet)
+        etag = _wallet_etag(wallet, txs, pending, span, window)
+        if _not_modified(etag):
+            return _not_modified_response(etag)
+        return _cacheable(_series_response(_wallet_frame(wallet, txs, pending, span, window)), etag)
+    except Exception as e:
+        logger.exception(e)
+        return jsonify(error=CHART_ERROR), 500
+
+
+@stacktrack_endpoint.route("/api/wallets_overview/export.csv", methods=["GET"])
+@login_required
+def stacktrack_wallets_overview_export():
+    """Streams the combined history of all wallets as CSV, see helpers/export.py"""
+    try:
+        interval = _export_interval()
+        span, window = _chart_request(interval)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    try:
+        # Only confirmed txs are exported
+        txlists, _ = _load_txlists(list(specter().wallet_manager.wallets.values()))
+        with _stage("merge"):
+            txs: list = _extract_txs(txlists)
+        series = _series(_overview_key(), txs)
+    except Exception as e:
+        logger.exception(e)
+        return jsonify(error="There was an error while exporting the history. See the logs for details"), 500
+    return _csv_response(series, span, window, interval, "wallets_overview")
+
+
+@stacktrack_endpoint.route("/api/wallet/<wallet_alias>/export.csv", methods=["GET"])
+@login_required
+def stacktrack_wallet_export(wallet_alias: str):
+    """Streams the history of a wallet as CSV, see helpers/export.py"""
+    try:
+        interval = _export_interval()
+        span, window = _chart_request(interval)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    try:
+        wallet: Wallet = app.specter.wallet_manager.get_by_alias(wallet_alias)
+        txs, _ = _load_txs(wallet)
+        series = _series(wallet.fullpath, txs)
+    except Exception as e:
+        logger.exception(e)
+        return jsonify(error="There was an error while exporting the history. See the logs for details"), 500
+    return _csv_response(series, span, window, interval, wallet_alias)
+
+
+@stacktrack_endpoint.route("/api/wallet/<wallet_alias>/events", methods=["GET"])
+@login_required
+def stacktrack_wallet_events(wallet_alias: str):
+    """Streams the updates of a wallet chart as Server-Sent Events, see helpers/events.py"""
+    try:
+        span, window = _chart_request()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    try:
+        wallet: Wallet = app.specter.wallet_manager.get_by_alias(wallet_alias)
+    except Exception as e:
+        logger.exception(e)
+        return jsonify(error=CHART_ERROR), 500
+
+    def fingerprint():
+        # Only the chain tip and the wallet's tx count are polled, the txs are loaded once those change
+        wallet_state = ext().wallet_polls.get(wallet.fullpath, functools.partial(_wallet_state, wallet))
+        return wallet_state, _chart_window(span, window)
+
+    def build_series():
+        from .helpers import plot
+
+        txs, pending = split_unconfirmed(wallet.txlist())
+        return plot.series_from_df(_wallet_frame(wallet, txs, pending, span, window))
+
+    from .helpers import events
+
+    stream = events.ChartEventStream(
+        fingerprint,
+        build_series,
+        poll_seconds=app.config.get("STACKTRACK_EVENTS_POLL_SECONDS", 5),
+        max_seconds=app.config.get("STACKTRACK_EVENTS_MAX_SECONDS", 300),
+    )
+    return Response(
+        stream_with_context(iter(stream)),
+        mimetype="text/event-stream",
+        # Proxies like nginx would otherwise hold the events back
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@stacktrack_endpoint.route("/metrics", methods=["GET"])
+def stacktrack_metrics():
+    """
+    Chart timings and cache counters in the Prometheus text format, see helpers/metrics.py. Needs a logged in admin or,
+    for scrapers, the STACKTRACK_METRICS_TOKEN as bearer token.
+    """
+    token = app.config.get("STACKTRACK_METRICS_TOKEN")
+    authorization = request.headers.get("Authorization", "")
+    has_token = bool(token) and hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())
+    if not has_token:
+        if not current_user.is_authenticated:
+            return app.login_manager.unauthorized()
+        if not getattr(current_user, "is_admin", False):
+            return jsonify(error="Only admins can read the metrics"), 403
+    return Response(metrics.REGISTRY.expose(), mimetype="text/plain; version=0.0.4")
+
+
+@stacktrack_endpoint.teardown_request
+def record_stage_timings(exception):
+    timer = g.pop("stacktrack_timer", None)
+    if timer is not None:
+        timer.record()
+
+
+@stacktrack_endpoint.route("/plotly.min.js", methods=["GET"])
+def static_plotly_js():
+    """Serves the plotly.js bundle shipped with plotly.py. Its URL carries the plotly version, so it's cached for good."""
+    plotly_folder = importlib.util.find_spec("plotly").submodule_search_locations[0]
+    response = send_from_directory(
+        os.path.join(plotly_folder, "package_data"), "plotly.min.js", max_age=PLOTLY_JS_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def _client_side_charts() -> bool:
+    return app.config.get("STACKTRACK_CLIENT_SIDE_CHARTS", True)
+
+
+def _show_sparklines() -> bool:
+    return app.config.get("STACKTRACK_SPARKLINES", True)
+
+
+def _chart_layout(series_url: Optional[str]) -> Optional[str]:
+    """The layout of a chart rendered in the browser, see plot.chart_layout_json(). None if there's no such chart."""
+    if series_url is None:
+        return None
+    from .helpers import plot
+
+    return plot.chart_layout_json()
+
+
+def _timezone() -> Optional[str]:
+    """The current user's timezone, see StacktrackService.get_timezone(). It's looked up once per request."""
+    if "stacktrack_timezone" not in g:
+        g.stacktrack_timezone = StacktrackService.get_timezone()
+    return g.stacktrack_timezone
+
+
+def _wallet_sparklines(wallets: list, txlists: list, window: tuple) -> list:
+    """A (wallet, SVG) tuple per wallet. The SVGs are cached, and redrawn from the history cache's series."""
+    tip_height = specter().info.get("blocks")
+    svgs = ext().sparkline_cache.get([
+        # The history cache (and with it pandas and plotly) is only needed for sparklines which have to be redrawn
+        (wallet.fullpath, tx_fingerprint(txs, tip_height), functools.partial(_series, wallet.fullpath, txs))
+        for wallet, txs in zip(wallets, txlists)
+    ], window, _timezone())
+    return [(wallet, svgs[wallet.fullpath]) for wallet in wallets]
+
+
+def _chart_request(interval: Interval = None) -> tuple:
+    """
+    Reads the chart's time range from the query string. That's either a span (1d, 1w, 1m, 1y or all) or a custom
+    time range from start to end. Both are ISO 8601 dates/datetimes or epoch seconds, end defaults to now. Dates and
+    datetimes without an offset are in the user's timezone. The interval of a custom time range is picked by
+    ``plot.plan_window``.
+
+    :param interval: the interval of a custom time range, instead of the one plan_window picks
+    :return: a tuple (span, window). window is None for spans, span is None for custom time ranges.
+    :raises ValueError: if the span or time range is invalid
+    """
+    from .helpers import dtutil, plot
+
+    start = request.args.get("start")
+    end = request.args.get("end")
+    if start is None and end is None:
+        span = request.args.get("span", DEFAULT_SPAN)
+        plot.check_span(span)
+        _timer().span = span
+        return span, None
+    if start is None:
+        raise ValueError("A time range needs a start")
+    tz = _timezone()
+    start_dt = dtutil.parse_datetime(start, tz)
+    end_dt = dtutil.parse_datetime(end, tz) if end is not None else dtutil.now(tz)
+    week_start = app.config.get("STACKTRACK_WEEK_START", calendar.MONDAY)
+    if interval is not None:
+        if start_dt >= end_dt:
+            raise ValueError("The start of the time range has to be before its end")
+        return None, plot.widen_window(start_dt, end_dt, interval, week_start)
+    return None, plot.plan_window(start_dt, end_dt, app.config.get("STACKTRACK_CHART_POINTS", 60), week_start)
+
+
+def _export_interval() -> Optional[Interval]:
+    """
+    Reads the interval of an export from the query string: hour, day, week, month or quarter. The time range is widened
+    to whole bins of it. None keeps the interval of the span, or lets plot.plan_window pick one for custom time
+    ranges.
+
+    :raises ValueError: if the interval is invalid
+    """
+    name = request.args.get("interval")
+    if name is None:
+        return None
+    try:
+        return Interval[name.upper()]
+    except KeyError:
+        raise ValueError(f"Illegal interval: {name}")
+
+
+def _chart_args(span: str) -> dict:
+    """The query string of the chart requested by _chart_request(), e.g. for its series URL"""
+    if span is not None:
+        return {"span": span}
+    return {key: request.args[key] for key in ("start", "end") if key in request.args}
+
+
+def _load_txlists(wallets: list) -> tuple:
+    """
+    Loads the txs of the wallets, split into confirmed and unconfirmed ones (see split_unconfirmed()). The confirmed txs
+    are binned and cached, the unconfirmed ones are only drawn as an overlay.
+
+    :return: a tuple (txlists, pending_lists), each with a tx list per wallet
+    """
+    with _stage("txlist"):
+        split = [split_unconfirmed(wallet.txlist()) for wallet in wallets]
+    txlists = [txs for txs, _ in split]
+    pending_lists = [pending for _, pending in split]
+    _timer().num_txs = sum(len(txs) + len(pending) for txs, pending in split)
+    return txlists, pending_lists
+
+
+def _load_txs(wallet: Wallet) -> tuple:
+    """The confirmed and unconfirmed txs of a wallet, see _load_txlists()"""
+    txlists, pending_lists = _load_txlists([wallet])
+    return txlists[0], pending_lists[0]
+
+
+def _chart_html(df: pd.DataFrame) -> str:
+    from .helpers import plot
+
+    pool = ext().render_pool
+    if pool is not None:
+        with _stage("render_pool"):
+            return pool.render(plot.chart_html_from_arrays, *plot.chart_arrays(df))
+    with _stage("html"):
+        return plot.build_chart_from_df(df)
+
+
+def _series(key: str, txs: list) -> TxSeries:
+    return ext().history_cache.get_series(key, txs, specter().info.get("blocks"))
+
+
+def _csv_response(series: TxSeries, span: str, window: tuple, interval: Interval, name: str) -> Response:
+    """Streams the binned history of the series, for the span or custom time range and optionally another interval"""
+    from .helpers import export, plot
+
+    tz = _timezone()
+    if window is None:
+        window = plot.span_window(span, series, tz)
+    if interval is not None and interval != window[2]:
+        start_dt, end_dt, _ = window
+        window = plot.widen_window(
+            start_dt, end_dt, interval, app.config.get("STACKTRACK_WEEK_START", calendar.MONDAY)
+        )
+    filename = f"stacktrack_{name}_{span or 'custom'}.csv"
+    return Response(
+        # The rows are generated while they're sent, so long exports don't pile up in memory
+        stream_with_context(export.export_csv(series, window, tz)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def _series_response(df: pd.DataFrame) -> Response:
+    from .helpers import plot
+
+    with _stage("series"):
+        return jsonify(plot.series_from_df(df))
+
+
+def _timer() -> metrics.StageTimer:
+    """The stage timings of this request, which are recorded once it's done, see record_stage_timings()"""
+    if "stacktrack_timer" not in g:
+        g.stacktrack_timer = metrics.StageTimer()
+    return g.stacktrack_timer
+
+
+def _stage(name: str):
+    return _timer().stage(name)
+
+
+def _wallet_frame(wallet: Wallet, txs: list, pending: list, span: str, window: tuple = None) -> pd.DataFrame:
+    return _frame(wallet.fullpath, txs, pending, span, window)
+
+
+def _overview_frame(txlists: list, pending_lists: list, span: str, window: tuple = None) -> pd.DataFrame:
+    with _stage("merge"):
+        txs: list = _extract_txs(txlists)
+        pending: list = _extract_txs(pending_lists)
+    return _frame(_overview_key(), txs, pending, span, window)
+
+
+def _overview_key() -> str:
+    from .helpers import cache
+
+    return cache.overview_key(current_user.get_id())
+
+
+def _frame(key: str, txs: list, pending: list, span: str, window: tuple) -> pd.DataFrame:
+    tip_height = specter().info.get("blocks")
+    tz = _timezone()
+    with _stage("frame"):
+        df = ext().history_cache.get_frame(key, txs, tip_height, span, window, tz, pending)
+    # The other spans are built in the background after the requested one, so switching spans is only a lookup
+    ext().span_precomputer.submit(key, txs, tip_height, tz)
+    return df
+
+
+def _wallet_state(wallet: Wallet) -> tuple:
+    """
+    A cheap fingerprint of a wallet for its chart's event stream: the chain tip and the wallet's tx count. That's two
+    small RPC calls instead of loading all txs. New txs raise the count, confirmations come with a new tip.
+    """
+    specter().check_blockheight()
+    return specter().info.get("blocks"), wallet.rpc.getwalletinfo()["txcount"]
+
+
+def _wallet_etag(wallet: Wallet, txs: list, pending: list, span: str, window: tuple) -> str:
+    fingerprint = tx_fingerprint(txs, specter().info.get("blocks"))
+    return _etag(span, window, wallet.fullpath, fingerprint, _pending_txids(pending))
+
+
+def _overview_etag(wallets: list, txlists: list, pending_lists: list, span: str, window: tuple) -> str:
+    tip_height = specter().info.get("blocks")
+    fingerprints = [
+        (wallet.fullpath, tx_fingerprint(txs, tip_height), _pending_txids(pending))
+        for wallet, txs, pending in zip(wallets, txlists, pending_lists)
+    ]
+    return _etag(span, window, fingerprints)
+
+
+def _pending_txids(pending: list) -> tuple:
+    # There are only a few unconfirmed txs at a time, so they're simply listed
+    return tuple(tx["txid"] for tx in pending)
+
+
+def _etag(span: str, window: tuple, *parts) -> str:
+    """
+    Derives the ETag of a series response from the given parts (tx fingerprints) and everything else the response
+    depends on: span or custom time range, user, timezone, rendering mode and this process (see rand).
+    """
+    tz = _timezone()
+    window = _chart_window(span, window)
+    key = (span, window, tz, parts, current_user.get_id(), _client_side_charts(), rand)
+    return hashlib.sha256(repr(key).encode()).hexdigest()
+
+
+def _chart_window(span: str, window: tuple) -> tuple:
+    """The current window of a span, or the given custom time range"""
+    if window is not None:
+        return window
+    from .helpers import plot
+    from .helpers.tx_series import TxSeries
+
+    # The chart window moves on with the clock even if no new txs arrive. For "all", the window also depends on the
+    # oldest tx, which the tx fingerprints cover.
+    return plot.span_window(span, TxSeries.empty(), _timezone())
+
+
+def _not_modified(etag: str) -> bool:
+    not_modified = etag in request.if_none_match
+    metrics.ETAG_REQUESTS.inc(result="hit" if not_modified else "miss")
+    return not_modified
+
+
+def _not_modified_response(etag: str) -> Response:
+    return _cacheable(Response(status=304), etag)
+
+
+def _cacheable(response, etag: str) -> Response:
+    """
+    Adds caching headers to a series response. Caches may store it, but have to revalidate it with the ETag on every
+    use, which is a cheap 304 as long as the wallets don't change. Pages aren't cached like that, they also show
+    balances, prices and a CSRF token, which the ETag doesn't cover.
+    """
+    response = make_response(response)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    # Responses are per user, so shared caches have to keep them apart.
+    response.vary.add("Cookie")
+    return response
+
+
 # 'type' object not subscriptable in Python 3.7, so just use bare list.
-# def _extract_txs(wallets: list[Wallet]) -> list:
-def _extract_txs(wallets: list) -> list:
-    txs: list = []
-    for wallet in wallets:
-        txs = txs + wallet.txlist()
-
-    # Reverse sort, like wallets do
-    return sorted(txs, key=lambda d: d["blockheight"], reverse=True)
+# def _extract_txs(txlists: list[list]) -> list:
+def _extract_txs(txlists: list) -> list:
+    # Newest first, like wallets do. Transfers between the wallets only count with their fee.
+    return net_transfers(merge_txlists(txlists))
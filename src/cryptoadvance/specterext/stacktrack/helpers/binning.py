@@ -0,0 +1,155 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from . import dtutil
+from .core import Interval, SATS_PER_BTC
+
+
+# This module holds the NumPy-backed binning engine. It works on plain arrays (epoch seconds and satoshis) so that the
+# per-transaction work happens in vectorized code rather than in Python loops.
+
+
+def tx_arrays(txs: list) -> tuple:
+    """
+    Pulls epoch timestamps and satoshi amounts out of a transaction list.
+
+    :param txs: transaction list, as returned by ``Wallet.txlist()``
+    :return: a tuple (timestamps, sats) of int64 arrays
+    """
+    # TODO Check on the difference between "time" and "blocktime".
+    #  Not sure which I'm supposed to use here.
+    timestamps = np.fromiter((tx["time"] for tx in txs), dtype=np.int64, count=len(txs))
+    sats = np.fromiter((round(tx.flow_amount * SATS_PER_BTC) for tx in txs), dtype=np.int64, count=len(txs))
+    return timestamps, sats
+
+
+def bin_edges(start_dt: dt.datetime, end_dt: dt.datetime, interval: Interval, tz: str = None) -> np.ndarray:
+    """
+    Computes the bin edges for the given time range as epoch seconds. The result holds the start of every bin plus the
+    end of the last bin, so n bins have n + 1 edges. Weekly bins start on the weekday of start_dt.
+
+    :param start_dt: start of the time range (inclusive), a naive datetime in the timezone tz
+    :param end_dt: end of the time range (exclusive)
+    :param interval: increment interval
+    :param tz: an IANA timezone name, None for the server's local time. Bins start at midnight (or the full hour, the
+        first of the month, ...) in this timezone, also across DST changes.
+    :return: an int64 array of edges
+    """
+    return dtutil.edge_epochs(start_dt, end_dt, interval, tz=tz)
+
+
+def bin_sats(timestamps: np.ndarray, sats: np.ndarray, edges: np.ndarray) -> tuple:
+    """
+    Sums satoshis into the bins described by ``edges``. Amounts before the first edge are summed into the prior count,
+    amounts at or after the last edge are dropped.
+
+    :param timestamps: epoch seconds, in any order
+    :param sats: satoshi amounts matching ``timestamps``
+    :param edges: sorted bin edges as returned by ``bin_edges``
+    :return: a tuple (bins, prior_count) where bins is an int64 array with one entry per bin
+    """
+    num_bins = len(edges) - 1
+    idx = np.searchsorted(edges, timestamps, side="right") - 1
+    prior_count = int(sats[idx < 0].sum())
+    in_range = (idx >= 0) & (idx < num_bins)
+    # bincount only sums weights as float64. Every partial sum is an integer well below 2**53 (the total supply is
+    # about 2.1e15 sats), so the float sums are exact and the cast back is lossless.
+    bins = np.bincount(idx[in_range], weights=sats[in_range], minlength=num_bins)
+    return bins.astype(np.int64), prior_count
+
+
+def bin_sorted_sats(timestamps: np.ndarray, sats_cusum: np.ndarray, edges: np.ndarray) -> tuple:
+    """
+    Does the same as ``bin_sats`` for timestamps sorted oldest first, using the cumulative sum of their sats. The
+    balance at each edge is a binary search away, so this only reads O(len(edges) * log(n)) elements. That's what makes
+    it cheap for long and memory mapped series: the txs don't need to be scanned or loaded.
+
+    :param timestamps: epoch seconds, sorted ascending
+    :param sats_cusum: the cumulative sum of the satoshi amounts matching ``timestamps``
+    :param edges: sorted bin edges as returned by ``bin_edges``
+    :return: a tuple (bins, prior_count) where bins is an int64 array with one entry per bin
+    """
+    balances = _balances_at(timestamps, sats_cusum, edges)
+    return np.diff(balances), int(balances[0])
+
+
+def bin_sorted_sats_many(timestamps: np.ndarray, sats_cusum: np.ndarray, edge_arrays: list) -> list:
+    """
+    Does what ``bin_sorted_sats`` does for several sets of edges, e.g. those of all chart spans, with a single binary
+    search over the timestamps for all of their edges.
+
+    :param timestamps: epoch seconds, sorted ascending
+    :param sats_cusum: the cumulative sum of the satoshi amounts matching ``timestamps``
+    :param edge_arrays: a list of sorted bin edges as returned by ``bin_edges``
+    :return: a list of (bins, prior_count) tuples, one per set of edges
+    """
+    if not edge_arrays:
+        return []
+    balances = _balances_at(timestamps, sats_cusum, np.concatenate(edge_arrays))
+    splits = np.cumsum([len(edges) for edges in edge_arrays])[:-1]
+    return [(np.diff(part), int(part[0])) for part in np.split(balances, splits)]
+
+
+def _balances_at(timestamps: np.ndarray, sats_cusum: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Returns the sum of the sats before each edge"""
+    # The number of txs before each edge. A tx exactly on an edge belongs to the bin starting there.
+    idx = np.searchsorted(timestamps, edges, side="left")
+    balances = np.zeros(len(edges), dtype=np.int64)
+    has_txs = idx > 0
+    balances[has_txs] = sats_cusum[idx[has_txs] - 1]
+    return balances
+
+
+def count_sats(
+        timestamps: np.ndarray,
+        sats: np.ndarray,
+        start_dt: dt.datetime,
+        end_dt: dt.datetime,
+        interval: Interval,
+        tz: str = None
+) -> pd.DataFrame:
+    """
+    Array-based counterpart of ``plot._count_sats``. Returns the same DataFrame with ``timestamp``, ``sats`` and
+    ``sats_cusum`` columns.
+
+    :param timestamps: epoch seconds, in any order
+    :param sats: satoshi amounts matching ``timestamps``
+    :param start_dt: start of the time range (inclusive)
+    :param end_dt: end of the time range (exclusive)
+    :param interval: increment interval
+    :param tz: the timezone of the time range and the bins, see ``bin_edges``
+    :return: a pandas DataFrame
+    """
+    edges = bin_edges(start_dt, end_dt, interval, tz)
+    bins, prior_count = bin_sats(timestamps, sats, edges)
+    return frame_from_bins(edges, bins, prior_count, tz)
+
+
+def frame_from_bins(edges: np.ndarray, bins: np.ndarray, prior_count: int, tz: str = None) -> pd.DataFrame:
+    """
+    Builds the chart DataFrame of binned sats. Its timestamps are the starts of the bins as naive datetimes in the
+    timezone tz, which is how the charts label them.
+    """
+    timestamps = pd.to_datetime(dtutil.wall_epochs(edges[:-1], tz), unit="s")
+    df = pd.DataFrame({"timestamp": timestamps, "sats": bins})
+    df["sats_cusum"] = df["sats"].cumsum() + prior_count
+    return df
+
+
+def add_pending(df: pd.DataFrame, edges: np.ndarray, timestamps: np.ndarray, sats: np.ndarray) -> pd.DataFrame:
+    """
+    Adds unconfirmed txs to a chart DataFrame as an overlay, without touching its confirmed columns: ``pending_sats``
+    holds their amounts per bin, ``pending_cusum`` the balance including them.
+
+    :param df: a DataFrame as returned by ``frame_from_bins``, modified in place
+    :param edges: the bin edges the DataFrame was built with
+    :param timestamps: epoch seconds of the unconfirmed txs
+    :param sats: their satoshi amounts
+    :return: the DataFrame
+    """
+    bins, prior_count = bin_sats(timestamps, sats, edges)
+    df["pending_sats"] = bins
+    df["pending_cusum"] = df["sats_cusum"] + np.cumsum(bins) + prior_count
+    return df
@@ -0,0 +1,245 @@
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+from . import binning, metrics, plot
+from .rollup import ROLLUP_INTERVALS, RollupStore
+from .tx_series import TxSeries
+from .tx_store import TxStore
+from .txs import tx_fingerprint
+
+
+logger = logging.getLogger(__name__)
+
+
+def overview_key(user_id: str) -> str:
+    """
+    The key of a user's wallets overview, i.e. the combined txs of all their wallets. Every user has their own
+    wallets, so each one gets their own key. Wallets use their fullpath, so this can't collide.
+    """
+    return f"wallets_overview:{user_id}"
+
+
+class _CachedFrame:
+    __slots__ = ("window", "tz", "edges", "bins", "prior_count", "df")
+
+    def __init__(self, window: tuple, tz: str, edges: np.ndarray, bins: np.ndarray, prior_count: int):
+        self.window = window
+        self.tz = tz
+        self.edges = edges
+        self.bins = bins
+        self.prior_count = prior_count
+        self.df = binning.frame_from_bins(edges, bins, prior_count, tz)
+
+    def matches(self, window: tuple, tz: str) -> bool:
+        return self.window == window and self.tz == tz
+
+    def fold(self, series: TxSeries):
+        bins, prior_count = series.bin_sats(self.edges)
+        self.bins = self.bins + bins
+        self.prior_count += prior_count
+        self.df = binning.frame_from_bins(self.edges, self.bins, self.prior_count, self.tz)
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "txids", "series", "frames")
+
+    def __init__(self, fingerprint: tuple, txids: set, series: TxSeries):
+        self.fingerprint = fingerprint
+        self.txids = txids
+        self.series = series
+        self.frames = {}
+
+
+class HistoryCache:
+    """
+    Keeps the binned balance history per wallet, so that repeated chart views don't rebuild the series from scratch.
+    The wallet's txs are kept as a compact ``TxSeries``, the cache holds no reference to the tx dicts.
+
+    Entries are keyed by wallet and validated with ``tx_fingerprint``. If the only change since the last view is a
+    set of new txs, those are folded into the cached bins and cumulative sums. If the change can't be explained by new
+    txs (e.g. a replaced or dropped tx), the entry is rebuilt.
+
+    Frames which aren't cached yet are read from the wallet's rollup if there is an up to date one in ``rollups`` for
+    the frame's timezone, and only computed from the txs otherwise.
+
+    Wallets with at least ``tx_store_min_txs`` txs are kept in ``tx_store`` and their series is memory mapped from
+    there, so the cache doesn't hold their history on the heap.
+
+    Each key has its own lock, so building the history of one wallet (or loading it from the tx store, or
+    precomputing its spans) doesn't hold up the charts of other wallets.
+    """
+
+    def __init__(self, rollups: RollupStore = None, tx_store: TxStore = None, tx_store_min_txs: int = 0):
+        self.rollups = rollups
+        self.tx_store = tx_store
+        self.tx_store_min_txs = tx_store_min_txs
+        self._entries = {}
+        # key -> lock of its entry. self._lock only guards this dict.
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def get_frame(
+            self, key: str, txs: list, tip_height, span: str, window: tuple = None, tz: str = None, pending: list = None
+    ) -> pd.DataFrame:
+        """
+        Returns the chart DataFrame for the given span, as ``plot.build_frame`` would.
+
+        :param key: identifies the wallet (or combination of wallets) the txs belong to
+        :param txs: confirmed transaction list, sorted newest first like ``Wallet.txlist()``, see
+            ``txs.split_unconfirmed``
+        :param tip_height: current block height
+        :param span: one of 1d, 1w, 1m, 1y, all
+        :param window: a custom time range as returned by ``plot.plan_window``, which is used instead of the span.
+            Frames of custom time ranges aren't cached, but they're still read from the rollups or the sorted txs, so
+            they don't take longer for long histories.
+        :param tz: the timezone of the chart, see ``plot.span_window``
+        :param pending: unconfirmed txs, which are added as an overlay (see ``binning.add_pending``). They aren't
+            cached, so they can come and go without invalidating the cached frames.
+        :return: a pandas DataFrame; callers may modify it
+        """
+        fingerprint = tx_fingerprint(txs, tip_height)
+        with self._key_lock(key):
+            entry = self._current_entry(key, txs, fingerprint)
+            if window is not None:
+                frame = self._build_frame(key, entry.series, fingerprint, window, tz)
+                df = frame.df
+            else:
+                frame = self._span_frame(key, entry, span, tz)
+                df = frame.df.copy()
+        if pending:
+            binning.add_pending(df, frame.edges, *binning.tx_arrays(pending))
+        return df
+
+    def get_series(self, key: str, txs: list, tip_height) -> TxSeries:
+        """
+        Returns the wallet's txs as a TxSeries, kept up to date like the frames of ``get_frame``.
+
+        :param key: identifies the wallet (or combination of wallets) the txs belong to
+        :param txs: transaction list, sorted newest first like ``Wallet.txlist()``
+        :param tip_height: current block height
+        """
+        fingerprint = tx_fingerprint(txs, tip_height)
+        with self._key_lock(key):
+            return self._current_entry(key, txs, fingerprint).series
+
+    def precompute(self, key: str, txs: list, tip_height, spans=plot.SPANS, tz: str = None):
+        """
+        Brings the frames of all given spans up to date, so that ``get_frame`` only has to look them up. Frames which
+        are still current are left alone, so calling this for an unchanged wallet is cheap.
+
+        :param key: identifies the wallet (or combination of wallets) the txs belong to
+        :param txs: transaction list, sorted newest first like ``Wallet.txlist()``
+        :param tip_height: current block height
+        :param spans: the spans to precompute, all of them by default
+        :param tz: the timezone of the charts
+        """
+        fingerprint = tx_fingerprint(txs, tip_height)
+        with self._key_lock(key):
+            entry = self._current_entry(key, txs, fingerprint)
+            windows = {span: plot.span_window(span, entry.series, tz) for span in spans}
+            stale = {
+                span: window for span, window in windows.items()
+                if span not in entry.frames or not entry.frames[span].matches(window, tz)
+            }
+            if stale:
+                # All stale spans at once, see plot.build_frames
+                entry.frames.update(self._build_frames(key, entry.series, entry.fingerprint, stale, tz))
+
+    def invalidate(self, key: str):
+        with self._key_lock(key):
+            self._entries.pop(key, None)
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _current_entry(self, key: str, txs: list, fingerprint: tuple) -> _Entry:
+        entry = self._entries.get(key)
+        if entry is None or entry.fingerprint != fingerprint:
+            entry = self._update_entry(key, entry, txs, fingerprint)
+        return entry
+
+    def _span_frame(self, key: str, entry: _Entry, span: str, tz: str) -> _CachedFrame:
+        # Span windows move along with the clock, so a cached frame is only current while its window is. Wallets
+        # belong to a single user, so there's a single timezone per wallet and a frame per span is enough.
+        window = plot.span_window(span, entry.series, tz)
+        frame = entry.frames.get(span)
+        if frame is None or not frame.matches(window, tz):
+            metrics.HISTORY_CACHE_REQUESTS.inc(result="miss")
+            frame = self._build_frame(key, entry.series, entry.fingerprint, window, tz)
+            entry.frames[span] = frame
+        else:
+            metrics.HISTORY_CACHE_REQUESTS.inc(result="hit")
+        return frame
+
+    def _update_entry(self, key: str, entry: _Entry, txs: list, fingerprint: tuple) -> _Entry:
+        new_txs = self._find_new_txs(entry, txs) if entry is not None else None
+        if new_txs is None:
+            entry = _Entry(fingerprint, {tx["txid"] for tx in txs}, self._load_series(key, txs))
+            self._entries[key] = entry
+            return entry
+
+        logger.debug(f"Folding {len(new_txs)} new txs into cached history of {key}")
+        entry.fingerprint = fingerprint
+        if new_txs:
+            entry.txids.update(tx["txid"] for tx in new_txs)
+            new_series = TxSeries.from_txs(new_txs)
+            if self._uses_tx_store(txs):
+                # Appends the new txs and maps them, instead of copying the mapped history onto the heap
+                entry.series = self.tx_store.load(key, txs)
+            else:
+                entry.series = entry.series.concat(new_series)
+            for frame in entry.frames.values():
+                frame.fold(new_series)
+        return entry
+
+    @staticmethod
+    def _find_new_txs(entry: _Entry, txs: list):
+        """Returns the txs which aren't part of the entry yet, or None if the entry can't be updated incrementally"""
+        # The count of the fingerprint, not of the txids: merged tx lists have the legs of shared txs under the same txid
+        num_new = len(txs) - entry.fingerprint[0]
+        if num_new < 0:
+            return None
+        # A single pass over all txs. Stopping at the first num_new unknown txids would miss a replaced or reorged out
+        # tx which is made up for by further new txs: its sats would stay in the history.
+        txids = {tx["txid"] for tx in txs}
+        if not entry.txids <= txids:
+            return None
+        new_txs = [tx for tx in txs if tx["txid"] not in entry.txids]
+        if len(new_txs) != num_new:
+            # E.g. a new leg of a cached tx, which changes its netted flow (see txs.net_transfers)
+            return None
+        return new_txs
+
+    def _load_series(self, key: str, txs: list) -> TxSeries:
+        if self._uses_tx_store(txs):
+            return self.tx_store.load(key, txs)
+        return TxSeries.from_txs(txs)
+
+    def _uses_tx_store(self, txs: list) -> bool:
+        return self.tx_store is not None and len(txs) >= self.tx_store_min_txs
+
+    def _build_frame(self, key: str, series: TxSeries, fingerprint: tuple, window: tuple, tz: str) -> _CachedFrame:
+        return self._build_frames(key, series, fingerprint, {None: window}, tz)[None]
+
+    def _build_frames(self, key: str, series: TxSeries, fingerprint: tuple, windows: dict, tz: str) -> dict:
+        """Builds a frame per window, from the rollup where it has the window's interval and from the series otherwise"""
+        rollup = None
+        if self.rollups is not None and any(window[2] in ROLLUP_INTERVALS for window in windows.values()):
+            rollup = self.rollups.get(key, fingerprint, tz)
+        frames = {}
+        from_series = {}
+        for name, (start_dt, end_dt, interval) in windows.items():
+            edges = binning.bin_edges(start_dt, end_dt, interval, tz)
+            counts = rollup.window(edges, interval) if rollup is not None and interval in ROLLUP_INTERVALS else None
+            if counts is not None:
+                frames[name] = _CachedFrame(windows[name], tz, edges, *counts)
+            else:
+                from_series[name] = edges
+        counts = series.bin_sats_many(list(from_series.values())) if from_series else []
+        for (name, edges), (bins, prior_count) in zip(from_series.items(), counts):
+            frames[name] = _CachedFrame(windows[name], tz, edges, bins, prior_count)
+        return frames
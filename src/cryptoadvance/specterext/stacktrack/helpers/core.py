@@ -8,3 +8,5 @@ class Interval(Enum):
     HOUR = 1
     DAY = 2
     MONTH = 3
+    WEEK = 4
+    QUARTER = 5
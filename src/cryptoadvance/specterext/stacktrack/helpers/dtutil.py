@@ -1,36 +1,136 @@
-from datetime import datetime, timedelta
+import calendar
+import functools
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
 
 from .core import Interval
 
 
-def snap_to(dt: datetime, interval: Interval) -> datetime:
+# Weeks start on Monday unless told otherwise. Same numbering as datetime.weekday().
+MONDAY = calendar.MONDAY
+SUNDAY = calendar.SUNDAY
+
+# Lengths of the intervals which don't depend on the calendar
+_FIXED_STEPS = {
+    Interval.HOUR: np.timedelta64(1, "h"),
+    Interval.DAY: np.timedelta64(1, "D"),
+    Interval.WEEK: np.timedelta64(7, "D"),
+}
+# Lengths of the others, in months
+_MONTH_STEPS = {
+    Interval.MONTH: 1,
+    Interval.QUARTER: 3,
+}
+
+# How far apart the UTC offsets are sampled to find the timezone's transitions, see local_epochs()
+_OFFSET_SAMPLE_STEP = 7 * 24 * 60 * 60
+# The transitions of named timezones are cached in blocks of this many samples, about a year
+_TRANSITION_BLOCK_SAMPLES = 52
+# The UTC offsets of epochs outside of these are looked up at these. Datetimes only go from year 1 to 9999, and the
+# offset lookups reach up to a block beyond the time range.
+_MIN_OFFSET_EPOCH = int(datetime(1, 1, 2, tzinfo=timezone.utc).timestamp())
+_MAX_OFFSET_EPOCH = int(datetime(9999, 12, 30, tzinfo=timezone.utc).timestamp())
+
+# Timezones are passed around as IANA names like "Europe/Berlin", so they can be compared, hashed and pickled. None
+# stands for the server's local time.
+
+
+def check_timezone(tz: str):
+    """Raises a ValueError unless tz is None or the name of a timezone in the IANA database"""
+    if tz is None:
+        return
+    try:
+        ZoneInfo(tz)
+    except (ValueError, KeyError) as e:
+        # ZoneInfoNotFoundError is a KeyError
+        raise ValueError(f"Unknown timezone: {tz}") from e
+
+
+def resolve_timezone(tz: str = None) -> str:
+    """
+    Names the timezone tz stands for. A named timezone is returned as is, None resolves to the server's current local
+    timezone, named after its abbreviations and UTC offsets like "CET/CEST+3600+7200", as the process may not know its
+    IANA name.
+    """
+    if tz is not None:
+        return tz
+    return "{}/{}{:+d}{:+d}".format(*time.tzname, -time.timezone, -time.altzone)
+
+
+def now(tz: str = None) -> datetime:
+    """The current time as a naive datetime in the given timezone"""
+    return datetime.now(_zone(tz)).replace(tzinfo=None)
+
+
+def from_epoch(epoch: float, tz: str = None) -> datetime:
+    """Converts epoch seconds to a naive datetime in the given timezone"""
+    return datetime.fromtimestamp(epoch, _zone(tz)).replace(tzinfo=None)
+
+
+def to_timezone(aware_dt: datetime, tz: str = None) -> datetime:
+    """Converts a timezone aware datetime to a naive datetime in the given timezone"""
+    return aware_dt.astimezone(_zone(tz)).replace(tzinfo=None)
+
+
+def parse_datetime(value: str, tz: str = None) -> datetime:
+    """
+    Parses epoch seconds or an ISO 8601 date/datetime, e.g. from a query string, into a naive datetime in the given
+    timezone. Values without an offset are taken to be in that timezone already.
+
+    :raises ValueError: if the value is invalid or out of range
+    """
+    try:
+        if value.isdigit():
+            return from_epoch(int(value), tz)
+        value_dt = datetime.fromisoformat(value)
+        if value_dt.tzinfo is not None:
+            value_dt = to_timezone(value_dt, tz)
+        return value_dt
+    except (OverflowError, OSError) as e:
+        # E.g. epoch seconds beyond the platform's time_t, or an offset which moves the datetime past year 9999
+        raise ValueError(f"Out of range: {value}") from e
+
+
+def snap_to(dt: datetime, interval: Interval, week_start: int = MONDAY) -> datetime:
     """
     Snaps the given datetime to a new datetime floor, as determined by the interval. For example, this method would
     convert 2022-09-12 14:08:01 to
 
     - 2022-09-12 14:00:00 for Interval.HOUR
     - 2022-09-12 00:00:00 for Interval.DAY
+    - 2022-09-12 00:00:00 for Interval.WEEK (a Monday)
     - 2022-09-01 00:00:00 for Interval.MONTH
+    - 2022-07-01 00:00:00 for Interval.QUARTER
 
     :param dt: a datetime
     :param interval: interval to determine the floor to snap to
+    :param week_start: the first day of a week for Interval.WEEK, MONDAY or SUNDAY
     :return: the snapped datetime
     """
     if interval == Interval.HOUR:
         return datetime(dt.year, dt.month, dt.day, dt.hour)
     elif interval == Interval.DAY:
         return datetime(dt.year, dt.month, dt.day)
+    elif interval == Interval.WEEK:
+        return datetime(dt.year, dt.month, dt.day) - timedelta(days=(dt.weekday() - week_start) % 7)
     elif interval == Interval.MONTH:
         return datetime(dt.year, dt.month, 1)
+    elif interval == Interval.QUARTER:
+        return datetime(dt.year, (dt.month - 1) // 3 * 3 + 1, 1)
     else:
         raise ValueError(f"Illegal interval: {interval}")
 
 
-def next_dt(curr_dt: datetime, interval: Interval):
+def next_dt(curr_dt: datetime, interval: Interval, week_start: int = MONDAY):
     if interval == Interval.HOUR:
         return snap_to(curr_dt, interval) + timedelta(hours=1)
     elif interval == Interval.DAY:
         return snap_to(curr_dt, interval) + timedelta(days=1)
+    elif interval == Interval.WEEK:
+        return snap_to(curr_dt, interval, week_start) + timedelta(days=7)
     elif interval == Interval.MONTH:
         year = curr_dt.year
         month = curr_dt.month + 1
@@ -38,3 +138,177 @@ def next_dt(curr_dt: datetime, interval: Interval):
             year += 1
             month = 1
         return datetime(year, month, 1)
+    elif interval == Interval.QUARTER:
+        month = snap_to(curr_dt, interval).month + 3
+        return datetime(curr_dt.year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+    else:
+        raise ValueError(f"Illegal interval: {interval}")
+
+
+def advance(edge_dt: datetime, interval: Interval, steps: int) -> datetime:
+    """
+    Moves a bin edge on by whole intervals, like applying ``next_dt`` steps times. edge_dt must already be on an edge of
+    the interval, e.g. a result of ``next_dt``. Raises an OverflowError or ValueError past year 9999.
+    """
+    if interval in _FIXED_STEPS:
+        return edge_dt + steps * _FIXED_STEPS[interval].item()
+    elif interval in _MONTH_STEPS:
+        months = edge_dt.year * 12 + edge_dt.month - 1 + steps * _MONTH_STEPS[interval]
+        return datetime(months // 12, months % 12 + 1, 1)
+    else:
+        raise ValueError(f"Illegal interval: {interval}")
+
+
+def edges(start_dt: datetime, end_dt: datetime, interval: Interval, week_start: int = None) -> np.ndarray:
+    """
+    Computes the bin edges for the given time range as naive datetimes, all at once. That's start_dt, followed by
+    ``next_dt`` applied over and over until end_dt is reached or passed:
+
+        curr_dt = start_dt
+        while curr_dt < end_dt:
+            yield curr_dt
+            curr_dt = next_dt(curr_dt, interval)
+        yield curr_dt
+
+    :param start_dt: start of the time range (inclusive)
+    :param end_dt: end of the time range (exclusive)
+    :param interval: increment interval
+    :param week_start: the first day of a week for Interval.WEEK. Defaults to the weekday of start_dt, so a time range
+        snapped to either week start keeps it.
+    :return: a datetime64[s] array of edges
+    """
+    start = np.datetime64(start_dt, "s")
+    end = np.datetime64(end_dt, "s")
+    if start >= end:
+        return np.array([start])
+    week_start = start_dt.weekday() if week_start is None else week_start
+    first = np.datetime64(next_dt(start_dt, interval, week_start), "s")
+    if interval in _FIXED_STEPS:
+        step = _FIXED_STEPS[interval]
+        count = max(0, -(-(end - first) // step))
+        following = first + np.arange(count + 1) * step
+    elif interval in _MONTH_STEPS:
+        step = _MONTH_STEPS[interval]
+        first_month = first.astype("datetime64[M]")
+        count = max(0, -(-(end.astype("datetime64[M]") - first_month).astype(np.int64) // step))
+        following = (first_month + np.arange(count + 2) * step).astype("datetime64[s]")
+        # end_dt may lie within the month computed above, then the last edge is one step too far
+        following = following[: np.searchsorted(following, end, side="left") + 1]
+    else:
+        raise ValueError(f"Illegal interval: {interval}")
+    return np.concatenate(([start], following))
+
+
+def edge_epochs(
+        start_dt: datetime, end_dt: datetime, interval: Interval, week_start: int = None, tz: str = None
+) -> np.ndarray:
+    """
+    Like ``edges``, but returns the edges as epoch seconds. The time range is taken to be in the given timezone, see
+    ``local_epochs``.
+
+    :return: an int64 array of edges
+    """
+    return local_epochs(edges(start_dt, end_dt, interval, week_start), tz)
+
+
+def local_epochs(local_dts: np.ndarray, tz: str = None) -> np.ndarray:
+    """
+    Converts naive datetimes in the given timezone to epoch seconds. The result is the same as calling
+    ``datetime.timestamp()`` on each of them (after ``replace(tzinfo=ZoneInfo(tz))`` unless tz is None), including
+    times which are skipped or repeated when the clocks change: those get the UTC offset from before the change.
+
+    The UTC offsets of the timezone are sampled once a week over the time range, and the exact transitions are
+    searched in between. So it takes a few dozen offset lookups per year, instead of one per datetime. This assumes the
+    UTC offset doesn't change more than once a week.
+
+    :param local_dts: a datetime64 array
+    :param tz: an IANA timezone name, None for the server's local time
+    :return: an int64 array
+    """
+    walls = local_dts.astype("datetime64[s]").astype(np.int64)
+    if len(walls) == 0:
+        return walls
+    # The UTC offsets are at most a day, so this covers the instants of all the local datetimes.
+    transitions, offsets = _transitions(int(walls.min()) - 2 * 86400, int(walls.max()) + 2 * 86400, tz)
+    # Local datetimes from the later wall time of a transition on use the new offset. The ones before (including the
+    # skipped or repeated ones) use the old one.
+    thresholds = transitions + np.maximum(offsets[:-1], offsets[1:])
+    return walls - offsets[np.searchsorted(thresholds, walls, side="right")]
+
+
+def wall_epochs(epochs: np.ndarray, tz: str = None) -> np.ndarray:
+    """
+    The inverse of ``local_epochs``: converts epoch seconds to the wall clock time of the given timezone, as seconds
+    since 1970-01-01 00:00 on that clock. That's what plotly shows for a date axis, and what
+    ``pd.to_datetime(..., unit="s")`` turns into naive datetimes.
+
+    :param epochs: an int64 array
+    :param tz: an IANA timezone name, None for the server's local time
+    :return: an int64 array
+    """
+    epochs = np.asarray(epochs, dtype=np.int64)
+    if len(epochs) == 0:
+        return epochs
+    transitions, offsets = _transitions(int(epochs.min()), int(epochs.max()), tz)
+    return epochs + offsets[np.searchsorted(transitions, epochs, side="right")]
+
+
+def _transitions(start: int, end: int, tz: str) -> tuple:
+    """
+    Finds the UTC offset changes of a timezone between two epochs.
+
+    :return: a tuple (transitions, offsets) of int64 arrays. ``offsets[i + 1]`` applies from ``transitions[i]`` on,
+        ``offsets[0]`` before the first transition.
+    """
+    if tz is None:
+        # The server's timezone can be changed (see time.tzset()), so its transitions aren't cached
+        return _find_transitions(start, end, tz)
+    # The rules of a named timezone don't change while the process runs, so they're searched once per block of
+    # _TRANSITION_BLOCK_SAMPLES samples and cached. Consecutive blocks share their boundary sample.
+    block_seconds = _TRANSITION_BLOCK_SAMPLES * _OFFSET_SAMPLE_STEP
+    blocks = [_block_transitions(block, tz) for block in range(start // block_seconds, end // block_seconds + 1)]
+    transitions = np.concatenate([block[0] for block in blocks])
+    offsets = np.concatenate([blocks[0][1][:1]] + [block[1][1:] for block in blocks])
+    return transitions, offsets
+
+
+@functools.lru_cache(maxsize=1024)
+def _block_transitions(block: int, tz: str) -> tuple:
+    block_seconds = _TRANSITION_BLOCK_SAMPLES * _OFFSET_SAMPLE_STEP
+    return _find_transitions(block * block_seconds, (block + 1) * block_seconds, tz)
+
+
+def _find_transitions(start: int, end: int, tz: str) -> tuple:
+    samples = range(start, end + _OFFSET_SAMPLE_STEP, _OFFSET_SAMPLE_STEP)
+    prev_epoch, prev_offset = samples[0], _utc_offset(samples[0], tz)
+    transitions = []
+    offsets = [prev_offset]
+    for epoch in samples[1:]:
+        offset = _utc_offset(epoch, tz)
+        if offset != prev_offset:
+            transitions.append(_find_transition(prev_epoch, epoch, prev_offset, tz))
+            offsets.append(offset)
+        prev_epoch, prev_offset = epoch, offset
+    return np.array(transitions, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+
+def _zone(tz: str):
+    return None if tz is None else ZoneInfo(tz)
+
+
+def _utc_offset(epoch: int, tz: str) -> int:
+    epoch = min(max(epoch, _MIN_OFFSET_EPOCH), _MAX_OFFSET_EPOCH)
+    if tz is None:
+        return time.localtime(epoch).tm_gmtoff
+    return int(datetime.fromtimestamp(epoch, ZoneInfo(tz)).utcoffset().total_seconds())
+
+
+def _find_transition(lo: int, hi: int, lo_offset: int, tz: str) -> int:
+    """Returns the first epoch in (lo, hi] which doesn't have the offset lo_offset"""
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if _utc_offset(mid, tz) == lo_offset:
+            lo = mid
+        else:
+            hi = mid
+    return hi
@@ -0,0 +1,162 @@
+import json
+import logging
+import threading
+import time
+from typing import Callable
+
+
+logger = logging.getLogger(__name__)
+
+# The amount columns of a series, see plot.series_from_df
+BIN_COLUMNS = ("in", "out")
+# The unconfirmed tx overlay of a series, which is only there while the wallet has unconfirmed txs
+PENDING_COLUMNS = ("pending", "pending_cumulative")
+
+
+def series_delta(old: dict, new: dict):
+    """
+    Describes how a chart series changed, so the browser can patch its chart instead of reloading it. That's only
+    possible if both series have the same bins: a new tx changes the amounts of its bin and the cumulative amounts from
+    there on. Unconfirmed txs come and go rarely, so a changed pending overlay is sent as a full series.
+
+    :param old: the series the browser has, as returned by ``plot.series_from_df``
+    :param new: the current series
+    :return: None if the bins or the pending overlay differ. Otherwise a dict with the indexes of the changed bins
+        (``bins``), their new in and out amounts, and the cumulative amounts from the first changed bin on (``tail``,
+        starting at ``tail_start``). Nothing changed if ``bins`` and ``tail`` are empty.
+    """
+    if old["timestamp"] != new["timestamp"]:
+        return None
+    if any(old.get(column) != new.get(column) for column in PENDING_COLUMNS):
+        return None
+    changed = [
+        i for i in range(len(new["timestamp"])) if any(old[column][i] != new[column][i] for column in BIN_COLUMNS)
+    ]
+    # The cumulative amounts also change without a changed bin, when a tx before the first bin comes in
+    tail_start = next((i for i, (a, b) in enumerate(zip(old["cumulative"], new["cumulative"])) if a != b), None)
+    delta = {"bins": changed, **{column: [new[column][i] for i in changed] for column in BIN_COLUMNS}}
+    if tail_start is None:
+        delta.update(tail_start=len(new["cumulative"]), tail=[])
+    else:
+        delta.update(tail_start=tail_start, tail=new["cumulative"][tail_start:])
+    return delta
+
+
+def format_event(event: str, data: dict) -> str:
+    """Formats a Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class ChartEventStream:
+    """
+    A Server-Sent Events stream which keeps a chart up to date. It polls a cheap fingerprint of the chart (chain
+    tip, tx count, time range) and only builds the series when that changes. The first event is the full
+    series (``series``), after that it sends ``delta`` events as described in ``series_delta``, or the full series again
+    if the chart's bins moved.
+
+    The stream ends after ``max_seconds``. Browsers reconnect on their own, after ``retry_ms``, so no connection ties up
+    a worker for good.
+
+    :param fingerprint: returns something comparable which changes whenever the series does
+    :param build_series: returns the current series, see ``plot.series_from_df``. It's called right after a changed
+        fingerprint, so it may use whatever the fingerprint loaded.
+    :param poll_seconds: how often the fingerprint is checked
+    :param max_seconds: how long the stream lasts
+    :param keepalive_seconds: idle streams get a comment this often, so proxies don't drop them
+    :param retry_ms: how long browsers wait before they reconnect
+    :param sleep: waits the given number of seconds, replaceable for tests
+    """
+
+    def __init__(
+            self,
+            fingerprint: Callable,
+            build_series: Callable,
+            poll_seconds: float,
+            max_seconds: float,
+            keepalive_seconds: float = 30,
+            retry_ms: int = 1000,
+            sleep: Callable = time.sleep
+    ):
+        self.fingerprint = fingerprint
+        self.build_series = build_series
+        self.poll_seconds = poll_seconds
+        self.max_seconds = max_seconds
+        self.keepalive_seconds = keepalive_seconds
+        self.retry_ms = retry_ms
+        self.sleep = sleep
+
+    def __iter__(self):
+        try:
+            yield from self._events()
+        except Exception as e:
+            # The browser reconnects and the stream starts over with the full series
+            logger.exception(e)
+
+    def _events(self):
+        start = time.monotonic()
+        last_sent = start
+        last_fingerprint = None
+        series = None
+        yield f"retry: {self.retry_ms}\n\n"
+        while True:
+            fingerprint = self.fingerprint()
+            if series is None or fingerprint != last_fingerprint:
+                new_series = self.build_series()
+                event = self._event(series, new_series)
+                if event is not None:
+                    yield event
+                    last_sent = time.monotonic()
+                series, last_fingerprint = new_series, fingerprint
+            elif time.monotonic() - last_sent >= self.keepalive_seconds:
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+            if time.monotonic() - start >= self.max_seconds:
+                return
+            self.sleep(self.poll_seconds)
+
+    @staticmethod
+    def _event(old: dict, new: dict):
+        delta = series_delta(old, new) if old is not None else None
+        if delta is None:
+            return format_event("series", new)
+        if not delta["bins"] and not delta["tail"]:
+            # E.g. a new block without new txs
+            return None
+        return format_event("delta", delta)
+
+
+class SharedPoll:
+    """
+    Shares a poll between the event streams of the same chart, e.g. of a wallet open in several tabs. A result which is
+    younger than ``poll_seconds`` is reused, so the node is asked once per wallet and poll interval, no matter how many
+    streams are open. While one stream polls, the others wait for its result instead of polling too.
+
+    :param poll_seconds: how long a result is reused
+    :param clock: returns the current time in seconds, replaceable for tests
+    """
+
+    def __init__(self, poll_seconds: float, clock: Callable = time.monotonic):
+        self.poll_seconds = poll_seconds
+        self.clock = clock
+        self._lock = threading.Lock()
+        # key -> lock held while that key is polled
+        self._key_locks = {}
+        # key -> (time, result) of the last poll
+        self._results = {}
+
+    def get(self, key, poll: Callable):
+        """
+        Returns the result of the key's last poll, or polls it if that's too old.
+
+        :param key: what's polled, e.g. a wallet's fullpath
+        :param poll: returns the current result, e.g. a cheap fingerprint of the wallet
+        """
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            polled = self._results.get(key)
+            if polled is not None and self.clock() - polled[0] < self.poll_seconds:
+                return polled[1]
+            result = poll()
+            self._results[key] = (self.clock(), result)
+            return result
@@ -0,0 +1,103 @@
+import csv
+import datetime as dt
+import io
+
+import numpy as np
+
+from . import binning, dtutil
+from .core import Interval
+from .tx_series import TxSeries
+
+
+# The CSV export streams the binned history of a wallet. The bins are computed and written this many at a time, so
+# an export of any length only holds a chunk of them in memory.
+CHUNK_BINS = 4096
+
+COLUMNS = ("timestamp", "in", "out", "cumulative")
+
+
+def chunk_end(start_dt: dt.datetime, interval: Interval, bins: int, week_start: int) -> dt.datetime:
+    """
+    Returns the end of the bins-th bin from start_dt, i.e. the edge ``dtutil.edges`` would put there. Only the first
+    bin may be partial, all others are whole intervals. ``datetime.max`` if that's past year 9999, the time range ends
+    before then.
+    """
+    try:
+        return dtutil.advance(dtutil.next_dt(start_dt, interval, week_start), interval, bins - 1)
+    except (OverflowError, ValueError):
+        return dt.datetime.max
+
+
+def iter_bins(series: TxSeries, window: tuple, tz: str = None, chunk_bins: int = CHUNK_BINS):
+    """
+    Bins the series over the given time range a chunk at a time. Together the chunks hold the same bins as the frame of
+    ``plot.build_window_frame``.
+
+    :param series: the wallet's txs
+    :param window: a tuple (start_dt, end_dt, interval) as returned by ``plot.span_window`` or ``plot.plan_window``
+    :param tz: the timezone of the time range, see ``binning.bin_edges``
+    :param chunk_bins: the number of bins per chunk
+    :return: a generator of (edges, bins, cumulative) tuples of int64 arrays. edges are the epoch seconds of the bins'
+        starts plus the end of the chunk's last bin, cumulative is the balance at the end of each bin.
+    """
+    start_dt, end_dt, interval = window
+    week_start = start_dt.weekday()
+    balance = None
+    while True:
+        end_of_chunk = min(chunk_end(start_dt, interval, chunk_bins, week_start), end_dt)
+        edges = binning.bin_edges(start_dt, end_of_chunk, interval, tz)
+        bins, prior_count = series.bin_sats(edges)
+        if balance is None:
+            balance = prior_count
+        cumulative = np.cumsum(bins) + balance
+        if len(bins):
+            balance = int(cumulative[-1])
+            yield edges, bins, cumulative
+        if end_of_chunk >= end_dt:
+            return
+        start_dt = end_of_chunk
+
+
+def export_csv(series: TxSeries, window: tuple, tz: str = None, chunk_bins: int = CHUNK_BINS):
+    """
+    Streams the binned history of a series as CSV with the columns in ``COLUMNS``. Timestamps are the bins' starts in
+    ISO 8601 with their UTC offset, amounts are in satoshis like in ``plot.series_from_df``.
+
+    :param series: the wallet's txs
+    :param window: the time range and interval, see ``iter_bins``
+    :param tz: the timezone of the time range
+    :param chunk_bins: the number of rows rendered at a time
+    :return: a generator of CSV text chunks, starting with the header
+    """
+    yield _csv_rows([COLUMNS])
+    for edges, bins, cumulative in iter_bins(series, window, tz, chunk_bins):
+        starts = edges[:-1]
+        walls = dtutil.wall_epochs(starts, tz)
+        timestamps = np.char.add(
+            np.datetime_as_string(walls.astype("datetime64[s]")).astype(str), _offset_strings(walls - starts)
+        )
+        yield _csv_rows(zip(
+            timestamps.tolist(), np.maximum(bins, 0).tolist(), np.minimum(bins, 0).tolist(), cumulative.tolist()
+        ))
+
+
+def _offset_strings(offsets: np.ndarray) -> np.ndarray:
+    """Formats UTC offsets in seconds like +02:00. There are only a few distinct ones, so each is formatted once."""
+    unique, inverse = np.unique(offsets, return_inverse=True)
+    formatted = [_format_offset(int(offset)) for offset in unique]
+    return np.array(formatted, dtype=str)[inverse]
+
+
+def _format_offset(offset: int) -> str:
+    sign = "-" if offset < 0 else "+"
+    hours, rest = divmod(abs(offset), 3600)
+    minutes, seconds = divmod(rest, 60)
+    formatted = f"{sign}{hours:02d}:{minutes:02d}"
+    # Only historic local mean times have seconds
+    return f"{formatted}:{seconds:02d}" if seconds else formatted
+
+
+def _csv_rows(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
@@ -0,0 +1,168 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Metrics in the Prometheus text format, see https://prometheus.io/docs/instrumenting/exposition_formats/
+# This only covers the counters and histograms the extension needs, so it doesn't depend on prometheus_client.
+
+# Upper bounds of the timing histograms, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Upper bounds (exclusive) of the wallet size buckets, in txs
+WALLET_SIZES = ((1_000, "<1k"), (10_000, "<10k"), (100_000, "<100k"), (1_000_000, "<1M"))
+
+
+def wallet_size_bucket(num_txs) -> str:
+    """Returns a coarse label for a wallet's tx count, so metrics of similar wallets are grouped"""
+    if num_txs is None:
+        return "unknown"
+    for limit, label in WALLET_SIZES:
+        if num_txs < limit:
+            return label
+    return ">=1M"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_values(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(_label_values(self.labelnames, labels), 0)
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: a count per bucket (the last one is +Inf), and the sum of all observations
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_values(self.labelnames, labels)
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[bucket] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels) -> int:
+        counts, _ = self._values.get(_label_values(self.labelnames, labels), ([], 0))
+        return sum(counts)
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames + ("le",), key + (_format_value(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self._register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self._register(Histogram(*args, **kwargs))
+
+    def expose(self) -> str:
+        """Returns all metrics in the Prometheus text format"""
+        return "".join(f"{line}\n" for metric in self._metrics for line in metric.expose())
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "stacktrack_chart_stage_seconds",
+    "Time spent in each stage of a chart request",
+    ("stage", "span", "wallet_size"),
+)
+HISTORY_CACHE_REQUESTS = REGISTRY.counter(
+    "stacktrack_history_cache_requests_total",
+    "Chart frames served from the history cache (hit) or built (miss)",
+    ("result",),
+)
+ETAG_REQUESTS = REGISTRY.counter(
+    "stacktrack_etag_requests_total",
+    "Chart requests answered with 304 Not Modified (hit) or a full response (miss)",
+    ("result",),
+)
+
+
+class StageTimer:
+    """
+    Times the stages of a chart request. The wallet size is only known once the txs are loaded, so the timings are
+    collected and only observed in ``STAGE_SECONDS`` by ``record``.
+    """
+
+    def __init__(self, span: str = None, num_txs: int = None):
+        self.span = span
+        self.num_txs = num_txs
+        self._timings = []
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._timings.append((name, time.perf_counter() - start))
+
+    def record(self):
+        wallet_size = wallet_size_bucket(self.num_txs)
+        for name, seconds in self._timings:
+            STAGE_SECONDS.observe(seconds, stage=name, span=self.span or "custom", wallet_size=wallet_size)
+        self._timings.clear()
+
+
+def _label_values(labelnames: tuple, labels: dict) -> tuple:
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Expected the labels {labelnames}, got {tuple(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _format_labels(labelnames: tuple, values: tuple) -> str:
+    if not labelnames:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labelnames, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
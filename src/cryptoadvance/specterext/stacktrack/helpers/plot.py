@@ -1,128 +1,361 @@
 import datetime as dt
+import functools
+import json
 import logging
+import math
 import sys
+import types
+import uuid
 
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+import plotly.io
 from plotly.offline import plot as plotly_plot
+from plotly.io.json import to_json_plotly
+from plotly.utils import PlotlyJSONEncoder
 
-from . import dtutil
+try:
+    import orjson
+except ImportError:  # optional, it only makes serializing charts faster
+    orjson = None
+
+from . import binning, dtutil
 from .core import Interval, SATS_PER_BTC
+from .tx_series import TxSeries
 
 
 logger = logging.getLogger(__name__)
 
-# This module deals with transaction lists instead of wallets, since we need to build charts for the wallet overview.
+# This module deals with transactions (as a TxSeries) instead of wallets, since we need to build charts for the wallet
+# overview.
+
+SPANS = ("1d", "1w", "1m", "1y", "all")
+
+# Rough length of each interval. Only used to estimate how many bins a time range has with it.
+INTERVAL_SECONDS = {
+    Interval.HOUR: 60 * 60,
+    Interval.DAY: 24 * 60 * 60,
+    Interval.WEEK: 7 * 24 * 60 * 60,
+    Interval.MONTH: 30.44 * 24 * 60 * 60,
+    Interval.QUARTER: 91.31 * 24 * 60 * 60,
+}
+
+# Custom time ranges which need more bins than this even at the coarsest interval are rejected
+MAX_BINS = 1_000
+
+# The columns of the unconfirmed tx overlay, see binning.add_pending
+PENDING_COLUMNS = ("pending_sats", "pending_cusum")
+
+CHART_LAYOUT = dict(
+    title="Balance",
+    title_x=0.5,
+    yaxis_title="BTC",
+    template="plotly_dark",
+    width=800,
+    height=400,
+    paper_bgcolor="#11181F",
+    plot_bgcolor="#11181F",
+    barmode="stack",
+    legend=dict(
+        orientation="h",
+        x=0.5,
+        y=1.02,
+        xanchor="center",
+        yanchor="bottom",
+    ),
+)
+
+
+def build_chart(span: str, series: TxSeries, tz: str = None) -> go.Figure:
+    return build_chart_from_df(build_frame(span, series, tz))
+
+
+def build_frame(span: str, series: TxSeries, tz: str = None) -> pd.DataFrame:
+    return build_window_frame(span_window(span, series, tz), series, tz)
+
+
+def build_window_frame(window: tuple, series: TxSeries, tz: str = None) -> pd.DataFrame:
+    start_dt, end_dt, interval = window
+    return _count_sats(series, start_dt, end_dt, interval, tz)
+
+
+def build_frames(series: TxSeries, spans=SPANS, tz: str = None) -> dict:
+    """
+    Builds the frames of several spans at once. The series is sorted and summed up once, and the balances at the edges
+    of all spans are looked up in one binary search, instead of one pass per span. The frames are the same as those of
+    ``build_frame``.
+
+    :param series: the wallet's txs
+    :param spans: the spans to build, all of them by default
+    :param tz: the timezone of the charts, see ``span_window``
+    :return: a dict of span to pandas DataFrame
+    """
+    return build_window_frames({span: span_window(span, series, tz) for span in spans}, series, tz)
+
+
+def build_window_frames(windows: dict, series: TxSeries, tz: str = None) -> dict:
+    """
+    Like ``build_frames``, for time ranges as returned by ``span_window`` or ``plan_window``.
+
+    :param windows: a dict of any key to a (start_dt, end_dt, interval) tuple
+    :param series: the wallet's txs
+    :param tz: the timezone of the time ranges
+    :return: a dict of the same keys to pandas DataFrames
+    """
+    edge_arrays = [binning.bin_edges(*window, tz) for window in windows.values()]
+    counts = series.bin_sats_many(edge_arrays)
+    return {
+        key: binning.frame_from_bins(edges, bins, prior_count, tz)
+        for key, edges, (bins, prior_count) in zip(windows, edge_arrays, counts)
+    }
+
+
+def check_span(span: str):
+    """Raises a ValueError unless the span is one of SPANS"""
+    if span not in SPANS:
+        raise ValueError(f"Illegal span: {span}")
 
 
-def build_chart(span: str, txs: list) -> go.Figure:
+def span_window(span: str, series: TxSeries, tz: str = None) -> tuple:
+    """
+    Resolves a span like "1d" or "all" to the time range and interval of its chart.
+
+    :param span: one of 1d, 1w, 1m, 1y, all
+    :param series: the wallet's txs
+    :param tz: an IANA timezone name, None for the server's local time. The time range ends with the current hour, day
+        or month in this timezone.
+    :return: a tuple (start_dt, end_dt, interval) of naive datetimes in the timezone tz
+    """
+    check_span(span)
     # https://stackoverflow.com/a/991158
-    return getattr(sys.modules[__name__], f"_build_chart_{span}")(txs)
+    return getattr(sys.modules[__name__], f"_span_window_{span}")(series, tz)
+
+
+def plan_window(start_dt: dt.datetime, end_dt: dt.datetime, points: int, week_start: int = dtutil.MONDAY) -> tuple:
+    """
+    Picks the interval for a custom time range, so that its chart has about the given number of bins. The time range is
+    widened to whole bins of that interval.
+
+    :param start_dt: start of the time range (inclusive)
+    :param end_dt: end of the time range (exclusive)
+    :param points: the number of bins to aim for
+    :param week_start: the first day of a week, in case weekly bins are picked
+    :return: a tuple (start_dt, end_dt, interval) like span_window returns it
+    """
+    if start_dt >= end_dt:
+        raise ValueError("The start of the time range has to be before its end")
+    seconds = (end_dt - start_dt).total_seconds()
+    # Closest on a log scale: 2x too many bins is as far off as 2x too few
+    interval = min(INTERVAL_SECONDS, key=lambda i: abs(math.log(seconds / INTERVAL_SECONDS[i] / points)))
+    if seconds / max(INTERVAL_SECONDS.values()) > MAX_BINS:
+        raise ValueError("The time range is too long")
+    return widen_window(start_dt, end_dt, interval, week_start)
+
+
+def widen_window(
+        start_dt: dt.datetime, end_dt: dt.datetime, interval: Interval, week_start: int = dtutil.MONDAY
+) -> tuple:
+    """
+    Widens a time range to whole bins of the given interval.
+
+    :return: a tuple (start_dt, end_dt, interval) like span_window returns it
+    :raises ValueError: if the widened time range doesn't fit into a datetime, i.e. goes past year 9999
+    """
+    try:
+        start_dt = dtutil.snap_to(start_dt, interval, week_start)
+        if dtutil.snap_to(end_dt, interval, week_start) != end_dt:
+            end_dt = dtutil.next_dt(end_dt, interval, week_start)
+    except OverflowError as e:
+        raise ValueError("The time range is out of range") from e
+    return start_dt, end_dt, interval
 
 
-def _build_chart_1d(txs: list) -> go.Figure:
-    end_dt = dtutil.next_dt(dt.datetime.now(), Interval.HOUR)
+def _span_window_1d(series: TxSeries, tz: str = None) -> tuple:
+    end_dt = dtutil.next_dt(dtutil.now(tz), Interval.HOUR)
     start_dt = end_dt - dt.timedelta(hours=24)
-    return _build_chart(txs, start_dt, end_dt, Interval.HOUR)
+    return start_dt, end_dt, Interval.HOUR
 
 
-def _build_chart_1w(txs: list) -> go.Figure:
-    end_dt = dtutil.next_dt(dt.datetime.now(), Interval.DAY)
+def _span_window_1w(series: TxSeries, tz: str = None) -> tuple:
+    end_dt = dtutil.next_dt(dtutil.now(tz), Interval.DAY)
     start_dt = end_dt - dt.timedelta(days=7)
-    return _build_chart(txs, start_dt, end_dt, Interval.DAY)
+    return start_dt, end_dt, Interval.DAY
 
 
-def _build_chart_1m(txs: list) -> go.Figure:
-    end_dt = dtutil.next_dt(dt.datetime.now(), Interval.DAY)
+def _span_window_1m(series: TxSeries, tz: str = None) -> tuple:
+    end_dt = dtutil.next_dt(dtutil.now(tz), Interval.DAY)
     start_dt = end_dt - dt.timedelta(days=31)
-    return _build_chart(txs, start_dt, end_dt, Interval.DAY)
+    return start_dt, end_dt, Interval.DAY
 
 
-def _build_chart_1y(txs: list) -> go.Figure:
-    end_dt = dtutil.next_dt(dt.datetime.now(), Interval.MONTH)
+def _span_window_1y(series: TxSeries, tz: str = None) -> tuple:
+    end_dt = dtutil.next_dt(dtutil.now(tz), Interval.MONTH)
     start_dt = dt.datetime(end_dt.year - 1, end_dt.month, 1)
-    return _build_chart(txs, start_dt, end_dt, Interval.MONTH)
+    return start_dt, end_dt, Interval.MONTH
 
 
-def _build_chart_all(txs: list) -> go.Figure:
-    end_dt = dtutil.next_dt(dt.datetime.now(), Interval.MONTH)
+def _span_window_all(series: TxSeries, tz: str = None) -> tuple:
+    end_dt = dtutil.next_dt(dtutil.now(tz), Interval.MONTH)
     # TODO Check on the difference between "time" and "blocktime".
     #  Not sure which I'm supposed to use here.
-    temp_dt = dt.datetime.fromtimestamp(txs[-1]["time"]) if txs else dt.datetime.now()
+    temp_dt = dtutil.from_epoch(series.first_time, tz) if len(series) else dtutil.now(tz)
     start_dt = dtutil.snap_to(temp_dt, Interval.MONTH)
     if end_dt - start_dt < dt.timedelta(days=365):
-        return _build_chart_1y(txs)
+        return _span_window_1y(series, tz)
     else:
-        return _build_chart(txs, start_dt, end_dt, Interval.MONTH)
-
-
-def _build_chart(txs: list, start_dt: dt.datetime, end_dt: dt.datetime, interval: Interval):
-    df: pd.DataFrame = _count_sats(txs, start_dt, end_dt, interval)
-    return _build_chart_from_df(df)
+        return start_dt, end_dt, Interval.MONTH
 
 
 def _count_sats(
-        txs: list,
+        series: TxSeries,
         start_dt: dt.datetime,
         end_dt: dt.datetime,
-        interval: Interval
+        interval: Interval,
+        tz: str = None
 ) -> pd.DataFrame:
 
     """
     Counts the wallet's satoshis for the given time range, binned by the given interval. The returned DataFrame has
     three columns:
 
-    - timestamp: Timestamp in epoch seconds.
+    - timestamp: Start of the bin, as a naive datetime in the timezone tz.
     - sats: Satoshi count for a given interval. Can be negative if there was a net outflow.
     - sats_cusum: Satoshi cumulative sum. Again this can be negative if there was a net outflow.
 
     Note that satoshis for transactions before the start time are rolled into the satoshi cumulative sum.
 
-    :param txs: transaction list
+    :param series: the wallet's txs
     :param start_dt: start of the time range (inclusive)
     :param end_dt: end of the time range (exclusive)
     :param interval: increment interval
+    :param tz: an IANA timezone name for the time range and the bins, None for the server's local time
     :return: a pandas DataFrame as described above
     """
 
-    timestamps = []
-    sat_bins = {}
-    prior_count = 0
-
-    # Initialize
-    curr_dt = start_dt
-    while curr_dt < end_dt:
-        timestamps.append(pd.Timestamp(curr_dt.timestamp(), unit="s"))
-        sat_bins[curr_dt] = 0
-        curr_dt = dtutil.next_dt(curr_dt, interval)
-
-    # Count
-    for tx in txs:
-        # TODO Check on the difference between "time" and "blocktime".
-        #  Not sure which I'm supposed to use here.
-        tx_dt = dt.datetime.fromtimestamp(tx["time"])
-        amount = round(tx.flow_amount * SATS_PER_BTC)
-        if tx_dt < timestamps[0]:
-            prior_count += amount
-        else:
-            bin_dt = dtutil.snap_to(tx_dt, interval)
-            sat_bins[bin_dt] += amount
-
-    sats = [item[1] for item in sorted(sat_bins.items())]
-
-    df = pd.DataFrame({"timestamp": timestamps, "sats": sats})
-    df["sats_cusum"] = df["sats"].cumsum() + prior_count
+    edges = binning.bin_edges(start_dt, end_dt, interval, tz)
+    bins, prior_count = series.bin_sats(edges)
+    return binning.frame_from_bins(edges, bins, prior_count, tz)
+
+
+def build_chart_from_df(df: pd.DataFrame) -> str:
+    """
+    Renders the chart of a DataFrame as a div for the chart template. The output is the same as that of
+    ``figure_html(build_figure(df))``, without building a ``go.Figure`` though: plotly's property validation took most
+    of the time for small wallets. The traces and the layout come from ``_chart_template`` and only the x and y values
+    are filled in.
+
+    plotly.js 2.14, which plotly.py 5.10 ships, doesn't read typed arrays, so the values are plain JSON lists.
+    """
+    pending = PENDING_COLUMNS[0] in df.columns
+    traces, layout_json, config_json = _chart_template(pending)
+    sats = df["sats"].to_numpy()
+    x = np.datetime_as_string(df["timestamp"].to_numpy().astype("datetime64[s]")).tolist()
+    ys = (
+        np.maximum(sats, 0) / SATS_PER_BTC,
+        np.minimum(sats, 0) / SATS_PER_BTC,
+        df["sats_cusum"].to_numpy() / SATS_PER_BTC,
+    )
+    if pending:
+        ys += tuple(df[column].to_numpy() / SATS_PER_BTC for column in PENDING_COLUMNS)
+    data = [dict(trace, x=x, y=y.tolist()) for trace, y in zip(traces, ys)]
+    return _chart_div().format(id=uuid.uuid4(), data=_dumps(data), layout=layout_json, config=config_json)
 
-    return df
 
+@functools.lru_cache(maxsize=None)
+def _chart_template(pending: bool = False) -> tuple:
+    """
+    The validated traces (without x and y) and the serialized layout and config of ``build_figure``'s charts, with or
+    without the pending overlay. They're the same for every chart, so they're only built once per process.
+    """
+    columns = ("timestamp", "sats", "sats_cusum") + (PENDING_COLUMNS if pending else ())
+    fig = build_figure(pd.DataFrame({column: [] for column in columns}))
+    traces = tuple(types.MappingProxyType(trace.to_plotly_json()) for trace in fig.data)
+    # Round-tripped like plotly_plot does it, which orders the layout's properties differently
+    layout = go.Figure(fig.to_dict()).to_dict()["layout"]
+    return traces, to_json_plotly(layout), json.dumps({"responsive": True})
+
+
+def _dumps(value) -> str:
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, separators=(",", ":"))
+
+
+@functools.lru_cache(maxsize=None)
+def _chart_div() -> str:
+    """
+    The markup which ``figure_html`` puts around a chart, as a format string with the fields id, data, layout and
+    config. It's rendered once by ``plotly.io.to_html`` from placeholders, so it's whatever the installed plotly
+    renders.
+    """
+    layout = {"width": CHART_LAYOUT["width"], "height": CHART_LAYOUT["height"]}
+    placeholders = {
+        "id": "stacktrack-chart-id",
+        "data": to_json_plotly("stacktrack-chart-data"),
+        "layout": to_json_plotly(layout),
+        # plotly.io.to_html() makes charts responsive by default
+        "config": json.dumps({"responsive": True}),
+    }
+    markup = plotly.io.to_html(
+        {"data": "stacktrack-chart-data", "layout": layout},
+        full_html=False,
+        include_plotlyjs=False,
+        div_id=placeholders["id"],
+        validate=False,
+    )
+    markup = _escape_braces(markup)
+    for field, placeholder in placeholders.items():
+        placeholder = _escape_braces(placeholder)
+        if placeholder not in markup:
+            raise ValueError(f"plotly's chart markup has no {field}: {markup}")
+        markup = markup.replace(placeholder, f"{{{field}}}")
+    return markup
 
-# TODO
-# - Use UTC
-# - Sunday vs Monday start
-def _build_chart_from_df(df: pd.DataFrame) -> go.Figure:
-    df["in"] = np.maximum(df["sats"], 0)
-    df["out"] = np.minimum(df["sats"], 0)
+
+def _escape_braces(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def chart_arrays(df: pd.DataFrame) -> tuple:
+    """
+    The compact form of a chart DataFrame which ``chart_html_from_arrays`` renders, e.g. in another process: the start
+    (in wall clock seconds, see ``series_from_df``) and satoshis per bin as int64 arrays, plus the satoshis before the
+    first bin. Then the same for the pending overlay, None and 0 if there is none.
+    """
+    sats = df["sats"].to_numpy(dtype=np.int64)
+    prior_count = int(df["sats_cusum"].iloc[0] - sats[0]) if len(df) else 0
+    pending_sats, pending_prior_count = None, 0
+    if PENDING_COLUMNS[0] in df.columns:
+        pending_sats = df["pending_sats"].to_numpy(dtype=np.int64)
+        if len(df):
+            pending_prior_count = int(df["pending_cusum"].iloc[0] - df["sats_cusum"].iloc[0] - pending_sats[0])
+    timestamps = df["timestamp"].to_numpy().astype("datetime64[s]").astype(np.int64)
+    return timestamps, sats, prior_count, pending_sats, pending_prior_count
+
+
+def chart_html_from_arrays(
+        timestamps: np.ndarray,
+        sats: np.ndarray,
+        prior_count: int,
+        pending_sats: np.ndarray = None,
+        pending_prior_count: int = 0
+) -> str:
+    """Renders the chart of the arrays returned by ``chart_arrays``, like ``build_chart_from_df`` does"""
+    df = pd.DataFrame({"timestamp": pd.to_datetime(timestamps, unit="s"), "sats": sats})
+    df["sats_cusum"] = df["sats"].cumsum() + prior_count
+    if pending_sats is not None:
+        df["pending_sats"] = pending_sats
+        df["pending_cusum"] = df["sats_cusum"] + np.cumsum(pending_sats) + pending_prior_count
+    return build_chart_from_df(df)
+
+
+def build_figure(df: pd.DataFrame) -> go.Figure:
+    """
+    The chart as a validated plotly figure. Rendering it with ``figure_html`` is the slow path, which
+    ``build_chart_from_df`` avoids.
+    """
+    df = df.assign(**{"in": np.maximum(df["sats"], 0), "out": np.minimum(df["sats"], 0)})
 
     fig = go.Figure()
     fig.add_trace(go.Bar(
@@ -148,22 +381,59 @@ def _build_chart_from_df(df: pd.DataFrame) -> go.Figure:
         marker={"color": "Gold"},
         legendrank=1
     ))
-    fig.update_layout(
-        title="Balance",
-        title_x=0.5,
-        yaxis_title="BTC",
-        template="plotly_dark",
-        width=800,
-        height=400,
-        paper_bgcolor="#11181F",
-        plot_bgcolor="#11181F",
-        barmode="stack",
-        legend=dict(
-            orientation="h",
-            x=0.5,
-            y=1.02,
-            xanchor="center",
-            yanchor="bottom",
-        ),
-    )
-    return plotly_plot(fig, output_type="div")
+    if PENDING_COLUMNS[0] in df.columns:
+        # Unconfirmed txs, stacked onto the confirmed bars. See binning.add_pending.
+        fig.add_trace(go.Bar(
+            x=df["timestamp"],
+            y=df["pending_sats"] / SATS_PER_BTC,
+            name="Pending",
+            marker={"color": "Orange"},
+            opacity=0.6,
+            legendrank=4
+        ))
+        fig.add_trace(go.Scatter(
+            x=df["timestamp"],
+            y=df["pending_cusum"] / SATS_PER_BTC,
+            name="Cumulative incl. Pending",
+            mode="lines",
+            line_shape="hv",
+            line_dash="dot",
+            marker={"color": "Orange"},
+            legendrank=5
+        ))
+    fig.update_layout(**CHART_LAYOUT)
+    return fig
+
+
+def figure_html(fig: go.Figure) -> str:
+    # plotly.js is loaded once by the chart template, see static_plotly_js() in controller.py
+    return plotly_plot(fig, output_type="div", include_plotlyjs=False)
+
+
+@functools.lru_cache(maxsize=None)
+def chart_layout_json() -> str:
+    """
+    The chart layout as plotly.js JSON, for rendering charts in the browser. Named templates like "plotly_dark" only
+    exist in plotly.py, so they get expanded here. This is the same for every chart, so it's only built once.
+    """
+    layout = go.Layout(**CHART_LAYOUT, xaxis_type="date")
+    return json.dumps(layout.to_plotly_json(), cls=PlotlyJSONEncoder)
+
+
+def series_from_df(df: pd.DataFrame) -> dict:
+    """
+    Converts a chart DataFrame into the compact form served to the browser: the start of each bin plus its in, out and
+    cumulative amounts in satoshis, one list entry per bin. The starts are the wall clock times of the chart's timezone
+    in epoch seconds, since plotly shows epoch values on a date axis as UTC.
+    """
+    sats = df["sats"].to_numpy()
+    series = {
+        "timestamp": df["timestamp"].to_numpy().astype("datetime64[s]").astype(np.int64).tolist(),
+        "in": np.maximum(sats, 0).tolist(),
+        "out": np.minimum(sats, 0).tolist(),
+        "cumulative": df["sats_cusum"].tolist(),
+    }
+    if PENDING_COLUMNS[0] in df.columns:
+        series["pending"] = df["pending_sats"].tolist()
+        series["pending_cumulative"] = df["pending_cusum"].tolist()
+    return series
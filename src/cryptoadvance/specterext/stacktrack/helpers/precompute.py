@@ -0,0 +1,57 @@
+import concurrent.futures
+import logging
+import threading
+import time
+
+from .cache import HistoryCache
+
+
+logger = logging.getLogger(__name__)
+
+
+class SpanPrecomputer:
+    """
+    Precomputes the frames of all chart spans in the background, so switching spans on a chart only looks up the
+    ``HistoryCache`` instead of binning the txs again. A wallet's change is paid for once, not once per click.
+
+    Wallets are queued at most once: submitting a wallet which is still queued only replaces the txs it'll be
+    precomputed with, so a burst of requests for a wallet ends up as a single precompute of its latest txs.
+    """
+
+    def __init__(self, history_cache: HistoryCache):
+        self.history_cache = history_cache
+        # A single worker, the frames are built under the cache's lock anyway
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="stacktrack_precompute"
+        )
+        self._queued = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, txs: list, tip_height, tz: str = None):
+        """
+        Queues the precompute of all spans of a wallet, unless it's queued already.
+
+        :param key: identifies the wallet (or combination of wallets) the txs belong to
+        :param txs: transaction list, sorted newest first like ``Wallet.txlist()``
+        :param tip_height: current block height
+        :param tz: the timezone of the charts
+        """
+        with self._lock:
+            queued = key in self._queued
+            self._queued[key] = (txs, tip_height, tz)
+            if not queued:
+                self._executor.submit(self._precompute, key)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def _precompute(self, key: str):
+        with self._lock:
+            txs, tip_height, tz = self._queued.pop(key)
+        start = time.monotonic()
+        try:
+            self.history_cache.precompute(key, txs, tip_height, tz=tz)
+        except Exception:
+            logger.exception(f"Precomputing the charts of {key} failed")
+            return
+        logger.debug(f"Precomputed the charts of {key} in {time.monotonic() - start:.3f}s")
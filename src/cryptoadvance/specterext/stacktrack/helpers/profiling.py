@@ -0,0 +1,44 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+
+
+# How many functions a report lists
+REPORT_LINES = 50
+
+# Only one request is profiled at a time. Profiles of concurrent requests would only show the waiting of the other one.
+_lock = threading.Lock()
+
+
+def profile_call(func, *args, **kwargs) -> tuple:
+    """
+    Runs func under cProfile.
+
+    :return: a tuple (result, report). The report lists the hot functions, sorted by cumulative time.
+    """
+    profiler = cProfile.Profile()
+    with _lock:
+        start = time.perf_counter()
+        result = profiler.runcall(func, *args, **kwargs)
+        seconds = time.perf_counter() - start
+    out = io.StringIO()
+    out.write(f"Total: {seconds:.3f}s\n")
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE, pstats.SortKey.TIME).print_stats(REPORT_LINES)
+    return result, out.getvalue()
+
+
+def store_report(folder: str, name: str, report: str) -> str:
+    """
+    Writes a report to the folder, named after the time and the given name.
+
+    :return: the path of the report
+    """
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}.txt")
+    with open(path, "w") as f:
+        f.write(report)
+    return path
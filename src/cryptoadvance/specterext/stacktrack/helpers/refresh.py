@@ -0,0 +1,64 @@
+import concurrent.futures
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class WalletRefresher:
+    """
+    Refreshes wallet balances and UTXOs on a bounded thread pool. Each refresh is a couple of RPC round trips to the
+    node, so running them side by side lets the wallets overview wait for the slowest wallet instead of the sum of all.
+
+    A refresh which takes longer than the timeout keeps running in the background, and a wallet is never refreshed
+    twice at the same time: later calls wait for the refresh which is already running.
+    """
+
+    def __init__(self, max_workers: int, timeout: float):
+        self.timeout = timeout
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="stacktrack_refresh"
+        )
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, wallets: list) -> list:
+        """
+        Runs ``update_balance()`` and ``check_utxo()`` for all wallets and waits at most ``timeout`` seconds for them.
+
+        :param wallets: the wallets to refresh
+        :return: the wallets which couldn't be refreshed in time (or at all), so their data is stale
+        """
+        with self._lock:
+            futures = {wallet.fullpath: self._submit(wallet) for wallet in wallets}
+
+        done, _ = concurrent.futures.wait(futures.values(), timeout=self.timeout)
+        stale = []
+        for wallet in wallets:
+            future = futures[wallet.fullpath]
+            if future not in done:
+                logger.warning(f"Refreshing wallet {wallet.alias} takes longer than {self.timeout}s, showing stale data")
+                stale.append(wallet)
+            elif future.exception() is not None:
+                logger.error(f"Refreshing wallet {wallet.alias} failed", exc_info=future.exception())
+                stale.append(wallet)
+        return stale
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def _submit(self, wallet) -> concurrent.futures.Future:
+        future = self._running.get(wallet.fullpath)
+        if future is None or future.done():
+            future = self._executor.submit(self._refresh_wallet, wallet)
+            self._running[wallet.fullpath] = future
+        return future
+
+    @staticmethod
+    def _refresh_wallet(wallet):
+        start = time.monotonic()
+        wallet.update_balance()
+        wallet.check_utxo()
+        logger.debug(f"Refreshed wallet {wallet.alias} in {time.monotonic() - start:.3f}s")
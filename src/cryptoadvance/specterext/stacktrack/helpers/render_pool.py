@@ -0,0 +1,88 @@
+import concurrent.futures
+import logging
+import multiprocessing
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+RENDER_REQUESTS = metrics.REGISTRY.counter(
+    "stacktrack_render_requests_total",
+    "Charts rendered by the render pool (pool) or in the web process (fallback)",
+    ("result",),
+)
+
+
+class RenderPool:
+    """
+    Renders charts in a few worker processes. Building a plotly figure and serializing it is CPU bound Python which
+    holds the GIL, so rendering a large chart in the web process stalls all of its other requests. Threads waiting
+    for a worker don't hold it.
+
+    At most ``max_pending`` charts are sent to the pool at a time, further ones are rendered in the web process
+    instead of queuing up. The same goes for a chart the pool doesn't render within ``timeout`` seconds, or at all
+    because a worker died.
+
+    The workers are started with "spawn": forking a web process with running threads could copy held locks.
+    """
+
+    def __init__(self, processes: int, max_pending: int, timeout: float):
+        self.processes = processes
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def render(self, func, *args):
+        """
+        Returns func(*args), computed by a worker if one is available. func and its arguments have to be picklable,
+        so it's best to pass plain arrays, see ``plot.chart_arrays``.
+        """
+        if not self._slots.acquire(blocking=False):
+            logger.debug("Render pool is busy, rendering in process")
+            return self._render_in_process(func, *args)
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception as e:
+            self._slots.release()
+            logger.warning(f"Couldn't submit to the render pool, rendering in process: {e}")
+            self._reset_executor()
+            return self._render_in_process(func, *args)
+        # The slot stays taken until the worker is done, even if we stop waiting for it
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            result = future.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            logger.warning(f"The render pool took longer than {self.timeout}s, rendering in process")
+            return self._render_in_process(func, *args)
+        except BrokenProcessPool as e:
+            logger.warning(f"The render pool broke, rendering in process: {e}")
+            self._reset_executor()
+            return self._render_in_process(func, *args)
+        RENDER_REQUESTS.inc(result="pool")
+        return result
+
+    def shutdown(self):
+        self._reset_executor()
+
+    @staticmethod
+    def _render_in_process(func, *args):
+        RENDER_REQUESTS.inc(result="fallback")
+        return func(*args)
+
+    def _get_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from . import binning, dtutil
+from .core import Interval
+from .tx_series import TxSeries
+
+
+logger = logging.getLogger(__name__)
+
+# Resolutions kept per wallet. Together they cover every span in plot.py.
+ROLLUP_INTERVALS = (Interval.HOUR, Interval.DAY, Interval.MONTH)
+
+
+class Rollup:
+    """
+    A wallet's complete balance history, binned at every resolution in ``ROLLUP_INTERVALS``. The bins of a resolution
+    are dense: they run from the bin of the oldest tx up to the bin after the one holding "now", so any chart window
+    with that interval is a lookup into them. The bins start at full hours, days and months of the timezone ``tz``, so
+    only charts in that timezone can use them. ``zone`` is what tz resolved to when the rollup was computed (see
+    ``dtutil.resolve_timezone``), which tells whether a rollup in the server's local time is still in it.
+    """
+
+    def __init__(self, fingerprint: tuple, edges: dict, bins: dict, tz: str = None, zone: str = None):
+        self.fingerprint = fingerprint
+        self.tz = tz
+        self.zone = zone
+        self.edges = edges
+        self.bins = bins
+        self.cusums = {interval: np.cumsum(bins[interval]) for interval in bins}
+
+    def matches(self, fingerprint: tuple) -> bool:
+        # The binned history doesn't depend on the tip height, so a new block without new txs keeps the rollup valid.
+        return self.fingerprint[:2] == fingerprint[:2]
+
+    @classmethod
+    def from_series(cls, series: TxSeries, fingerprint: tuple, tz: str = None) -> "Rollup":
+        now = dtutil.now(tz)
+        first_dt = dtutil.from_epoch(series.first_time, tz) if len(series) else now
+        edges = {}
+        bins = {}
+        for interval in ROLLUP_INTERVALS:
+            start_dt = dtutil.snap_to(first_dt, interval)
+            end_dt = dtutil.next_dt(now, interval)
+            edges[interval] = binning.bin_edges(start_dt, end_dt, interval, tz)
+            bins[interval], _ = series.bin_sats(edges[interval])
+        return cls(fingerprint, edges, bins, tz, dtutil.resolve_timezone(tz))
+
+    def window(self, edges: np.ndarray, interval: Interval) -> tuple:
+        """
+        Looks up the bins of a chart window.
+
+        :param edges: the window's bin edges, as returned by ``binning.bin_edges``
+        :param interval: the window's interval, must be one of ``ROLLUP_INTERVALS``
+        :return: a tuple (bins, prior_count) as ``binning.bin_sats`` would return it, or None if the window's bins don't
+            line up with the rollup's, e.g. as they're in another timezone
+        """
+        rollup_edges = self.edges[interval]
+        rollup_bins = self.bins[interval]
+        # A window starting after the last rollup bin gets all of the rollup as its prior count
+        start = min(np.searchsorted(rollup_edges, edges[0]), len(rollup_bins))
+        prior_count = int(self.cusums[interval][start - 1]) if start > 0 else 0
+
+        # Window bins before the oldest tx or after the rollup was computed have no txs, so they stay 0.
+        idx = np.searchsorted(rollup_edges, edges[:-1])
+        found = idx < len(rollup_bins)
+        found[found] = rollup_edges[idx[found]] == edges[:-1][found]
+        # Within the rollup every window bin must be one of its bins, otherwise the caller has to bin the txs itself
+        inside = (edges[:-1] >= rollup_edges[0]) & (edges[:-1] < rollup_edges[-1])
+        if (inside & ~found).any():
+            return None
+        bins = np.zeros(len(edges) - 1, dtype=np.int64)
+        bins[found] = rollup_bins[idx[found]]
+        return bins, prior_count
+
+    def save(self, path: str):
+        arrays = {
+            "fingerprint": np.array(json.dumps(self.fingerprint)),
+            "timezone": np.array(json.dumps(self.tz)),
+            "zone": np.array(json.dumps(self.zone)),
+        }
+        for interval in ROLLUP_INTERVALS:
+            arrays[f"edges_{interval.name}"] = self.edges[interval]
+            arrays[f"bins_{interval.name}"] = self.bins[interval]
+        # Write to a temp file first so a concurrent reader never sees a half-written rollup.
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "Rollup":
+        with np.load(path, allow_pickle=False) as data:
+            fingerprint = tuple(json.loads(str(data["fingerprint"])))
+            # Rollups saved before they had a timezone were computed in the server's local time
+            tz = json.loads(str(data["timezone"])) if "timezone" in data.files else None
+            # Older rollups didn't record which local timezone they were computed in, so they're rebuilt
+            zone = json.loads(str(data["zone"])) if "zone" in data.files else None
+            edges = {interval: data[f"edges_{interval.name}"] for interval in ROLLUP_INTERVALS}
+            bins = {interval: data[f"bins_{interval.name}"] for interval in ROLLUP_INTERVALS}
+        return cls(fingerprint, edges, bins, tz, zone)
+
+
+class RollupStore:
+    """
+    Keeps a ``Rollup`` per wallet and timezone, in memory and persisted as .npz files in the given folder. The rollups
+    are refreshed in the timezone of each wallet's owner by a background job (see ``StacktrackService.update_rollups``)
+    so chart requests only need to read them.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._rollups = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, fingerprint: tuple, tz: str = None):
+        """
+        Returns the rollup of a wallet if it's up to date with the given fingerprint, otherwise None.
+
+        :param key: identifies the wallet
+        :param fingerprint: the wallet's current ``cache.tx_fingerprint``
+        :param tz: the timezone the rollup is binned in, None for the server's local time
+        """
+        with self._lock:
+            rollup = self._rollups.get((key, tz))
+            if rollup is None:
+                rollup = self._load(key, tz)
+            # Rollups saved before they were kept per timezone may be in another one, and a rollup in the server's
+            # local time is stale once the server moved to another timezone. update() rebuilds both.
+            if rollup is None or rollup.tz != tz or rollup.zone != dtutil.resolve_timezone(tz):
+                return None
+            return rollup if rollup.matches(fingerprint) else None
+
+    def update(self, key: str, txs: list, fingerprint: tuple, tz: str = None) -> Rollup:
+        """
+        Recomputes the rollup of a wallet unless it's already up to date with the given fingerprint.
+
+        :param key: identifies the wallet
+        :param txs: transaction list, sorted newest first like ``Wallet.txlist()``
+        :param fingerprint: the wallet's current ``cache.tx_fingerprint``
+        :param tz: the timezone to bin the rollup in
+        """
+        rollup = self.get(key, fingerprint, tz)
+        if rollup is not None:
+            return rollup
+        rollup = Rollup.from_series(TxSeries.from_txs(txs), fingerprint, tz)
+        os.makedirs(self.folder, exist_ok=True)
+        rollup.save(self._path(key, tz))
+        with self._lock:
+            self._rollups[(key, tz)] = rollup
+        return rollup
+
+    def _load(self, key: str, tz: str):
+        path = self._path(key, tz)
+        if not os.path.isfile(path):
+            return None
+        try:
+            rollup = Rollup.load(path)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable rollup {path}: {e}")
+            return None
+        self._rollups[(key, tz)] = rollup
+        return rollup
+
+    def _path(self, key: str, tz: str) -> str:
+        # Keys are wallet paths, so hash them into a flat, filesystem-safe name. Rollups in the server's local time keep
+        # the name they had before there was a rollup per timezone.
+        name = key if tz is None else f"{key}@{tz}"
+        return os.path.join(self.folder, hashlib.sha256(name.encode()).hexdigest()[:32] + ".npz")
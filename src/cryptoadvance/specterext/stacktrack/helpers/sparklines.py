@@ -0,0 +1,91 @@
+import datetime as dt
+import threading
+
+import numpy as np
+
+from . import binning, dtutil
+from .core import Interval
+
+
+# Sparklines show the balance at the end of each of the last WEEKS weeks
+WEEKS = 52
+WIDTH = 120
+HEIGHT = 24
+# Keeps the line off the edges of the SVG, so it isn't clipped
+PADDING = 1.5
+
+
+def sparkline_window(now: dt.datetime = None, tz: str = None) -> tuple:
+    """The time range of the sparklines, as (start_dt, end_dt, interval) like ``plot.span_window`` returns it"""
+    end_dt = dtutil.next_dt(now or dtutil.now(tz), Interval.WEEK)
+    return end_dt - dt.timedelta(weeks=WEEKS), end_dt, Interval.WEEK
+
+
+def balances(series_list: list, edges: np.ndarray) -> np.ndarray:
+    """
+    Computes the balance of every series at the end of every bin. Each series is binned from its cumulative sums (see
+    ``binning.bin_sorted_sats``), so this doesn't go over the txs.
+
+    :param series_list: a TxSeries per wallet
+    :param edges: bin edges as returned by ``binning.bin_edges``
+    :return: an int64 array with a row per series and a column per bin
+    """
+    result = np.zeros((len(series_list), len(edges) - 1), dtype=np.int64)
+    for row, series in zip(result, series_list):
+        bins, prior_count = series.bin_sats(edges)
+        np.cumsum(bins, out=row)
+        row += prior_count
+    return result
+
+
+def sparkline_svg(values: np.ndarray) -> str:
+    """Draws the values as a line in a small inline SVG, scaled to fill its height"""
+    low, high = (int(values.min()), int(values.max())) if len(values) else (0, 0)
+    if len(values) < 2:
+        values = np.repeat(values if len(values) else np.zeros(1), 2)
+    xs = np.linspace(PADDING, WIDTH - PADDING, len(values))
+    if high == low:
+        ys = np.full(len(values), HEIGHT / 2)
+    else:
+        # SVG y coordinates grow downwards
+        ys = HEIGHT - PADDING - (values - low) / (high - low) * (HEIGHT - 2 * PADDING)
+    points = " ".join(f"{x:.1f},{y:.1f}" for x, y in zip(xs, ys))
+    return (
+        f'<svg class="stacktrack_sparkline" width="{WIDTH}" height="{HEIGHT}" viewBox="0 0 {WIDTH} {HEIGHT}" '
+        f'xmlns="http://www.w3.org/2000/svg"><polyline points="{points}" fill="none" stroke="Gold" '
+        f'stroke-width="1.5" stroke-linejoin="round"/></svg>'
+    )
+
+
+class SparklineCache:
+    """
+    Keeps the sparkline SVG of every wallet until its txs change or the sparkline window moves on. The stale ones are
+    redrawn together, from the wallets' cached series.
+    """
+
+    def __init__(self):
+        self._svgs = {}
+        self._lock = threading.Lock()
+
+    def get(self, wallets: list, window: tuple = None, tz: str = None) -> dict:
+        """
+        Returns the sparklines of the given wallets.
+
+        :param wallets: a (key, fingerprint, load_series) tuple per wallet. load_series returns the wallet's TxSeries,
+            it's only called if the wallet's sparkline has to be redrawn.
+        :param window: the time range to draw, ``sparkline_window()`` by default
+        :param tz: the timezone of the time range
+        :return: a dict of key to SVG
+        """
+        window = window or sparkline_window(tz=tz)
+        with self._lock:
+            stale = [
+                (key, fingerprint, load_series) for key, fingerprint, load_series in wallets
+                if self._svgs.get(key, (None, None, None))[:2] != (fingerprint, (window, tz))
+            ]
+            if stale:
+                edges = binning.bin_edges(*window, tz)
+                series_list = [load_series() for _, _, load_series in stale]
+                for (key, fingerprint, _), values in zip(stale, balances(series_list, edges)):
+                    self._svgs[key] = (fingerprint, (window, tz), sparkline_svg(values))
+            return {key: self._svgs[key][2] for key, _, _ in wallets}
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from .tx_series import TxSeries
+
+
+logger = logging.getLogger(__name__)
+
+# One raw int64 file per column. sats_cusum lets charts be binned without reading the whole history, see
+# binning.bin_sorted_sats.
+COLUMNS = ("timestamps", "sats", "blockheights", "sats_cusum")
+
+
+class TxStore:
+    """
+    A columnar on-disk copy of each wallet's confirmed txs, read through memory maps. For wallets with hundreds of
+    thousands of txs, the chart pipeline then works on pages the OS can share and evict, instead of arrays on the heap
+    of every worker.
+
+    Each wallet gets a folder with one raw int64 file per column (oldest tx first) and a meta.json which says how many
+    rows are valid and which tx was appended last. Confirmed txs don't change, so a sync only appends the new ones.
+    Anything else (a reorg, a tx older than the stored ones) rewrites the wallet's files. Unconfirmed txs are never
+    stored, they're added in memory by ``load``.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._lock = threading.Lock()
+
+    def load(self, key: str, txs: list) -> TxSeries:
+        """
+        Syncs the store with the wallet's txs and returns them as a series backed by the memory mapped columns.
+
+        :param key: identifies the wallet
+        :param txs: transaction list, sorted newest first like ``Wallet.txlist()``
+        :return: all of the txs. If some are unconfirmed, the series is a copy on the heap.
+        """
+        series = self.sync(key, txs)
+        unconfirmed = [tx for tx in txs if not tx["blockheight"]]
+        if unconfirmed:
+            series = series.concat(TxSeries.from_txs(unconfirmed))
+        return series
+
+    def sync(self, key: str, txs: list) -> TxSeries:
+        """
+        Appends the wallet's new confirmed txs, or rewrites its files if they can't simply be appended.
+
+        :param key: identifies the wallet
+        :param txs: transaction list, sorted newest first like ``Wallet.txlist()``
+        :return: the stored (confirmed) txs, memory mapped
+        """
+        confirmed = [tx for tx in txs if tx["blockheight"]]
+        with self._lock:
+            folder = self._wallet_folder(key)
+            meta = self._read_meta(folder)
+            new_txs = self._find_new_txs(meta, confirmed) if meta is not None else None
+            if new_txs is None:
+                logger.debug(f"Writing {len(confirmed)} txs of {key} to the tx store")
+                meta = self._write(folder, confirmed)
+            elif new_txs:
+                logger.debug(f"Appending {len(new_txs)} txs of {key} to the tx store")
+                meta = self._append(folder, meta, new_txs)
+            return self._map(folder, meta["count"])
+
+    @staticmethod
+    def _find_new_txs(meta: dict, confirmed: list):
+        """Returns the txs which come after the stored ones, or None if the files need to be rewritten"""
+        num_new = len(confirmed) - meta["count"]
+        if num_new < 0:
+            return None
+        # The stored txs have to be the older ones: their newest tx sits right after the new txs.
+        last_txid = confirmed[num_new]["txid"] if num_new < len(confirmed) else None
+        if last_txid != meta["last_txid"]:
+            return None
+        new_txs = confirmed[:num_new]
+        if new_txs and meta["last_time"] is not None and new_txs[-1]["time"] < meta["last_time"]:
+            return None
+        # Another leg of a stored tx changes its netted flow (see txs.net_transfers). That's usually the newest one, but
+        # txs of the same block share their time, so any of the stored txs is checked.
+        stored_txids = {tx["txid"] for tx in confirmed[num_new:]}
+        if any(tx["txid"] in stored_txids for tx in new_txs):
+            return None
+        return new_txs
+
+    def _write(self, folder: str, confirmed: list) -> dict:
+        os.makedirs(folder, exist_ok=True)
+        series = TxSeries.from_txs(confirmed)
+        # Replace the files instead of overwriting them, series handed out earlier keep mapping the old ones.
+        for column, values in self._columns(series).items():
+            path = os.path.join(folder, f"{column}.i8")
+            values.tofile(f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+        return self._write_meta(folder, confirmed, series)
+
+    def _append(self, folder: str, meta: dict, new_txs: list) -> dict:
+        series = TxSeries.from_txs(new_txs)
+        columns = self._columns(series)
+        columns["sats_cusum"] += meta["balance"]
+        for column, values in columns.items():
+            with open(os.path.join(folder, f"{column}.i8"), "r+b") as f:
+                # Drop whatever an interrupted append left behind the valid rows
+                f.truncate(meta["count"] * 8)
+                f.seek(0, os.SEEK_END)
+                values.tofile(f)
+        return self._write_meta(folder, new_txs, series, meta)
+
+    @staticmethod
+    def _columns(series: TxSeries) -> dict:
+        return {
+            "timestamps": series.timestamps,
+            "sats": series.sats,
+            "blockheights": series.blockheights,
+            "sats_cusum": series.sats_cusum().copy(),
+        }
+
+    @staticmethod
+    def _map(folder: str, count: int) -> TxSeries:
+        if count == 0:
+            return TxSeries.empty()
+        arrays = {
+            column: np.memmap(os.path.join(folder, f"{column}.i8"), dtype=np.int64, mode="r", shape=(count,))
+            for column in COLUMNS
+        }
+        return TxSeries(arrays["timestamps"], arrays["sats"], arrays["blockheights"], arrays["sats_cusum"])
+
+    @staticmethod
+    def _read_meta(folder: str):
+        path = os.path.join(folder, "meta.json")
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable tx store {folder}: {e}")
+            return None
+
+    @staticmethod
+    def _write_meta(folder: str, new_txs: list, series: TxSeries, meta: dict = None) -> dict:
+        """Commits rows written to the column files. Until then, readers don't look at them."""
+        meta = dict(meta or {"count": 0, "balance": 0, "last_txid": None, "last_time": None})
+        meta["count"] += len(new_txs)
+        meta["balance"] += int(series.sats.sum())
+        if new_txs:
+            meta["last_txid"] = new_txs[0]["txid"]
+            meta["last_time"] = new_txs[0]["time"]
+        path = os.path.join(folder, "meta.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(f"{path}.tmp", path)
+        return meta
+
+    def _wallet_folder(self, key: str) -> str:
+        # Keys are wallet paths, so hash them into a flat, filesystem-safe name.
+        return os.path.join(self.folder, hashlib.sha256(key.encode()).hexdigest()[:32])
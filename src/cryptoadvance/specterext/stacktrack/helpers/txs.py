@@ -0,0 +1,96 @@
+import itertools
+
+
+# Helpers for working with the tx lists returned by Wallet.txlist(). These are sorted newest first by "time".
+
+
+def merge_txlists(txlists: list) -> list:
+    """
+    Merges the tx lists of several wallets into a single list, sorted newest first like each of the inputs.
+
+    The lists are chained once (no repeated list concatenation) and sorted. Since the input is made of k already
+    sorted runs, Timsort only merges those runs, which is O(n log k) for n txs. In CPython this beats a heapq-based
+    k-way merge by a wide margin, see test_benchmark_merge_txlists.
+
+    Txs are ordered by "time" instead of "blockheight", since unconfirmed txs have no blockheight (it's None or
+    missing) but every tx has a time. Sorting by blockheight is what broke the overview for unconfirmed txs, see
+    https://github.com/cryptoadvance/specterext-stacktrack/issues/12
+
+    :param txlists: tx lists, each sorted newest first
+    :return: a list of all txs
+    """
+    return sorted(itertools.chain.from_iterable(txlists), key=_tx_time, reverse=True)
+
+
+def _tx_time(tx) -> int:
+    return tx["time"]
+
+
+def net_transfers(txs: list) -> list:
+    """
+    Nets the txs which several of the lists merged by ``merge_txlists`` have in common. A transfer between two of a
+    user's wallets shows up in both: as an outflow of the sender and as an inflow of the receiver. Counted twice like
+    that, it draws large flows which never left or entered the user's wallets.
+
+    A single pass with a txid index: the first (newest) leg of each shared tx gets the combined flow of all its legs,
+    e.g. just the fee for a transfer, and the other legs get a flow of 0. They're kept instead of dropped, so the list
+    still has one tx per wallet tx and a leg showing up later (e.g. after a rescan) changes the tx count, which makes
+    ``HistoryCache`` rebuild the history instead of folding it.
+
+    :param txs: merged transaction list, sorted newest first
+    :return: the netted list, or txs itself if no tx is shared
+    """
+    first_legs = {}
+    # The combined flows by the index of the first leg, and the indexes of the other legs
+    flows = {}
+    other_legs = []
+    for i, tx in enumerate(txs):
+        first = first_legs.setdefault(tx["txid"], i)
+        if first != i:
+            flows[first] = flows.get(first, txs[first].flow_amount) + tx.flow_amount
+            other_legs.append(i)
+    if not flows:
+        return txs
+
+    netted = list(txs)
+    for first, flow in flows.items():
+        netted[first] = _NettedTx(txs[first], flow_amount=flow)
+    for i in other_legs:
+        netted[i] = _NettedTx(txs[i], flow_amount=0)
+    return netted
+
+
+class _NettedTx(dict):
+    """A leg of a shared tx, with the flow assigned by net_transfers()"""
+
+    @property
+    def flow_amount(self) -> float:
+        return self["flow_amount"]
+
+
+def split_unconfirmed(txs: list) -> tuple:
+    """
+    Splits a tx list into its confirmed and its unconfirmed (pending) txs, keeping the order. Charts bin and cache the
+    confirmed txs, the pending ones are only drawn as an overlay. So txs entering or leaving the mempool don't
+    invalidate the cached history.
+
+    A single pass over the txs, and the list is returned as is if nothing is pending.
+
+    :param txs: transaction list, sorted newest first like ``Wallet.txlist()``
+    :return: a tuple (confirmed, pending) of tx lists
+    """
+    pending = [tx for tx in txs if not tx.get("blockheight")]
+    if not pending:
+        return txs, pending
+    return [tx for tx in txs if tx.get("blockheight")], pending
+
+
+def tx_fingerprint(txs: list, tip_height) -> tuple:
+    """
+    A cheap fingerprint of a wallet's transaction list: tx count, newest txid and chain tip height.
+
+    :param txs: transaction list, sorted newest first like ``Wallet.txlist()``
+    :param tip_height: current block height
+    :return: a hashable tuple
+    """
+    return len(txs), txs[0]["txid"] if txs else None, tip_height
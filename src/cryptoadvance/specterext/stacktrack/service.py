@@ -1,14 +1,35 @@
+from __future__ import annotations
+
 import logging
+import os
+from datetime import datetime, timedelta
+from functools import cached_property
+from typing import TYPE_CHECKING, Optional
 
 from flask import current_app as app, url_for
 from flask_apscheduler import APScheduler
 
 from cryptoadvance.specter.services.service import Service, devstatus_alpha, devstatus_prod, devstatus_beta
+from cryptoadvance.specter.services.service_encrypted_storage import ServiceUnencryptedStorage
 # A SpecterError can be raised and will be shown to the user as a red banner
 from cryptoadvance.specter.specter_error import SpecterError
+from cryptoadvance.specter.user import User
 from cryptoadvance.specter.wallet import Wallet
 from cryptoadvance.specter.server_endpoints.wallets.wallets_vm import WalletsOverviewVm
 
+from .helpers.events import SharedPoll
+from .helpers.refresh import WalletRefresher
+from .helpers.txs import split_unconfirmed, tx_fingerprint
+
+if TYPE_CHECKING:
+    from .helpers.cache import HistoryCache
+    from .helpers.precompute import SpanPrecomputer
+    from .helpers.render_pool import RenderPool
+    from .helpers.sparklines import SparklineCache
+    from .helpers.rollup import RollupStore
+    from .helpers.tx_store import TxStore
+
+# The helpers behind the properties below pull in pandas, numpy and plotly, so they're imported once they're used.
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +46,7 @@ class StacktrackService(Service):
     isolated_client = False
 
     SHOW_OVERVIEW_CHART = "show_overview_chart"
+    TIMEZONE = "timezone"
 
     # TODO: As more Services are integrated, we'll want more robust categorization and sorting logic
     sort_priority = 2
@@ -33,10 +55,75 @@ class StacktrackService(Service):
     # Those will end up as keys in a json-file
     SPECTER_WALLET_ALIAS = "wallet"
 
+    def __init__(self, active, specter):
+        super().__init__(active, specter)
+        # Parallel balance/UTXO refreshes for the wallets overview, see helpers/refresh.py
+        self.wallet_refresher = WalletRefresher(
+            max_workers=app.config.get("STACKTRACK_REFRESH_WORKERS", 8),
+            timeout=app.config.get("STACKTRACK_REFRESH_TIMEOUT", 10),
+        )
+        # One poll per wallet for all the chart event streams, see helpers/events.py
+        self.wallet_polls = SharedPoll(app.config.get("STACKTRACK_EVENTS_POLL_SECONDS", 5))
+
+    @cached_property
+    def rollups(self) -> RollupStore:
+        """Precomputed hourly/daily/monthly history per wallet, see helpers/rollup.py"""
+        from .helpers.rollup import RollupStore
+
+        return RollupStore(os.path.join(self.data_folder, "rollups"))
+
+    @cached_property
+    def tx_store(self) -> TxStore:
+        """Memory mapped txs of large wallets, see helpers/tx_store.py"""
+        from .helpers.tx_store import TxStore
+
+        return TxStore(os.path.join(self.data_folder, "txs"))
+
+    @cached_property
+    def history_cache(self) -> HistoryCache:
+        """Binned balance history per wallet, see helpers/cache.py"""
+        from .helpers.cache import HistoryCache
+
+        return HistoryCache(
+            rollups=self.rollups, tx_store=self.tx_store, tx_store_min_txs=self.tx_store_min_txs
+        )
+
+    @cached_property
+    def span_precomputer(self) -> SpanPrecomputer:
+        """Builds the charts of all spans in the background, see helpers/precompute.py"""
+        from .helpers.precompute import SpanPrecomputer
+
+        return SpanPrecomputer(self.history_cache)
+
+    @cached_property
+    def sparkline_cache(self) -> SparklineCache:
+        """The wallets' sparklines on the overview, see helpers/sparklines.py"""
+        from .helpers.sparklines import SparklineCache
+
+        return SparklineCache()
+
+    @cached_property
+    def render_pool(self) -> Optional[RenderPool]:
+        """Worker processes for server-side charts, see helpers/render_pool.py. None if disabled."""
+        processes = app.config.get("STACKTRACK_RENDER_PROCESSES", 0)
+        if processes <= 0:
+            return None
+        from .helpers.render_pool import RenderPool
+
+        return RenderPool(
+            processes,
+            max_pending=app.config.get("STACKTRACK_RENDER_MAX_PENDING", 4),
+            timeout=app.config.get("STACKTRACK_RENDER_TIMEOUT", 30),
+        )
+
+    @property
+    def tx_store_min_txs(self) -> int:
+        return app.config.get("STACKTRACK_TX_STORE_MIN_TXS", 10_000)
+
     def callback_after_serverpy_init_app(self, scheduler: APScheduler):
-        def every5seconds(hello, world="world"):
+        def update_rollups():
             with scheduler.app.app_context():
-                print(f"Called {hello} {world} every5seconds")
+                self.update_rollups()
 
         # Here you can schedule regular jobs. triggers can be one of "interval", "date" or "cron"
         # Examples:
@@ -49,9 +136,42 @@ class StacktrackService(Service):
         # cron: https://apscheduler.readthedocs.io/en/3.x/modules/triggers/cron.html
         # sched.add_job("anotherID", job_function, trigger='cron', day_of_week='mon-fri', hour=5, minute=30, end_date='2014-05-30')
         
+        scheduler.add_job(
+            "stacktrack_update_rollups",
+            update_rollups,
+            trigger="interval",
+            minutes=scheduler.app.config.get("STACKTRACK_ROLLUP_INTERVAL_MINUTES", 5),
+            # The first run imports pandas, numpy and plotly and bins every wallet, so it waits until the server is up
+            # instead of competing with its first requests. Charts needed before that are binned on demand.
+            next_run_time=datetime.now() + timedelta(
+                seconds=scheduler.app.config.get("STACKTRACK_ROLLUP_START_DELAY_SECONDS", 60)
+            ),
+        )
+
         # Maybe you should store the scheduler for later use:
         self.scheduler = scheduler
 
+    def update_rollups(self):
+        """
+        Brings the rollups of every wallet of every user up to date, appends the new txs of large wallets to the tx
+        store and precomputes the charts of all spans, so they're current before anyone looks at them. Called by the
+        scheduler.
+        """
+        tip_height = self.specter.info.get("blocks")
+        for user in self.specter.user_manager.users:
+            # The user's charts are binned in their timezone, so that's the one their rollups and frames have to be in
+            tz = self.get_timezone(user)
+            for wallet in list(user.wallet_manager.wallets.values()):
+                try:
+                    # Pending txs are left out, they're only drawn as an overlay
+                    txs, _ = split_unconfirmed(wallet.txlist())
+                    if len(txs) >= self.tx_store_min_txs:
+                        self.tx_store.sync(wallet.fullpath, txs)
+                    self.rollups.update(wallet.fullpath, txs, tx_fingerprint(txs, tip_height), tz)
+                    self.history_cache.precompute(wallet.fullpath, txs, tip_height, tz=tz)
+                except Exception as e:
+                    logger.exception(e)
+
     # 'type' object not subscriptable in Python 3.7, so just use bare list.
     # def callback_add_wallettabs(self) -> list[dict[str, str]]:
     def callback_add_wallettabs(self) -> list:
@@ -85,3 +205,33 @@ class StacktrackService(Service):
     def set_show_overview_chart(cls, value: bool):
         """Set the Specter `Wallet` that is currently associated with this Service"""
         cls.update_current_user_service_data({cls.SHOW_OVERVIEW_CHART: value})
+
+    @staticmethod
+    def default_timezone() -> Optional[str]:
+        """The timezone of users who didn't pick one, None for the server's local time"""
+        return app.config.get("STACKTRACK_TIMEZONE")
+
+    @classmethod
+    def get_timezone(cls, user: User = None) -> Optional[str]:
+        """
+        The IANA timezone the user's charts are binned and labeled in, None for the server's local time.
+
+        :param user: the current user by default, e.g. a wallet's owner in a scheduled job where there is none
+        """
+        service_data = cls.get_current_user_service_data() if user is None else cls.get_user_service_data(user)
+        if service_data and service_data.get(cls.TIMEZONE):
+            return service_data[cls.TIMEZONE]
+        return cls.default_timezone()
+
+    @classmethod
+    def get_user_service_data(cls, user: User) -> dict:
+        """Like get_current_user_service_data(), but for any user. The service's data isn't encrypted, so that works."""
+        manager = cls._storage_manager()
+        if user not in manager.storage_by_user:
+            manager.storage_by_user[user] = ServiceUnencryptedStorage(manager.data_folder, user, disable_decrypt=True)
+        return manager.storage_by_user[user].get_service_data(cls.id)
+
+    @classmethod
+    def set_timezone(cls, value: str):
+        """Set the current user's timezone, an empty string goes back to the default one"""
+        cls.update_current_user_service_data({cls.TIMEZONE: value})
@@ -0,0 +1,96 @@
+// Renders StackTrack charts in the browser. The series comes from the /api/.../series endpoints as compact JSON
+// (see series_from_df() in helpers/plot.py) and is turned into the same traces helpers/plot.py builds server-side.
+
+const STACKTRACK_SATS_PER_BTC = 100000000;
+
+function stacktrackTraces(series) {
+    // The x-axis is a date axis, which takes epoch milliseconds.
+    const x = series.timestamp.map(ts => ts * 1000);
+    const toBtc = sats => sats / STACKTRACK_SATS_PER_BTC;
+    const traces = [
+        {
+            type: "bar",
+            x: x,
+            y: series.in.map(toBtc),
+            name: "BTC In",
+            marker: {color: "Green"},
+            legendrank: 3,
+        },
+        {
+            type: "bar",
+            x: x,
+            y: series.out.map(toBtc),
+            name: "BTC Out",
+            marker: {color: "DarkRed"},
+            legendrank: 2,
+        },
+        {
+            type: "scatter",
+            x: x,
+            y: series.cumulative.map(toBtc),
+            name: "Cumulative",
+            mode: "lines",
+            line: {shape: "hv"},
+            marker: {color: "Gold"},
+            legendrank: 1,
+        },
+    ];
+    if (series.pending) {
+        // Unconfirmed txs, only there while the wallet has some
+        traces.push(
+            {
+                type: "bar",
+                x: x,
+                y: series.pending.map(toBtc),
+                name: "Pending",
+                marker: {color: "Orange"},
+                opacity: 0.6,
+                legendrank: 4,
+            },
+            {
+                type: "scatter",
+                x: x,
+                y: series.pending_cumulative.map(toBtc),
+                name: "Cumulative incl. Pending",
+                mode: "lines",
+                line: {shape: "hv", dash: "dot"},
+                marker: {color: "Orange"},
+                legendrank: 5,
+            },
+        );
+    }
+    return traces;
+}
+
+async function stacktrackRenderChart(element, seriesUrl, layout, eventsUrl) {
+    const response = await fetch(seriesUrl, {credentials: "same-origin"});
+    if (!response.ok) {
+        element.innerText = "There was an error while creating the chart. See the logs for details";
+        return;
+    }
+    let series = await response.json();
+    Plotly.newPlot(element, stacktrackTraces(series), layout);
+    if (!eventsUrl) {
+        return;
+    }
+
+    // Keeps the chart up to date, see helpers/events.py. stacktrackTraces() creates new arrays, which is what makes
+    // Plotly.react() redraw.
+    const events = new EventSource(eventsUrl, {withCredentials: true});
+    events.addEventListener("series", event => {
+        series = JSON.parse(event.data);
+        Plotly.react(element, stacktrackTraces(series), layout);
+    });
+    events.addEventListener("delta", event => {
+        stacktrackApplyDelta(series, JSON.parse(event.data));
+        Plotly.react(element, stacktrackTraces(series), layout);
+    });
+}
+
+function stacktrackApplyDelta(series, delta) {
+    delta.bins.forEach((bin, i) => {
+        series.in[bin] = delta.in[i];
+        series.out[bin] = delta.out[i];
+    });
+    series.cumulative.splice(delta.tail_start, delta.tail.length, ...delta.tail);
+}
@@ -33,6 +33,8 @@ pytest_plugins = [
     "fix_keys_and_seeds",
     "fix_devices_and_wallets",
     "fix_testnet",
+    "fix_txs",
+    "fix_benchmark",
 ]
 
 # This is from https://stackoverflow.com/questions/132058/showing-the-stack-trace-from-a-running-python-application
@@ -81,6 +83,19 @@ def pytest_addoption(parser):
         default="master",
         help="Version of elementsd (something which works with git checkout ...)",
     )
+    parser.addoption(
+        "--benchmark-max-txs",
+        action="store",
+        type=int,
+        default=100_000,
+        help="Largest synthetic wallet (in txs) to benchmark, 1000000 runs the full suite (default:100000)",
+    )
+    parser.addoption(
+        "--benchmark-json",
+        action="store",
+        default=None,
+        help="Write the benchmark results to this JSON file",
+    )
     listen()
 
 
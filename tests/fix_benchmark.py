@@ -0,0 +1,83 @@
+""" Fixtures for the benchmarks in test_benchmarks.py.
+
+Each benchmark records its timings with the `benchmark` fixture. Run with --benchmark-json=results.json to collect them
+in a machine-readable file, e.g. to compare two commits:
+
+    pytest tests/test_benchmarks.py --benchmark-max-txs 1000000 --benchmark-json=results.json
+"""
+
+import datetime
+import importlib.metadata
+import json
+import platform
+import time
+
+import pytest
+
+# Sizes of the synthetic wallets. Larger ones are skipped unless --benchmark-max-txs allows them.
+BENCHMARK_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+
+class Benchmark:
+    """Times a function a few times, keeps the best run (like timeit) and records it"""
+
+    def __init__(self, results: list, test_name: str):
+        self.results = results
+        self.test_name = test_name
+
+    def __call__(self, name: str, func, *args, rounds: int = 3, **params):
+        """
+        Runs ``func(*args)`` ``rounds`` times and records the fastest run.
+
+        :param name: what's being timed, e.g. "build_chart"
+        :param func: the function to time
+        :param rounds: how often to run it
+        :param params: describe the run, e.g. size=1000, span="1y"; they're recorded along with the timings
+        :return: the return value of the last run
+        """
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            result = func(*args)
+            timings.append(time.perf_counter() - start)
+        self.results.append(
+            {"test": self.test_name, "name": name, **params, "best": min(timings), "timings": timings}
+        )
+        print(f"\n{name} {params}: {min(timings):.4f}s")
+        return result
+
+
+@pytest.fixture(scope="session")
+def benchmark_results(request):
+    """All results of this session. Written to --benchmark-json (if given) after the last test"""
+    results = []
+    yield results
+    path = request.config.getoption("--benchmark-json")
+    if path and results:
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                    "machine": {"python": platform.python_version(), "platform": platform.platform()},
+                    "versions": {
+                        package: importlib.metadata.version(package) for package in ("numpy", "pandas", "plotly")
+                    },
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+@pytest.fixture
+def benchmark(benchmark_results, request):
+    """Times and records a function, see Benchmark.__call__()"""
+    return Benchmark(benchmark_results, request.node.name)
+
+
+@pytest.fixture(scope="session", params=BENCHMARK_SIZES, ids=lambda size: f"{size}txs")
+def benchmark_size(request):
+    """The size of the synthetic wallet, skips sizes above --benchmark-max-txs"""
+    if request.param > request.config.getoption("--benchmark-max-txs"):
+        pytest.skip(f"{request.param} txs is above --benchmark-max-txs")
+    return request.param
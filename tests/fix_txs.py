@@ -0,0 +1,101 @@
+""" Fixtures which produce synthetic transaction lists shaped like the output of Wallet.txlist().
+
+They don't need a running node, so the chart pipeline can be tested (and timed) with wallets of any size.
+"""
+
+import hashlib
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+
+class FakeTx(dict):
+    """A tx item like the ones returned by Wallet.txlist(): a dict which also exposes flow_amount as an attribute"""
+
+    @property
+    def flow_amount(self) -> float:
+        return self["flow_amount"]
+
+
+def make_txs(
+    count: int,
+    start: datetime = datetime(2015, 1, 1),
+    end: datetime = None,
+    seed: int = 0,
+    unconfirmed: int = 0,
+    txid_prefix: str = "",
+) -> list:
+    """Creates count txs between start and end, sorted newest first like Wallet.txlist().
+    The last `unconfirmed` txs (by time) get no blockheight."""
+    rnd = random.Random(seed)
+    start_ts = int(start.timestamp())
+    end_ts = int((end or datetime.now()).timestamp())
+    times = sorted(rnd.randrange(start_ts, end_ts) for _ in range(count))
+    txs = []
+    for i, tx_time in enumerate(times):
+        confirmed = i < count - unconfirmed
+        sats = rnd.randrange(1_000, 50_000_000)
+        if rnd.random() < 0.4:
+            sats = -sats
+        txs.append(
+            FakeTx(
+                txid=hashlib.sha256(f"{txid_prefix}{seed}-{i}".encode()).hexdigest(),
+                time=tx_time,
+                blockheight=100 + i if confirmed else None,
+                flow_amount=sats / 100_000_000,
+            )
+        )
+    txs.reverse()
+    return txs
+
+
+def make_recent_txs(count: int, **kwargs) -> list:
+    """Like make_txs(), over the last 800 days. That's long enough for charts of every span, up to a multi-year "all"."""
+    return make_txs(count, start=datetime.now() - timedelta(days=800), **kwargs)
+
+
+@pytest.fixture
+def synthetic_txs():
+    """A factory for synthetic tx lists, see make_txs()"""
+    return make_txs
+
+
+@pytest.fixture
+def recent_txs():
+    """A factory for synthetic tx lists of the last 800 days, see make_recent_txs()"""
+    return make_recent_txs
+
+
+@pytest.fixture
+def utc_timezone():
+    """Runs the test with the process timezone set to UTC"""
+    old_tz = os.environ.get("TZ")
+    os.environ["TZ"] = "UTC"
+    time.tzset()
+    try:
+        yield
+    finally:
+        if old_tz is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = old_tz
+        time.tzset()
+
+
+@pytest.fixture(params=["UTC", "Europe/Berlin", "America/New_York", "Australia/Lord_Howe", "Asia/Kolkata"])
+def local_timezone(request):
+    """Runs the test in the given timezone. Lord Howe Island moves its clocks by 30 minutes."""
+    old_tz = os.environ.get("TZ")
+    os.environ["TZ"] = request.param
+    time.tzset()
+    try:
+        yield request.param
+    finally:
+        if old_tz is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = old_tz
+        time.tzset()
@@ -0,0 +1,92 @@
+""" Benchmarks of the chart pipeline with synthetic wallets of 1k up to 1M txs, see fix_benchmark.py.
+
+They assert nothing about speed, only record it. Deselect them with -m "not slow".
+"""
+
+import pytest
+
+from cryptoadvance.specterext.stacktrack.helpers import plot
+from cryptoadvance.specterext.stacktrack.helpers.tx_series import TxSeries
+from cryptoadvance.specterext.stacktrack.helpers.tx_store import TxStore
+from cryptoadvance.specterext.stacktrack.helpers.txs import merge_txlists, net_transfers
+from fix_txs import FakeTx, make_txs
+
+# The overview merges the tx lists of all wallets, the benchmark splits its txs across this many
+NUM_WALLETS = 10
+
+pytestmark = pytest.mark.slow
+
+
+@pytest.fixture(scope="session")
+def wallet_txs(benchmark_size):
+    return make_txs(benchmark_size)
+
+
+@pytest.fixture(scope="session")
+def wallet_series(wallet_txs):
+    return TxSeries.from_txs(wallet_txs)
+
+
+@pytest.fixture(scope="session")
+def wallet_txlists(benchmark_size):
+    return [make_txs(benchmark_size // NUM_WALLETS, seed=seed) for seed in range(NUM_WALLETS)]
+
+
+@pytest.mark.parametrize("span", plot.SPANS)
+def test_benchmark_count_sats(benchmark, benchmark_size, wallet_series, span):
+    start_dt, end_dt, interval = plot.span_window(span, wallet_series)
+    df = benchmark(
+        "_count_sats", plot._count_sats, wallet_series, start_dt, end_dt, interval, size=benchmark_size, span=span
+    )
+    assert df["sats_cusum"].iloc[-1] == df["sats"].sum() + (df["sats_cusum"].iloc[0] - df["sats"].iloc[0])
+
+
+@pytest.mark.parametrize("span", plot.SPANS)
+def test_benchmark_build_chart_from_df(benchmark, benchmark_size, wallet_series, span):
+    df = plot.build_frame(span, wallet_series)
+    chart = benchmark("build_chart_from_df", plot.build_chart_from_df, df, size=benchmark_size, span=span)
+    assert chart.startswith("<div>")
+
+
+@pytest.mark.parametrize("span", plot.SPANS)
+def test_benchmark_figure_html(benchmark, benchmark_size, wallet_series, span):
+    # The validated go.Figure path which build_chart_from_df replaces, as a baseline
+    df = plot.build_frame(span, wallet_series)
+    chart = benchmark(
+        "figure_html(build_figure)", lambda: plot.figure_html(plot.build_figure(df)), size=benchmark_size, span=span
+    )
+    assert chart.startswith("<div>")
+
+
+@pytest.mark.parametrize("span", plot.SPANS)
+def test_benchmark_build_chart(benchmark, benchmark_size, wallet_series, span):
+    chart = benchmark("build_chart", plot.build_chart, span, wallet_series, size=benchmark_size, span=span)
+    assert chart.startswith("<div>")
+
+
+def test_benchmark_build_frames(benchmark, benchmark_size, wallet_series):
+    frames = benchmark("build_frames", plot.build_frames, wallet_series, size=benchmark_size)
+    assert list(frames) == list(plot.SPANS)
+
+
+def test_benchmark_tx_series(benchmark, benchmark_size, wallet_txs):
+    series = benchmark("TxSeries.from_txs", TxSeries.from_txs, wallet_txs, size=benchmark_size)
+    assert len(series) == benchmark_size
+
+
+@pytest.mark.parametrize("span", plot.SPANS)
+def test_benchmark_build_frame_from_tx_store(benchmark, benchmark_size, wallet_txs, span, tmp_path):
+    series = TxStore(str(tmp_path)).sync("w", wallet_txs)
+    df = benchmark("build_frame (tx store)", plot.build_frame, span, series, size=benchmark_size, span=span)
+    assert df["sats_cusum"].iloc[-1] == series.sats_cusum()[-1]
+
+
+def test_benchmark_extract_txs(benchmark, benchmark_size, wallet_txlists):
+    # What controller._extract_txs does, importing the controller needs a Flask app. Every wallet sent a tenth of its txs
+    # to another one, so those show up in two tx lists and get netted.
+    received = [[FakeTx(tx, flow_amount=-tx["flow_amount"]) for tx in txs[::10]] for txs in wallet_txlists[:-1]]
+    txlists = wallet_txlists + received
+    netted = benchmark(
+        "_extract_txs", lambda: net_transfers(merge_txlists(txlists)), size=benchmark_size, wallets=NUM_WALLETS
+    )
+    assert len(netted) == sum(len(txs) for txs in txlists)
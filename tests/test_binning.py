@@ -0,0 +1,199 @@
+import datetime as dt
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cryptoadvance.specterext.stacktrack.helpers import binning, dtutil, plot
+from cryptoadvance.specterext.stacktrack.helpers.core import Interval, SATS_PER_BTC
+from cryptoadvance.specterext.stacktrack.helpers.tx_series import TxSeries
+from fix_txs import FakeTx
+
+
+def _count_sats_loop(txs, start_dt, end_dt, interval, local=False):
+    """
+    The original per-tx implementation of plot._count_sats, kept as the reference.
+
+    The original labeled the bins with their UTC wall clock time and compared the local time of each tx with that to
+    find the txs before the first bin. That's only the same as the local start of the time range in UTC. local=True
+    labels and compares in local time instead, which is what plot._count_sats does in every timezone.
+    """
+    timestamps = []
+    sat_bins = {}
+    prior_count = 0
+
+    curr_dt = start_dt
+    while curr_dt < end_dt:
+        wall_dt = curr_dt.replace(tzinfo=dt.timezone.utc) if local else curr_dt
+        timestamps.append(pd.Timestamp(wall_dt.timestamp(), unit="s"))
+        sat_bins[curr_dt] = 0
+        curr_dt = dtutil.next_dt(curr_dt, interval)
+
+    for tx in txs:
+        tx_dt = dt.datetime.fromtimestamp(tx["time"])
+        amount = round(tx.flow_amount * SATS_PER_BTC)
+        if tx_dt < timestamps[0]:
+            prior_count += amount
+        else:
+            bin_dt = dtutil.snap_to(tx_dt, interval)
+            sat_bins[bin_dt] += amount
+
+    sats = [item[1] for item in sorted(sat_bins.items())]
+
+    df = pd.DataFrame({"timestamp": timestamps, "sats": sats})
+    df["sats_cusum"] = df["sats"].cumsum() + prior_count
+    return df
+
+
+@pytest.mark.parametrize(
+    "start_dt,end_dt,interval",
+    [
+        (dt.datetime(2022, 10, 5, 0), dt.datetime(2022, 10, 6, 0), Interval.HOUR),
+        (dt.datetime(2022, 9, 29), dt.datetime(2022, 10, 6), Interval.DAY),
+        (dt.datetime(2022, 9, 5), dt.datetime(2022, 10, 6), Interval.DAY),
+        (dt.datetime(2021, 11, 1), dt.datetime(2022, 11, 1), Interval.MONTH),
+        (dt.datetime(2015, 1, 1), dt.datetime(2022, 11, 1), Interval.MONTH),
+    ],
+)
+def test_count_sats_matches_loop(utc_timezone, synthetic_txs, start_dt, end_dt, interval):
+    txs = synthetic_txs(2000, start=dt.datetime(2015, 1, 1), end=end_dt)
+    expected = _count_sats_loop(txs, start_dt, end_dt, interval)
+    result = plot._count_sats(TxSeries.from_txs(txs), start_dt, end_dt, interval)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("local_timezone", ["Europe/Berlin"], indirect=True)
+@pytest.mark.parametrize(
+    "start_dt,end_dt,interval",
+    [
+        # Across the end and the start of daylight saving time
+        (dt.datetime(2022, 10, 20), dt.datetime(2022, 11, 10), Interval.DAY),
+        (dt.datetime(2022, 3, 20), dt.datetime(2022, 4, 10), Interval.DAY),
+        (dt.datetime(2021, 1, 1), dt.datetime(2022, 12, 1), Interval.MONTH),
+    ],
+)
+def test_count_sats_matches_loop_in_local_time(local_timezone, synthetic_txs, start_dt, end_dt, interval):
+    txs = synthetic_txs(2000, start=dt.datetime(2020, 1, 1), end=end_dt)
+    expected = _count_sats_loop(txs, start_dt, end_dt, interval, local=True)
+    result = plot._count_sats(TxSeries.from_txs(txs), start_dt, end_dt, interval)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("local_timezone", ["Europe/Berlin"], indirect=True)
+def test_count_sats_prior_count_ends_at_the_local_start(local_timezone):
+    start_dt = dt.datetime(2022, 10, 5)
+    # Before and after midnight in Berlin. The original loop compared with 22:00, midnight's UTC wall clock time.
+    txs = [
+        FakeTx(txid="after", time=int(dt.datetime(2022, 10, 5, 0, 30).timestamp()), blockheight=2, flow_amount=2),
+        FakeTx(txid="before", time=int(dt.datetime(2022, 10, 4, 23, 30).timestamp()), blockheight=1, flow_amount=1),
+    ]
+    df = plot._count_sats(TxSeries.from_txs(txs), start_dt, dt.datetime(2022, 10, 6), Interval.DAY)
+    assert df["sats"].tolist() == [2 * SATS_PER_BTC]
+    assert df["sats_cusum"].tolist() == [3 * SATS_PER_BTC]
+    assert df["timestamp"].tolist() == [pd.Timestamp("2022-10-05")]
+
+
+def test_count_sats_empty_txs(utc_timezone):
+    start_dt = dt.datetime(2022, 10, 5)
+    end_dt = dt.datetime(2022, 10, 6)
+    expected = _count_sats_loop([], start_dt, end_dt, Interval.HOUR)
+    result = plot._count_sats(TxSeries.empty(), start_dt, end_dt, Interval.HOUR)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_bin_sats():
+    edges = np.array([10, 20, 30, 40])
+    timestamps = np.array([5, 10, 19, 20, 35, 40, 45])
+    sats = np.array([1, 2, 4, 8, 16, 32, 64])
+    bins, prior_count = binning.bin_sats(timestamps, sats, edges)
+    assert bins.tolist() == [6, 8, 16]
+    assert prior_count == 1
+
+
+def test_bin_sats_negative_amounts():
+    edges = np.array([0, 10])
+    bins, prior_count = binning.bin_sats(np.array([-1, 1, 2]), np.array([-5, 3, -7]), edges)
+    assert bins.tolist() == [-4]
+    assert prior_count == -5
+
+
+def test_bin_sorted_sats():
+    edges = np.array([10, 20, 30, 40])
+    timestamps = np.array([5, 10, 19, 20, 35, 40, 45])
+    sats = np.array([1, 2, 4, 8, 16, 32, 64])
+    bins, prior_count = binning.bin_sorted_sats(timestamps, np.cumsum(sats), edges)
+    assert bins.tolist() == [6, 8, 16]
+    assert prior_count == 1
+
+
+def test_bin_sorted_sats_matches_bin_sats():
+    rnd = np.random.default_rng(0)
+    timestamps = np.sort(rnd.integers(0, 1000, 500))
+    sats = rnd.integers(-1000, 1000, 500)
+    for edges in (np.arange(100, 900, 50), np.arange(-100, 0, 10), np.arange(1000, 1100, 10), np.unique(timestamps)):
+        bins, prior_count = binning.bin_sorted_sats(timestamps, np.cumsum(sats), edges)
+        expected_bins, expected_prior_count = binning.bin_sats(timestamps, sats, edges)
+        assert bins.tolist() == expected_bins.tolist()
+        assert prior_count == expected_prior_count
+
+
+def test_bin_sorted_sats_many():
+    rnd = np.random.default_rng(0)
+    timestamps = np.sort(rnd.integers(0, 1000, 500))
+    sats_cusum = np.cumsum(rnd.integers(-1000, 1000, 500))
+    edge_arrays = [np.arange(100, 900, 50), np.arange(-100, 0, 10), np.arange(1000, 1100, 10), np.array([500])]
+    results = binning.bin_sorted_sats_many(timestamps, sats_cusum, edge_arrays)
+    assert len(results) == len(edge_arrays)
+    for edges, (bins, prior_count) in zip(edge_arrays, results):
+        expected_bins, expected_prior_count = binning.bin_sorted_sats(timestamps, sats_cusum, edges)
+        assert bins.tolist() == expected_bins.tolist()
+        assert prior_count == expected_prior_count
+    assert binning.bin_sorted_sats_many(timestamps, sats_cusum, []) == []
+
+
+def _tx(time, sats):
+    return FakeTx(txid=f"{time}", time=int(time), blockheight=1, flow_amount=sats / SATS_PER_BTC)
+
+
+def test_count_sats_in_timezone(utc_timezone):
+    berlin = ZoneInfo("Europe/Berlin")
+    # The clocks go back on 2022-10-30, so that day has 25 hours
+    txs = [
+        _tx(dt.datetime(2022, 10, 29, 23, 59, tzinfo=berlin).timestamp(), 1),
+        _tx(dt.datetime(2022, 10, 30, 0, 0, tzinfo=berlin).timestamp(), 2),
+        _tx(dt.datetime(2022, 10, 30, 23, 59, tzinfo=berlin).timestamp(), 4),
+        _tx(dt.datetime(2022, 10, 31, 0, 30, tzinfo=berlin).timestamp(), 8),
+    ]
+    df = plot._count_sats(
+        TxSeries.from_txs(txs), dt.datetime(2022, 10, 29), dt.datetime(2022, 11, 1), Interval.DAY, "Europe/Berlin"
+    )
+    # The bins are labeled with Berlin's midnights, not the UTC times of those
+    assert df["timestamp"].tolist() == [
+        pd.Timestamp(2022, 10, 29), pd.Timestamp(2022, 10, 30), pd.Timestamp(2022, 10, 31)
+    ]
+    assert df["sats"].tolist() == [1, 6, 8]
+    edges = binning.bin_edges(dt.datetime(2022, 10, 29), dt.datetime(2022, 11, 1), Interval.DAY, "Europe/Berlin")
+    assert np.diff(edges).tolist() == [24 * 3600, 25 * 3600, 24 * 3600]
+
+
+def test_add_pending():
+    edges = np.array([0, 10, 20, 30])
+    df = binning.frame_from_bins(edges, np.array([1, 2, 4]), 100)
+    confirmed = df.copy()
+    binning.add_pending(df, edges, np.array([-5, 12, 25, 40]), np.array([1000, 10, -20, 3000]))
+    pd.testing.assert_frame_equal(df[confirmed.columns], confirmed)
+    assert df["pending_sats"].tolist() == [0, 10, -20]
+    # A pending tx before the first bin counts towards the balance, one after the last doesn't
+    assert df["pending_cusum"].tolist() == [1101, 1113, 1097]
+
+
+def test_count_sats_in_local_timezone(local_timezone, synthetic_txs):
+    # Without a timezone, the bins are those of the server's local time
+    series = TxSeries.from_txs(synthetic_txs(500, start=dt.datetime(2021, 1, 1), end=dt.datetime(2023, 1, 1)))
+    for interval in (Interval.HOUR, Interval.DAY, Interval.MONTH):
+        start_dt, end_dt = dt.datetime(2022, 3, 1), dt.datetime(2022, 11, 15)
+        pd.testing.assert_frame_equal(
+            plot._count_sats(series, start_dt, end_dt, interval),
+            plot._count_sats(series, start_dt, end_dt, interval, local_timezone),
+        )
@@ -0,0 +1,268 @@
+import datetime as dt
+import threading
+
+import pandas as pd
+import pytest
+
+from cryptoadvance.specterext.stacktrack.helpers import metrics, plot
+from cryptoadvance.specterext.stacktrack.helpers.cache import HistoryCache, overview_key, tx_fingerprint
+from cryptoadvance.specterext.stacktrack.helpers.tx_series import TxSeries
+from cryptoadvance.specterext.stacktrack.helpers.txs import merge_txlists, net_transfers
+from fix_txs import FakeTx
+
+
+@pytest.fixture
+def txs(recent_txs):
+    return recent_txs(500)
+
+
+def test_tx_fingerprint(txs):
+    assert tx_fingerprint(txs, 100) == (500, txs[0]["txid"], 100)
+    assert tx_fingerprint([], 100) == (0, None, 100)
+
+
+@pytest.mark.parametrize("span", plot.SPANS)
+def test_get_frame_matches_build_frame(txs, span):
+    cache = HistoryCache()
+    pd.testing.assert_frame_equal(cache.get_frame("w", txs, 100, span), plot.build_frame(span, TxSeries.from_txs(txs)))
+
+
+def test_get_frame_repeat_view_is_cached(txs, monkeypatch):
+    cache = HistoryCache()
+    first = cache.get_frame("w", txs, 100, "1y")
+
+    def fail(*args):
+        raise AssertionError("should have been served from the cache")
+
+    monkeypatch.setattr(cache, "_build_frame", fail)
+    pd.testing.assert_frame_equal(cache.get_frame("w", txs, 100, "1y"), first)
+    # A new block without new txs doesn't require a rebuild either
+    pd.testing.assert_frame_equal(cache.get_frame("w", txs, 101, "1y"), first)
+
+
+@pytest.mark.parametrize("span", ["1d", "1m"])
+def test_get_frame_follows_the_timezone(txs, span):
+    cache = HistoryCache()
+    series = TxSeries.from_txs(txs)
+    for tz in (None, "Asia/Kolkata", "America/New_York", None):
+        pd.testing.assert_frame_equal(cache.get_frame("w", txs, 100, span, tz=tz), plot.build_frame(span, series, tz))
+
+
+@pytest.mark.parametrize("span", ["1d", "1y", "all"])
+def test_get_frame_with_pending_txs(recent_txs, span):
+    txs = recent_txs(500, unconfirmed=3)
+    confirmed, pending = txs[3:], txs[:3]
+    cache = HistoryCache()
+    df = cache.get_frame("w", confirmed, 100, span, pending=pending)
+    expected = plot.build_frame(span, TxSeries.from_txs(confirmed))
+    pd.testing.assert_frame_equal(df[expected.columns], expected)
+    pending_sats = sum(tx["flow_amount"] for tx in pending) * 100_000_000
+    # Pending txs before the span count towards its balance
+    assert df["pending_cusum"].iloc[-1] == pytest.approx(expected["sats_cusum"].iloc[-1] + pending_sats)
+
+
+def test_pending_txs_dont_invalidate_the_cache(recent_txs, monkeypatch):
+    txs = recent_txs(500, unconfirmed=3)
+    confirmed, pending = txs[3:], txs[:3]
+    cache = HistoryCache()
+    cache.get_frame("w", confirmed, 100, "1y")
+
+    def fail(*args):
+        raise AssertionError("should have been served from the cache")
+
+    monkeypatch.setattr(cache, "_build_frame", fail)
+    # Txs entering and leaving the mempool only change the overlay
+    for pending_txs in (pending, pending[1:], []):
+        df = cache.get_frame("w", confirmed, 100, "1y", pending=pending_txs)
+        assert ("pending_sats" in df.columns) == bool(pending_txs)
+
+
+def test_get_frame_returns_copies(txs):
+    cache = HistoryCache()
+    df = cache.get_frame("w", txs, 100, "1y")
+    df["sats"] = 0
+    pd.testing.assert_frame_equal(cache.get_frame("w", txs, 100, "1y"), plot.build_frame("1y", TxSeries.from_txs(txs)))
+
+
+@pytest.mark.parametrize("span", plot.SPANS)
+def test_get_frame_folds_new_txs(recent_txs, span, monkeypatch):
+    all_txs = recent_txs(500)
+    old_txs = all_txs[3:]
+    cache = HistoryCache()
+    cache.get_frame("w", old_txs, 100, span)
+
+    monkeypatch.setattr(HistoryCache, "_find_new_txs", _spy(HistoryCache._find_new_txs, expect_new=3))
+    result = cache.get_frame("w", all_txs, 101, span)
+    pd.testing.assert_frame_equal(result, plot.build_frame(span, TxSeries.from_txs(all_txs)))
+
+
+def test_get_frame_rebuilds_on_dropped_txs(txs):
+    cache = HistoryCache()
+    cache.get_frame("w", txs, 100, "all")
+    fewer_txs = txs[:100] + txs[101:]
+    pd.testing.assert_frame_equal(
+        cache.get_frame("w", fewer_txs, 100, "all"), plot.build_frame("all", TxSeries.from_txs(fewer_txs))
+    )
+
+
+def test_get_frame_rebuilds_on_dropped_and_new_txs(txs, synthetic_txs):
+    cache = HistoryCache()
+    cache.get_frame("w", txs, 100, "all")
+    # A replaced tx is gone and two new ones arrived, so there's one tx more than before
+    new_txs = synthetic_txs(2, start=dt.datetime.now() - dt.timedelta(days=2), seed=1)
+    changed_txs = new_txs + txs[:100] + txs[101:]
+    pd.testing.assert_frame_equal(
+        cache.get_frame("w", changed_txs, 101, "all"), plot.build_frame("all", TxSeries.from_txs(changed_txs))
+    )
+
+
+def test_get_frame_rebuilds_on_replaced_newest_tx(txs, synthetic_txs):
+    cache = HistoryCache()
+    cache.get_frame("w", txs, 100, "1y")
+    replacement = synthetic_txs(1, start=dt.datetime.now() - dt.timedelta(days=2), seed=1)
+    replaced_txs = replacement + txs[1:]
+    pd.testing.assert_frame_equal(
+        cache.get_frame("w", replaced_txs, 100, "1y"), plot.build_frame("1y", TxSeries.from_txs(replaced_txs))
+    )
+
+
+def test_get_frame_keys_are_independent(txs, synthetic_txs):
+    cache = HistoryCache()
+    other_txs = synthetic_txs(50, seed=1)
+    cache.get_frame("a", txs, 100, "all")
+    pd.testing.assert_frame_equal(
+        cache.get_frame("b", other_txs, 100, "all"), plot.build_frame("all", TxSeries.from_txs(other_txs))
+    )
+
+
+def test_build_of_a_key_doesnt_block_other_keys(txs, synthetic_txs, monkeypatch):
+    cache = HistoryCache()
+    other_txs = synthetic_txs(50, seed=1)
+    building = threading.Event()
+    done = threading.Event()
+    load_series = cache._load_series
+
+    def slow_load_series(key, txs):
+        if key == "a":
+            building.set()
+            assert done.wait(10), "the build of b waited for the build of a"
+        return load_series(key, txs)
+
+    monkeypatch.setattr(cache, "_load_series", slow_load_series)
+    thread = threading.Thread(target=cache.get_frame, args=("a", txs, 100, "1y"))
+    thread.start()
+    assert building.wait(10)
+    # a is still being built
+    cache.get_frame("b", other_txs, 100, "1y")
+    done.set()
+    thread.join()
+    assert set(cache._entries) == {"a", "b"}
+
+
+def _overview_txs(*txlists) -> list:
+    return net_transfers(merge_txlists(txlists))
+
+
+def test_overviews_of_users_are_independent(recent_txs, monkeypatch):
+    alice = _overview_txs(*[recent_txs(300, seed=seed) for seed in (1, 2)])
+    # Bob has a few more txs than Alice, which must not be taken for new txs of Alice's
+    bob = _overview_txs(*[recent_txs(302, seed=seed) for seed in (3, 4)])
+    cache = HistoryCache()
+    for user, txs in (("alice", alice), ("bob", bob)):
+        pd.testing.assert_frame_equal(
+            cache.get_frame(overview_key(user), txs, 100, "all"), plot.build_frame("all", TxSeries.from_txs(txs))
+        )
+
+    def fail(*args):
+        raise AssertionError("should have been served from the cache")
+
+    # Switching between the users doesn't evict the other one's history
+    monkeypatch.setattr(cache, "_update_entry", fail)
+    for user, txs in (("alice", alice), ("bob", bob)):
+        pd.testing.assert_frame_equal(
+            cache.get_frame(overview_key(user), txs, 100, "all"), plot.build_frame("all", TxSeries.from_txs(txs))
+        )
+
+
+def test_get_frame_folds_new_transfers(recent_txs, monkeypatch):
+    sender, receiver = [recent_txs(300, seed=s) for s in (1, 2)]
+    cache = HistoryCache()
+    cache.get_frame(overview_key("alice"), _overview_txs(sender[1:], receiver), 100, "1y")
+
+    # The sender's newest tx went to the receiver. Both legs are new, so they're folded.
+    transfer = sender[0]
+    sender[0] = FakeTx(transfer, flow_amount=-0.50001)
+    receiver = merge_txlists([receiver, [FakeTx(transfer, flow_amount=0.5)]])
+    txs = _overview_txs(sender, receiver)
+    monkeypatch.setattr(HistoryCache, "_find_new_txs", _spy(HistoryCache._find_new_txs, expect_new=2))
+    pd.testing.assert_frame_equal(
+        cache.get_frame(overview_key("alice"), txs, 101, "1y"), plot.build_frame("1y", TxSeries.from_txs(txs))
+    )
+
+
+def test_get_frame_rebuilds_on_late_transfer_legs(recent_txs):
+    sender, receiver = [recent_txs(300, seed=s) for s in (1, 2)]
+    cache = HistoryCache()
+    cache.get_frame(overview_key("alice"), _overview_txs(sender, receiver), 100, "all")
+
+    # The receiver's leg of an older transfer only shows up now, e.g. after a rescan. It changes the netted flow of a
+    # tx which is already part of the cached history.
+    receiver = merge_txlists([receiver, [FakeTx(sender[100], flow_amount=-sender[100]["flow_amount"])]])
+    txs = _overview_txs(sender, receiver)
+    pd.testing.assert_frame_equal(
+        cache.get_frame(overview_key("alice"), txs, 101, "all"), plot.build_frame("all", TxSeries.from_txs(txs))
+    )
+
+
+def _spy(find_new_txs, expect_new: int):
+    def spy(entry, txs):
+        new_txs = find_new_txs(entry, txs)
+        assert new_txs is not None and len(new_txs) == expect_new
+        return new_txs
+
+    return staticmethod(spy)
+
+
+def test_get_frame_custom_window(txs):
+    cache = HistoryCache()
+    window = plot.plan_window(dt.datetime.now() - dt.timedelta(days=300), dt.datetime.now() - dt.timedelta(days=200), 60)
+    expected = plot.build_window_frame(window, TxSeries.from_txs(txs))
+    pd.testing.assert_frame_equal(cache.get_frame("w", txs, 100, None, window), expected)
+    # Custom windows don't take the place of spans
+    assert cache._entries["w"].frames == {}
+
+
+def test_precompute_fills_all_spans(txs, monkeypatch):
+    cache = HistoryCache()
+    cache.precompute("w", txs, 100)
+    assert set(cache._entries["w"].frames) == set(plot.SPANS)
+
+    def fail(*args):
+        raise AssertionError("should have been precomputed")
+
+    monkeypatch.setattr(cache, "_build_frame", fail)
+    monkeypatch.setattr(cache, "_build_frames", fail)
+    for span in plot.SPANS:
+        expected = plot.build_frame(span, TxSeries.from_txs(txs))
+        pd.testing.assert_frame_equal(cache.get_frame("w", txs, 100, span), expected)
+    # Precomputing an unchanged wallet again doesn't rebuild anything
+    cache.precompute("w", txs, 101)
+
+
+def test_get_frame_counts_hits_and_misses(txs):
+    hits = metrics.HISTORY_CACHE_REQUESTS.get(result="hit")
+    misses = metrics.HISTORY_CACHE_REQUESTS.get(result="miss")
+    cache = HistoryCache()
+    cache.get_frame("w", txs, 100, "1y")
+    cache.get_frame("w", txs, 100, "1y")
+    cache.get_frame("w", txs, 100, "1m")
+    assert metrics.HISTORY_CACHE_REQUESTS.get(result="hit") == hits + 1
+    assert metrics.HISTORY_CACHE_REQUESTS.get(result="miss") == misses + 2
+
+
+def test_get_series(txs):
+    cache = HistoryCache()
+    series = cache.get_series("w", txs[5:], 100)
+    assert series.timestamps.tolist() == TxSeries.from_txs(txs[5:]).timestamps.tolist()
+    assert cache.get_series("w", txs[5:], 101) is series
+    assert len(cache.get_series("w", txs, 102)) == len(txs)
@@ -1,5 +1,7 @@
-from datetime import datetime
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
 
+import numpy as np
 import pytest
 
 from cryptoadvance.specterext.stacktrack.helpers import dtutil
@@ -70,3 +72,161 @@ def test_next_dt_month_rollover():
     curr_dt = datetime(2022, 12, 5, 16, 38, 30)
     result = dtutil.next_dt(curr_dt, Interval.MONTH)
     assert result == datetime(2023, 1, 1)
+
+
+def test_snap_to_week():
+    dt = datetime(2022, 10, 5, 16, 38, 30)  # a Wednesday
+    assert dtutil.snap_to(dt, Interval.WEEK) == datetime(2022, 10, 3)
+    assert dtutil.snap_to(dt, Interval.WEEK, dtutil.SUNDAY) == datetime(2022, 10, 2)
+
+
+def test_snap_to_week_start_day():
+    dt = datetime(2022, 10, 2, 16, 38, 30)  # a Sunday
+    assert dtutil.snap_to(dt, Interval.WEEK) == datetime(2022, 9, 26)
+    assert dtutil.snap_to(dt, Interval.WEEK, dtutil.SUNDAY) == datetime(2022, 10, 2)
+
+
+def test_snap_to_quarter():
+    assert dtutil.snap_to(datetime(2022, 10, 5, 16, 38, 30), Interval.QUARTER) == datetime(2022, 10, 1)
+    assert dtutil.snap_to(datetime(2022, 3, 31, 23, 59), Interval.QUARTER) == datetime(2022, 1, 1)
+
+
+def test_next_dt_week():
+    curr_dt = datetime(2022, 12, 28, 16, 38, 30)  # a Wednesday
+    assert dtutil.next_dt(curr_dt, Interval.WEEK) == datetime(2023, 1, 2)
+    assert dtutil.next_dt(curr_dt, Interval.WEEK, dtutil.SUNDAY) == datetime(2023, 1, 1)
+
+
+def test_next_dt_quarter():
+    assert dtutil.next_dt(datetime(2022, 8, 5, 16, 38, 30), Interval.QUARTER) == datetime(2022, 10, 1)
+
+
+def test_next_dt_quarter_rollover():
+    assert dtutil.next_dt(datetime(2022, 11, 5, 16, 38, 30), Interval.QUARTER) == datetime(2023, 1, 1)
+
+
+def _edges_loop(start_dt, end_dt, interval, week_start=dtutil.MONDAY):
+    """Bin edges computed with the scalar functions, the reference for dtutil.edges and dtutil.edge_epochs"""
+    edges = []
+    curr_dt = start_dt
+    while curr_dt < end_dt:
+        edges.append(curr_dt)
+        curr_dt = dtutil.next_dt(curr_dt, interval, week_start)
+    edges.append(curr_dt)
+    return edges
+
+
+@pytest.mark.parametrize("interval", list(Interval))
+@pytest.mark.parametrize(
+    "start_dt,end_dt",
+    [
+        (datetime(2021, 1, 1), datetime(2023, 1, 1)),
+        # Neither end on an edge
+        (datetime(2020, 2, 29, 13, 17), datetime(2022, 11, 13, 7, 45)),
+        # Empty and shorter than a bin
+        (datetime(2022, 10, 5), datetime(2022, 10, 5)),
+        (datetime(2022, 10, 5, 16, 30), datetime(2022, 10, 5, 16, 40)),
+        (datetime(2022, 10, 5), datetime(2022, 1, 1)),
+    ],
+)
+def test_edges_match_next_dt(local_timezone, interval, start_dt, end_dt):
+    expected = _edges_loop(start_dt, end_dt, interval)
+    assert dtutil.edges(start_dt, end_dt, interval, dtutil.MONDAY).astype(datetime).tolist() == expected
+    assert dtutil.edge_epochs(start_dt, end_dt, interval, dtutil.MONDAY).tolist() == [e.timestamp() for e in expected]
+
+
+@pytest.mark.parametrize("interval", list(Interval))
+def test_advance_matches_next_dt(interval):
+    edge_dt = dtutil.next_dt(datetime(2020, 2, 29, 13, 17), interval)
+    expected = _edges_loop(edge_dt, datetime(2024, 1, 1), interval)
+    assert [dtutil.advance(edge_dt, interval, steps) for steps in range(len(expected))] == expected
+
+
+def test_edges_week_start():
+    start_dt = datetime(2022, 10, 2)  # a Sunday
+    end_dt = datetime(2022, 12, 1)
+    expected = _edges_loop(start_dt, end_dt, Interval.WEEK, dtutil.SUNDAY)
+    assert dtutil.edges(start_dt, end_dt, Interval.WEEK, dtutil.SUNDAY).astype(datetime).tolist() == expected
+    # By default weeks start on the weekday of start_dt
+    assert dtutil.edges(start_dt, end_dt, Interval.WEEK).astype(datetime).tolist() == expected
+
+
+@pytest.mark.parametrize("local_timezone", ["Europe/Berlin"], indirect=True)
+def test_local_epochs_skipped_and_repeated_times(local_timezone):
+    # 2:30 doesn't exist on the first day and exists twice on the second
+    local_dts = [datetime(2022, 3, 27, 2, 30), datetime(2022, 10, 30, 2, 30), datetime(2022, 10, 30, 3)]
+    assert dtutil.local_epochs(np.array(local_dts, dtype="datetime64[s]")).tolist() == [
+        local_dt.timestamp() for local_dt in local_dts
+    ]
+
+
+TIMEZONES = ["UTC", "Europe/Berlin", "America/New_York", "Australia/Lord_Howe", "Asia/Kolkata"]
+
+
+@pytest.mark.parametrize("tz", TIMEZONES)
+def test_local_epochs_in_timezone(utc_timezone, tz):
+    # The server's timezone doesn't matter
+    local_dts = dtutil.edges(datetime(2021, 1, 1), datetime(2023, 1, 1), Interval.HOUR)
+    expected = [local_dt.replace(tzinfo=ZoneInfo(tz)).timestamp() for local_dt in local_dts.astype(datetime)]
+    assert dtutil.local_epochs(local_dts, tz).tolist() == expected
+
+
+def test_local_epochs_in_timezone_skipped_and_repeated_times(utc_timezone):
+    local_dts = [datetime(2022, 3, 27, 2, 30), datetime(2022, 10, 30, 2, 30), datetime(2022, 10, 30, 3)]
+    assert dtutil.local_epochs(np.array(local_dts, dtype="datetime64[s]"), "Europe/Berlin").tolist() == [
+        local_dt.replace(tzinfo=ZoneInfo("Europe/Berlin")).timestamp() for local_dt in local_dts
+    ]
+
+
+@pytest.mark.parametrize("tz", TIMEZONES)
+def test_wall_epochs_in_timezone(utc_timezone, tz):
+    # Every 20 minutes of 2021 and 2022
+    epochs = np.arange(1609459200, 1672531200, 1200)
+    expected = [
+        datetime.fromtimestamp(epoch, ZoneInfo(tz)).replace(tzinfo=timezone.utc).timestamp() for epoch in epochs
+    ]
+    assert dtutil.wall_epochs(epochs, tz).tolist() == expected
+
+
+def test_wall_epochs_of_local_time(local_timezone):
+    epochs = np.arange(1609459200, 1672531200, 1200)
+    assert dtutil.wall_epochs(epochs).tolist() == dtutil.wall_epochs(epochs, local_timezone).tolist()
+
+
+def test_wall_epochs_inverts_local_epochs():
+    local_dts = dtutil.edges(datetime(2021, 1, 1), datetime(2023, 1, 1), Interval.DAY)
+    walls = dtutil.wall_epochs(dtutil.local_epochs(local_dts, "America/New_York"), "America/New_York")
+    assert walls.tolist() == local_dts.astype(np.int64).tolist()
+
+
+def test_wall_epochs_empty():
+    assert dtutil.wall_epochs(np.array([], dtype=np.int64), "Europe/Berlin").tolist() == []
+
+
+def test_from_epoch_and_to_timezone():
+    epoch = datetime(2022, 10, 30, 0, 30, tzinfo=timezone.utc).timestamp()
+    assert dtutil.from_epoch(epoch, "Europe/Berlin") == datetime(2022, 10, 30, 2, 30)
+    assert dtutil.from_epoch(epoch + 3600, "Europe/Berlin") == datetime(2022, 10, 30, 2, 30)
+    aware_dt = datetime(2022, 10, 30, 12, tzinfo=ZoneInfo("Asia/Kolkata"))
+    assert dtutil.to_timezone(aware_dt, "America/New_York") == datetime(2022, 10, 30, 2, 30)
+
+
+def test_parse_datetime():
+    epoch = int(datetime(2022, 10, 30, 0, 30, tzinfo=timezone.utc).timestamp())
+    assert dtutil.parse_datetime(str(epoch), "Europe/Berlin") == datetime(2022, 10, 30, 2, 30)
+    assert dtutil.parse_datetime("2022-10-30", "Europe/Berlin") == datetime(2022, 10, 30)
+    assert dtutil.parse_datetime("2022-10-30T12:00+05:30", "America/New_York") == datetime(2022, 10, 30, 2, 30)
+
+
+@pytest.mark.parametrize("value", ["100000000000000000000", "9999-12-31T23:00-05:00", "yesterday"])
+def test_parse_datetime_rejects_invalid_values(value):
+    with pytest.raises(ValueError):
+        dtutil.parse_datetime(value, "Europe/Berlin")
+
+
+def test_check_timezone():
+    dtutil.check_timezone(None)
+    dtutil.check_timezone("Europe/Berlin")
+    for tz in ("Mars/Olympus_Mons", "../etc/passwd", ""):
+        with pytest.raises(ValueError):
+            dtutil.check_timezone(tz)
@@ -0,0 +1,164 @@
+import datetime as dt
+import json
+
+import pytest
+
+from cryptoadvance.specterext.stacktrack.helpers import plot
+from cryptoadvance.specterext.stacktrack.helpers.cache import HistoryCache, tx_fingerprint
+from cryptoadvance.specterext.stacktrack.helpers.events import ChartEventStream, SharedPoll, series_delta
+from cryptoadvance.specterext.stacktrack.helpers.tx_series import TxSeries
+from fix_txs import FakeTx
+
+
+class FakeWallet:
+    """Stands in for a Wallet whose txs (and the chain tip) change while its chart is open"""
+
+    def __init__(self, txs: list, tip_height: int = 1000):
+        self.fullpath = "/fake/wallet.json"
+        self.txs = list(txs)
+        self.tip_height = tip_height
+        self.changes = []
+
+    def txlist(self) -> list:
+        return list(self.txs)
+
+    def receive(self, sats: int, time: dt.datetime = None):
+        txid = f"received-{len(self.txs)}"
+        tx_time = int((time or dt.datetime.now()).timestamp())
+        self.txs.insert(0, FakeTx(txid=txid, time=tx_time, blockheight=None, flow_amount=sats / 100_000_000))
+        self.txs.sort(key=lambda tx: tx["time"], reverse=True)
+
+    def sleep(self, seconds):
+        """Applies the next change, as if it happened while the stream waited"""
+        if self.changes:
+            self.changes.pop(0)()
+
+
+@pytest.fixture
+def wallet(recent_txs):
+    return FakeWallet(recent_txs(200))
+
+
+def chart_events(wallet: FakeWallet, span: str):
+    """The events of the wallet's chart stream, parsed into (event, data) tuples. Keepalives are None."""
+    history_cache = HistoryCache()
+
+    def fingerprint():
+        txs = wallet.txlist()
+        return tx_fingerprint(txs, wallet.tip_height), plot.span_window(span, TxSeries.from_txs(txs))
+
+    def build_series():
+        return plot.series_from_df(history_cache.get_frame(wallet.fullpath, wallet.txlist(), wallet.tip_height, span))
+
+    stream = ChartEventStream(
+        fingerprint, build_series, poll_seconds=0, max_seconds=60, keepalive_seconds=0, sleep=wallet.sleep
+    )
+    for message in stream:
+        if message.startswith("event: "):
+            event_line, data_line = message.strip().split("\n")
+            yield event_line[len("event: "):], json.loads(data_line[len("data: "):])
+        elif message.startswith(": keepalive"):
+            yield None
+
+
+def apply_delta(series: dict, delta: dict) -> dict:
+    """Does what stacktrackApplyDelta() in chart.js does"""
+    series = {column: list(values) for column, values in series.items()}
+    for i, bin_index in enumerate(delta["bins"]):
+        series["in"][bin_index] = delta["in"][i]
+        series["out"][bin_index] = delta["out"][i]
+    series["cumulative"][delta["tail_start"]:] = delta["tail"]
+    return series
+
+
+def current_series(wallet: FakeWallet, span: str) -> dict:
+    return plot.series_from_df(plot.build_frame(span, TxSeries.from_txs(wallet.txlist())))
+
+
+@pytest.mark.parametrize("span", ["1d", "1y", "all"])
+def test_stream_sends_deltas_for_new_txs(wallet, span):
+    events = chart_events(wallet, span)
+    event, series = next(events)
+    assert event == "series"
+    assert series == current_series(wallet, span)
+
+    wallet.changes = [lambda: wallet.receive(5_000), lambda: wallet.receive(-2_000)]
+    for _ in range(2):
+        event, delta = next(events)
+        assert event == "delta"
+        assert len(delta["bins"]) == 1
+        series = apply_delta(series, delta)
+        assert series == current_series(wallet, span)
+    assert next(events) is None
+
+
+def test_stream_skips_unchanged_series(wallet):
+    events = chart_events(wallet, "1y")
+    next(events)
+    # A new block without new txs changes the fingerprint, but not the chart
+    wallet.changes = [lambda: setattr(wallet, "tip_height", wallet.tip_height + 1)]
+    assert next(events) is None
+
+
+def test_stream_sends_series_when_bins_move(wallet, monkeypatch):
+    events = chart_events(wallet, "1y")
+    next(events)
+    # A month later, the 1y chart has other bins
+    window = plot.span_window("1y", TxSeries.empty())
+    later = (window[0].replace(year=window[0].year + 1), window[1].replace(year=window[1].year + 1), window[2])
+    wallet.changes = [lambda: monkeypatch.setattr(plot, "_span_window_1y", lambda series, tz: later)]
+    event, series = next(events)
+    assert event == "series"
+    assert series == plot.series_from_df(plot.build_window_frame(later, TxSeries.from_txs(wallet.txlist())))
+
+
+def test_stream_ends(wallet):
+    stream = ChartEventStream(lambda: 1, lambda: current_series(wallet, "1y"), poll_seconds=0, max_seconds=0)
+    messages = list(stream)
+    assert messages[0].startswith("retry: ")
+    assert messages[1].startswith("event: series\n")
+    assert len(messages) == 2
+
+
+def test_stream_ends_on_errors(wallet, caplog):
+    def fail():
+        raise Exception("node went away")
+
+    assert len(list(ChartEventStream(fail, None, poll_seconds=0, max_seconds=60))) == 1
+    assert "node went away" in caplog.text
+
+
+def test_shared_poll_reuses_recent_results():
+    now = [0.0]
+    polls = []
+
+    def poll(key):
+        polls.append(key)
+        return len(polls)
+
+    shared = SharedPoll(poll_seconds=5, clock=lambda: now[0])
+    # Two streams of the same wallet, and one of another wallet
+    assert shared.get("a", lambda: poll("a")) == 1
+    assert shared.get("a", lambda: poll("a")) == 1
+    assert shared.get("b", lambda: poll("b")) == 2
+    now[0] = 4.9
+    assert shared.get("a", lambda: poll("a")) == 1
+    now[0] = 5
+    assert shared.get("a", lambda: poll("a")) == 3
+    assert polls == ["a", "b", "a"]
+
+
+def test_series_delta():
+    old = {"timestamp": [1, 2, 3], "in": [5, 0, 0], "out": [0, -1, 0], "cumulative": [5, 4, 4]}
+    new = {"timestamp": [1, 2, 3], "in": [5, 3, 0], "out": [0, -1, 0], "cumulative": [5, 7, 7]}
+    assert series_delta(old, new) == {"bins": [1], "in": [3], "out": [-1], "tail_start": 1, "tail": [7, 7]}
+    assert series_delta(old, old) == {"bins": [], "in": [], "out": [], "tail_start": 3, "tail": []}
+    # A tx before the first bin only changes the cumulative amounts
+    before = dict(old, cumulative=[6, 5, 5])
+    assert series_delta(old, before) == {"bins": [], "in": [], "out": [], "tail_start": 0, "tail": [6, 5, 5]}
+    assert series_delta(old, dict(new, timestamp=[2, 3, 4])) is None
+    # Changes to the pending overlay resend the whole series
+    pending = dict(old, pending=[0, 0, 7], pending_cumulative=[5, 4, 11])
+    assert series_delta(old, pending) is None
+    assert series_delta(pending, old) is None
+    assert series_delta(pending, dict(pending)) == series_delta(old, old)
@@ -0,0 +1,99 @@
+import csv
+import datetime as dt
+import io
+
+import numpy as np
+import pytest
+
+from cryptoadvance.specterext.stacktrack.helpers import dtutil, export, plot
+from cryptoadvance.specterext.stacktrack.helpers.core import Interval
+from cryptoadvance.specterext.stacktrack.helpers.tx_series import TxSeries
+
+
+@pytest.fixture
+def series(synthetic_txs):
+    return TxSeries.from_txs(synthetic_txs(2000, start=dt.datetime(2015, 1, 1), end=dt.datetime(2023, 1, 1)))
+
+
+def _read_csv(chunks) -> list:
+    return list(csv.reader(io.StringIO("".join(chunks))))
+
+
+@pytest.mark.parametrize("interval", list(Interval))
+@pytest.mark.parametrize("start_dt", [dt.datetime(2016, 1, 1), dt.datetime(2016, 2, 17, 13, 30)])
+def test_chunk_end_is_an_edge(interval, start_dt):
+    edges = dtutil.edges(start_dt, dt.datetime(2030, 1, 1), interval, start_dt.weekday())
+    for bins in (1, 2, 7, 40):
+        assert np.datetime64(export.chunk_end(start_dt, interval, bins, start_dt.weekday()), "s") == edges[bins]
+
+
+@pytest.mark.parametrize("interval", list(Interval))
+def test_chunk_end_past_year_9999(interval):
+    assert export.chunk_end(dt.datetime(9999, 8, 1), interval, export.CHUNK_BINS, 0) == dt.datetime.max
+
+
+def test_export_csv_up_to_year_9999():
+    window = (dt.datetime(9999, 12, 1), dt.datetime(9999, 12, 31, 5), Interval.HOUR)
+    rows = list(csv.reader(io.StringIO("".join(export.export_csv(TxSeries.empty(), window, "UTC")))))
+    assert len(rows) == 1 + 30 * 24 + 5
+
+
+@pytest.mark.parametrize("interval", list(Interval))
+@pytest.mark.parametrize("chunk_bins", [1, 7, export.CHUNK_BINS])
+def test_iter_bins_matches_frame(utc_timezone, series, interval, chunk_bins):
+    window = (dt.datetime(2016, 2, 17, 13, 30), dt.datetime(2022, 6, 1), interval)
+    df = plot.build_window_frame(window, series)
+    chunks = list(export.iter_bins(series, window, chunk_bins=chunk_bins))
+    assert all(len(bins) <= chunk_bins for _, bins, _ in chunks)
+    assert np.concatenate([bins for _, bins, _ in chunks]).tolist() == df["sats"].tolist()
+    assert np.concatenate([cumulative for _, _, cumulative in chunks]).tolist() == df["sats_cusum"].tolist()
+
+
+def test_export_csv_matches_frame(utc_timezone, series):
+    window = plot.span_window("all", series)
+    df = plot.build_window_frame(window, series)
+    rows = _read_csv(export.export_csv(series, window, chunk_bins=10))
+    assert rows[0] == list(export.COLUMNS)
+    assert len(rows) == len(df) + 1
+    assert [row[0] for row in rows[1:]] == [f"{ts.isoformat()}+00:00" for ts in df["timestamp"]]
+    sats = df["sats"].to_numpy()
+    assert [int(row[1]) for row in rows[1:]] == np.maximum(sats, 0).tolist()
+    assert [int(row[2]) for row in rows[1:]] == np.minimum(sats, 0).tolist()
+    assert [int(row[3]) for row in rows[1:]] == df["sats_cusum"].tolist()
+
+
+def test_export_csv_in_timezone(series):
+    # The clocks go back on 2022-10-30
+    window = (dt.datetime(2022, 10, 29), dt.datetime(2022, 11, 1), Interval.DAY)
+    rows = _read_csv(export.export_csv(series, window, "Europe/Berlin"))
+    assert [row[0] for row in rows[1:]] == [
+        "2022-10-29T00:00:00+02:00", "2022-10-30T00:00:00+02:00", "2022-10-31T00:00:00+01:00"
+    ]
+
+
+def test_export_csv_is_lazy(series, monkeypatch):
+    # A decade of hourly bins is only binned a chunk at a time
+    window = (dt.datetime(2013, 1, 1), dt.datetime(2023, 1, 1), Interval.HOUR)
+    binned = []
+    bin_sats = TxSeries.bin_sats
+    monkeypatch.setattr(TxSeries, "bin_sats", lambda self, edges: binned.append(len(edges)) or bin_sats(self, edges))
+    chunks = export.export_csv(series, window)
+    next(chunks)
+    next(chunks)
+    assert binned == [export.CHUNK_BINS + 1]
+    assert sum(chunk.count("\n") for chunk in chunks) == len(dtutil.edges(*window)) - 1 - export.CHUNK_BINS
+    assert max(binned) == export.CHUNK_BINS + 1
+
+
+def test_export_csv_without_txs():
+    window = (dt.datetime(2022, 10, 5), dt.datetime(2022, 10, 6), Interval.HOUR)
+    rows = _read_csv(export.export_csv(TxSeries.empty(), window, "UTC"))
+    assert len(rows) == 25
+    assert all(row[1:] == ["0", "0", "0"] for row in rows[1:])
+
+
+@pytest.mark.parametrize(
+    "offset,expected", [(0, "+00:00"), (7200, "+02:00"), (-16200, "-04:30"), (37800, "+10:30"), (-3601, "-01:00:01")]
+)
+def test_format_offset(offset, expected):
+    assert export._format_offset(offset) == expected
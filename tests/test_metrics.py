@@ -0,0 +1,63 @@
+import pytest
+
+from cryptoadvance.specterext.stacktrack.helpers import metrics
+
+
+def test_wallet_size_bucket():
+    assert metrics.wallet_size_bucket(None) == "unknown"
+    assert metrics.wallet_size_bucket(0) == "<1k"
+    assert metrics.wallet_size_bucket(999) == "<1k"
+    assert metrics.wallet_size_bucket(1_000) == "<10k"
+    assert metrics.wallet_size_bucket(250_000) == "<1M"
+    assert metrics.wallet_size_bucket(5_000_000) == ">=1M"
+
+
+def test_counter():
+    registry = metrics.Registry()
+    counter = registry.counter("requests_total", "Requests", ("result",))
+    counter.inc(result="hit")
+    counter.inc(2, result="hit")
+    counter.inc(result='a "quoted"\nvalue')
+    assert counter.get(result="hit") == 3
+    assert registry.expose() == (
+        "# HELP requests_total Requests\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{result="a \\"quoted\\"\\nvalue"} 1\n'
+        'requests_total{result="hit"} 3\n'
+    )
+    with pytest.raises(ValueError):
+        counter.inc(other="label")
+
+
+def test_histogram():
+    registry = metrics.Registry()
+    histogram = registry.histogram("stage_seconds", "Stages", ("stage",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, stage="frame")
+    assert histogram.count(stage="frame") == 4
+    assert registry.expose() == (
+        "# HELP stage_seconds Stages\n"
+        "# TYPE stage_seconds histogram\n"
+        'stage_seconds_bucket{stage="frame",le="0.1"} 2\n'
+        'stage_seconds_bucket{stage="frame",le="1"} 3\n'
+        'stage_seconds_bucket{stage="frame",le="+Inf"} 4\n'
+        'stage_seconds_sum{stage="frame"} 3.65\n'
+        'stage_seconds_count{stage="frame"} 4\n'
+    )
+
+
+def test_stage_timer():
+    before = metrics.STAGE_SECONDS.count(stage="txlist", span="1w", wallet_size="<10k")
+    timer = metrics.StageTimer(span="1w")
+    with timer.stage("txlist"):
+        pass
+    with pytest.raises(KeyError):
+        with timer.stage("txlist"):
+            raise KeyError()
+    # Nothing is recorded until the wallet size is known
+    assert metrics.STAGE_SECONDS.count(stage="txlist", span="1w", wallet_size="<10k") == before
+    timer.num_txs = 5_000
+    timer.record()
+    assert metrics.STAGE_SECONDS.count(stage="txlist", span="1w", wallet_size="<10k") == before + 2
+    timer.record()
+    assert metrics.STAGE_SECONDS.count(stage="txlist", span="1w", wallet_size="<10k") == before + 2
@@ -0,0 +1,165 @@
+import datetime as dt
+import json
+import re
+
+import pandas as pd
+import pytest
+
+from cryptoadvance.specterext.stacktrack.helpers import binning, dtutil, plot
+from cryptoadvance.specterext.stacktrack.helpers.core import Interval
+from cryptoadvance.specterext.stacktrack.helpers.tx_series import TxSeries
+
+
+def test_series_from_df(utc_timezone):
+    edges = binning.bin_edges(dt.datetime(2022, 10, 5), dt.datetime(2022, 10, 8), Interval.DAY)
+    df = binning.frame_from_bins(edges, pd.Series([5, -3, 0]).to_numpy(), 10)
+    assert plot.series_from_df(df) == {
+        "timestamp": [1664928000, 1665014400, 1665100800],
+        "in": [5, 0, 0],
+        "out": [0, -3, 0],
+        "cumulative": [15, 12, 12],
+    }
+    binning.add_pending(df, edges, pd.Series([1665100900]).to_numpy(), pd.Series([-2]).to_numpy())
+    series = plot.series_from_df(df)
+    assert series["pending"] == [0, 0, -2]
+    assert series["pending_cumulative"] == [15, 12, 10]
+
+
+def test_chart_layout_json():
+    layout = json.loads(plot.chart_layout_json())
+    assert layout["title"]["text"] == "Balance"
+    assert layout["xaxis"]["type"] == "date"
+    # The named template is expanded, since plotly.js doesn't know about it
+    assert isinstance(layout["template"], dict)
+    assert layout["template"]["layout"]["paper_bgcolor"] == "rgb(17,17,17)"
+
+
+def test_build_chart_from_df_does_not_inline_plotly_js(synthetic_txs):
+    chart = plot.build_chart_from_df(plot.build_frame("1y", TxSeries.from_txs(synthetic_txs(10))))
+    assert chart.startswith("<div>")
+    assert len(chart) < 100_000
+
+
+def test_span_window_rejects_illegal_spans():
+    with pytest.raises(ValueError, match="Illegal span"):
+        plot.span_window("2y", TxSeries.empty())
+    # Not a span, even though there's a function with that name
+    with pytest.raises(ValueError, match="Illegal span"):
+        plot.span_window("all(", TxSeries.empty())
+
+
+@pytest.mark.parametrize(
+    "start_dt,end_dt,interval",
+    [
+        (dt.datetime(2022, 10, 5, 3), dt.datetime(2022, 10, 7, 12), Interval.HOUR),
+        (dt.datetime(2022, 8, 1), dt.datetime(2022, 10, 5), Interval.DAY),
+        (dt.datetime(2021, 10, 5), dt.datetime(2022, 10, 5), Interval.WEEK),
+        (dt.datetime(2015, 3, 14), dt.datetime(2022, 10, 5), Interval.MONTH),
+        (dt.datetime(2002, 3, 14), dt.datetime(2022, 10, 5), Interval.QUARTER),
+    ],
+)
+def test_plan_window_picks_interval(start_dt, end_dt, interval):
+    window = plot.plan_window(start_dt, end_dt, 60)
+    assert window[2] == interval
+    num_bins = len(binning.bin_edges(*window)) - 1
+    assert 20 < num_bins < 180
+
+
+def test_plan_window_snaps_to_whole_bins():
+    assert plot.plan_window(dt.datetime(2022, 8, 1, 12, 30), dt.datetime(2022, 10, 5, 1), 60) == (
+        dt.datetime(2022, 8, 1),
+        dt.datetime(2022, 10, 6),
+        Interval.DAY,
+    )
+    # An end on a bin edge stays where it is
+    assert plot.plan_window(dt.datetime(2022, 8, 1), dt.datetime(2022, 10, 5), 60)[1] == dt.datetime(2022, 10, 5)
+
+
+def test_widen_window():
+    assert plot.widen_window(dt.datetime(2020, 1, 1), dt.datetime(2021, 1, 1), Interval.QUARTER) == (
+        dt.datetime(2020, 1, 1),
+        dt.datetime(2021, 1, 1),
+        Interval.QUARTER,
+    )
+    assert plot.widen_window(dt.datetime(2022, 8, 3, 12), dt.datetime(2022, 8, 10, 1), Interval.WEEK, dtutil.SUNDAY) == (
+        dt.datetime(2022, 7, 31),
+        dt.datetime(2022, 8, 14),
+        Interval.WEEK,
+    )
+
+
+def test_plan_window_rejects_invalid_ranges():
+    with pytest.raises(ValueError, match="before its end"):
+        plot.plan_window(dt.datetime(2022, 10, 5), dt.datetime(2022, 10, 5), 60)
+    with pytest.raises(ValueError, match="too long"):
+        plot.plan_window(dt.datetime(1, 1, 1), dt.datetime(2022, 10, 5), 60)
+    # Widened to whole days, the end would be in year 10000
+    with pytest.raises(ValueError, match="out of range"):
+        plot.plan_window(dt.datetime(9999, 12, 1), dt.datetime(9999, 12, 31, 5), 60)
+    with pytest.raises(ValueError, match="out of range"):
+        plot.widen_window(dt.datetime(9999, 12, 1), dt.datetime(9999, 12, 31, 23, 30), Interval.HOUR)
+
+
+def test_plan_window_week_start():
+    start_dt, end_dt, interval = plot.plan_window(dt.datetime(2021, 10, 5), dt.datetime(2022, 10, 5), 60, dtutil.SUNDAY)
+    assert interval == Interval.WEEK
+    assert start_dt == dt.datetime(2021, 10, 3)
+    assert end_dt == dt.datetime(2022, 10, 9)
+
+
+@pytest.mark.parametrize("count", [0, 1, 500])
+def test_build_frames_matches_build_frame(recent_txs, count):
+    series = TxSeries.from_txs(recent_txs(count))
+    frames = plot.build_frames(series)
+    assert list(frames) == list(plot.SPANS)
+    for span, df in frames.items():
+        pd.testing.assert_frame_equal(df, plot.build_frame(span, series))
+
+
+def test_build_window_frames(synthetic_txs):
+    series = TxSeries.from_txs(synthetic_txs(500))
+    windows = {
+        "weeks": plot.plan_window(dt.datetime(2021, 10, 5), dt.datetime(2022, 10, 5), 60),
+        "quarters": (dt.datetime(2015, 1, 1), dt.datetime(2025, 1, 1), Interval.QUARTER),
+    }
+    frames = plot.build_window_frames(windows, series)
+    for name, window in windows.items():
+        pd.testing.assert_frame_equal(frames[name], plot.build_window_frame(window, series))
+
+
+def without_div_ids(html: str) -> str:
+    # plotly gives every chart div a random id
+    return re.sub(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", "<id>", html)
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+@pytest.mark.parametrize("count", [0, 1, 500])
+def test_build_chart_from_df_matches_plotly(recent_txs, monkeypatch, use_orjson, count):
+    if not use_orjson:
+        monkeypatch.setattr(plot, "orjson", None)
+    elif plot.orjson is None:
+        pytest.skip("orjson isn't installed")
+    series = TxSeries.from_txs(recent_txs(count))
+    for span in plot.SPANS:
+        df = plot.build_frame(span, series)
+        html = plot.build_chart_from_df(df)
+        assert without_div_ids(html) == without_div_ids(plot.figure_html(plot.build_figure(df)))
+    # Every chart gets its own div
+    assert plot.build_chart_from_df(df) != plot.build_chart_from_df(df)
+
+
+def test_build_chart_from_df_with_pending_matches_plotly(recent_txs):
+    series = TxSeries.from_txs(recent_txs(500))
+    df = plot.build_frame("1m", series)
+    df["pending_sats"] = 0
+    df.loc[len(df) - 1, "pending_sats"] = 70_000
+    df["pending_cusum"] = df["sats_cusum"] + df["pending_sats"].cumsum()
+    html = plot.build_chart_from_df(df)
+    assert without_div_ids(html) == without_div_ids(plot.figure_html(plot.build_figure(df)))
+    assert "Pending" in html
+
+
+def test_chart_template_is_immutable():
+    traces, _, _ = plot._chart_template()
+    with pytest.raises(TypeError):
+        traces[0]["x"] = [1]
@@ -0,0 +1,70 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from cryptoadvance.specterext.stacktrack.helpers import plot
+from cryptoadvance.specterext.stacktrack.helpers.cache import HistoryCache
+from cryptoadvance.specterext.stacktrack.helpers.precompute import SpanPrecomputer
+from cryptoadvance.specterext.stacktrack.helpers.tx_series import TxSeries
+
+
+class BlockingCache(HistoryCache):
+    """Records the precomputed txs and blocks the worker until it's released"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+        self.precomputed = []
+
+    def precompute(self, key, txs, tip_height, spans=plot.SPANS, tz=None):
+        self.release.wait(5)
+        super().precompute(key, txs, tip_height, spans, tz)
+        self.precomputed.append((key, len(txs)))
+
+
+@pytest.fixture
+def txs(recent_txs):
+    return recent_txs(500)
+
+
+def wait_for(precomputer: SpanPrecomputer):
+    precomputer._executor.submit(lambda: None).result(timeout=5)
+
+
+def test_submit_precomputes_all_spans(txs):
+    cache = HistoryCache()
+    precomputer = SpanPrecomputer(cache)
+    precomputer.submit("w", txs, 100)
+    wait_for(precomputer)
+    assert set(cache._entries["w"].frames) == set(plot.SPANS)
+    for span in plot.SPANS:
+        expected = plot.build_frame(span, TxSeries.from_txs(txs))
+        pd.testing.assert_frame_equal(cache.get_frame("w", txs, 100, span), expected)
+    precomputer.shutdown()
+
+
+def test_submit_queues_a_wallet_once(txs):
+    cache = BlockingCache()
+    precomputer = SpanPrecomputer(cache)
+    precomputer.submit("other", txs, 100)
+    # While the worker is busy, later submits of a queued wallet only update its txs
+    for count in (100, 200, 300):
+        precomputer.submit("w", txs[-count:], 100)
+    cache.release.set()
+    wait_for(precomputer)
+    assert cache.precomputed == [("other", 500), ("w", 300)]
+    precomputer.shutdown()
+
+
+def test_failing_precompute_is_logged(txs, caplog, monkeypatch):
+    cache = HistoryCache()
+    precomputer = SpanPrecomputer(cache)
+    monkeypatch.setattr(cache, "precompute", lambda *args: 1 / 0)
+    precomputer.submit("w", txs, 100)
+    wait_for(precomputer)
+    assert "Precomputing the charts of w failed" in caplog.text
+    # The wallet can be queued again
+    precomputer.submit("w", txs, 100)
+    wait_for(precomputer)
+    precomputer.shutdown()
@@ -0,0 +1,30 @@
+import os
+
+from cryptoadvance.specterext.stacktrack.helpers import profiling
+
+
+def slow_sum(n: int) -> int:
+    return sum(square(i) for i in range(n))
+
+
+def square(i: int) -> int:
+    return i * i
+
+
+def test_profile_call():
+    result, report = profiling.profile_call(slow_sum, 10_000)
+    assert result == sum(i * i for i in range(10_000))
+    assert report.startswith("Total: ")
+    assert "cumulative time" in report
+    assert "(slow_sum)" in report
+    assert "(square)" in report
+    # Sorted by cumulative time: the profiled function comes before the ones it calls
+    assert report.index("(slow_sum)") < report.index("(square)")
+
+
+def test_store_report(tmp_path):
+    path = profiling.store_report(str(tmp_path / "profiles"), "stacktrack_endpoint.wallets_overview", "report")
+    assert os.path.dirname(path) == str(tmp_path / "profiles")
+    assert path.endswith("-stacktrack_endpoint.wallets_overview.txt")
+    with open(path) as f:
+        assert f.read() == "report"
@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from cryptoadvance.specterext.stacktrack.helpers.refresh import WalletRefresher
+
+
+class SlowWallet:
+    """A wallet whose refresh waits for the given barrier or event first, so the tests control when it finishes"""
+
+    def __init__(self, alias: str, wait_for=None, fail: bool = False):
+        self.alias = alias
+        self.fullpath = f"/fake/{alias}.json"
+        self.wait_for = wait_for
+        self.fail = fail
+        self.updates = 0
+        self.refreshes = 0
+        self.lock = threading.Lock()
+
+    def update_balance(self):
+        with self.lock:
+            self.updates += 1
+        if self.wait_for is not None:
+            self.wait_for.wait(timeout=5)
+        if self.fail:
+            raise Exception("node went away")
+
+    def check_utxo(self):
+        with self.lock:
+            self.refreshes += 1
+
+
+@pytest.fixture
+def refresher():
+    refresher = WalletRefresher(max_workers=4, timeout=0.1)
+    yield refresher
+    refresher.shutdown()
+
+
+@pytest.fixture
+def release():
+    """An event which slow wallets wait for, it's set when the test ends so their refreshes don't outlive it"""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def test_refresh_runs_in_parallel(refresher):
+    # Each refresh waits until all four are running, which only happens if they run side by side
+    barrier = threading.Barrier(4)
+    wallets = [SlowWallet(f"w{i}", wait_for=barrier) for i in range(4)]
+    refresher.timeout = 5
+    assert refresher.refresh(wallets) == []
+    assert not barrier.broken
+    assert all(wallet.refreshes == 1 for wallet in wallets)
+
+
+def test_refresh_marks_slow_wallets_stale(refresher, release):
+    fast = SlowWallet("fast")
+    slow = SlowWallet("slow", wait_for=release)
+    assert refresher.refresh([fast, slow]) == [slow]
+    assert fast.refreshes == 1
+    assert slow.refreshes == 0
+
+
+def test_refresh_marks_failing_wallets_stale(refresher):
+    ok = SlowWallet("ok")
+    failing = SlowWallet("failing", fail=True)
+    assert refresher.refresh([ok, failing]) == [failing]
+
+
+def test_refresh_does_not_run_twice_for_a_wallet(refresher, release):
+    slow = SlowWallet("slow", wait_for=release)
+    assert refresher.refresh([slow]) == [slow]
+    # The first refresh is still running, so this one waits for it instead of starting another
+    assert refresher.refresh([slow]) == [slow]
+    release.set()
+    refresher._running[slow.fullpath].result(timeout=5)
+    assert slow.updates == 1
+    assert slow.refreshes == 1
@@ -0,0 +1,102 @@
+import datetime as dt
+import re
+import threading
+import time
+
+import pytest
+
+from cryptoadvance.specterext.stacktrack.helpers import plot
+from cryptoadvance.specterext.stacktrack.helpers.render_pool import RENDER_REQUESTS, RenderPool
+from cryptoadvance.specterext.stacktrack.helpers.tx_series import TxSeries
+
+
+def without_div_ids(html: str) -> str:
+    # plotly gives every chart div a random id
+    return re.sub(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", "<id>", html)
+
+
+def slow_square(x: int, seconds: float) -> int:
+    time.sleep(seconds)
+    return x * x
+
+
+@pytest.fixture
+def df(recent_txs):
+    series = TxSeries.from_txs(recent_txs(500))
+    return plot.build_frame("1y", series)
+
+
+def test_chart_arrays_round_trip(df):
+    html = plot.chart_html_from_arrays(*plot.chart_arrays(df))
+    assert without_div_ids(html) == without_div_ids(plot.build_chart_from_df(df.copy()))
+
+
+def test_chart_arrays_empty():
+    window = (dt.datetime(2022, 1, 1), dt.datetime(2022, 1, 1), plot.Interval.DAY)
+    empty = plot.build_window_frame(window, TxSeries.empty())
+    timestamps, sats, prior_count, pending_sats, _ = plot.chart_arrays(empty)
+    assert len(timestamps) == len(sats) == 0
+    assert prior_count == 0
+    assert pending_sats is None
+
+
+def test_chart_arrays_round_trip_with_pending(df):
+    df["pending_sats"] = 0
+    df.loc[len(df) - 1, "pending_sats"] = -5_000
+    df["pending_cusum"] = df["sats_cusum"] + df["pending_sats"].cumsum()
+    html = plot.chart_html_from_arrays(*plot.chart_arrays(df))
+    assert without_div_ids(html) == without_div_ids(plot.build_chart_from_df(df.copy()))
+
+
+@pytest.mark.slow
+def test_render_in_pool(df):
+    pool = RenderPool(1, max_pending=2, timeout=60)
+    try:
+        before = RENDER_REQUESTS.get(result="pool")
+        html = pool.render(plot.chart_html_from_arrays, *plot.chart_arrays(df))
+        assert without_div_ids(html) == without_div_ids(plot.build_chart_from_df(df.copy()))
+        assert RENDER_REQUESTS.get(result="pool") == before + 1
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.slow
+def test_render_falls_back_when_busy():
+    pool = RenderPool(1, max_pending=1, timeout=60)
+    try:
+        results = []
+        worker = threading.Thread(target=lambda: results.append(pool.render(slow_square, 3, 1)))
+        worker.start()
+        while pool._slots._value:
+            time.sleep(0.01)
+        before = RENDER_REQUESTS.get(result="fallback")
+        # The only slot is taken, so this doesn't wait for the pool
+        assert pool.render(slow_square, 4, 0) == 16
+        assert RENDER_REQUESTS.get(result="fallback") == before + 1
+        worker.join()
+        assert results == [9]
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.slow
+def test_render_falls_back_on_timeout():
+    pool = RenderPool(1, max_pending=1, timeout=0.1)
+    try:
+        before = RENDER_REQUESTS.get(result="fallback")
+        assert pool.render(slow_square, 5, 0.5) == 25
+        assert RENDER_REQUESTS.get(result="fallback") == before + 1
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.slow
+def test_render_raises_errors_of_the_chart():
+    pool = RenderPool(1, max_pending=1, timeout=60)
+    try:
+        # Rendering it again in process would only fail again
+        with pytest.raises(TypeError):
+            pool.render(slow_square, "x", 0)
+        assert pool.render(slow_square, 6, 0) == 36
+    finally:
+        pool.shutdown()
@@ -0,0 +1,154 @@
+import datetime as dt
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from cryptoadvance.specterext.stacktrack.helpers import binning, dtutil, plot
+from cryptoadvance.specterext.stacktrack.helpers.cache import HistoryCache, tx_fingerprint
+from cryptoadvance.specterext.stacktrack.helpers.core import Interval
+from cryptoadvance.specterext.stacktrack.helpers.rollup import Rollup, RollupStore
+from cryptoadvance.specterext.stacktrack.helpers.tx_series import TxSeries
+
+
+@pytest.fixture
+def txs(recent_txs):
+    return recent_txs(1000)
+
+
+@pytest.mark.parametrize("span", plot.SPANS)
+def test_rollup_window_matches_bin_sats(txs, span):
+    rollup = Rollup.from_series(TxSeries.from_txs(txs), tx_fingerprint(txs, 100))
+    start_dt, end_dt, interval = plot.span_window(span, TxSeries.from_txs(txs))
+    edges = binning.bin_edges(start_dt, end_dt, interval)
+    bins, prior_count = rollup.window(edges, interval)
+    expected_bins, expected_prior_count = binning.bin_sats(*binning.tx_arrays(txs), edges)
+    assert bins.tolist() == expected_bins.tolist()
+    assert prior_count == expected_prior_count
+
+
+def test_rollup_window_before_first_tx(synthetic_txs):
+    txs = synthetic_txs(20, start=dt.datetime.now() - dt.timedelta(days=20))
+    rollup = Rollup.from_series(TxSeries.from_txs(txs), tx_fingerprint(txs, 100))
+    start_dt, end_dt, interval = plot.span_window("1y", TxSeries.from_txs(txs))
+    edges = binning.bin_edges(start_dt, end_dt, interval)
+    bins, prior_count = rollup.window(edges, interval)
+    assert prior_count == 0
+    assert bins.sum() == sum(round(tx.flow_amount * 100_000_000) for tx in txs)
+
+
+def test_rollup_empty_txs():
+    rollup = Rollup.from_series(TxSeries.empty(), tx_fingerprint([], 100))
+    start_dt, end_dt, interval = plot.span_window("1y", TxSeries.empty())
+    bins, prior_count = rollup.window(binning.bin_edges(start_dt, end_dt, interval), interval)
+    assert prior_count == 0
+    assert not bins.any()
+
+
+def test_rollup_store_persists(tmp_path, txs):
+    fingerprint = tx_fingerprint(txs, 100)
+    RollupStore(str(tmp_path)).update("/wallets/simple.json", txs, fingerprint)
+    assert len(os.listdir(tmp_path)) == 1
+
+    # A fresh store, e.g. after a restart, reads the rollup from disk
+    rollup = RollupStore(str(tmp_path)).get("/wallets/simple.json", fingerprint)
+    assert rollup is not None
+    assert rollup.fingerprint == fingerprint
+
+
+def test_rollup_store_get_checks_fingerprint(tmp_path, txs):
+    store = RollupStore(str(tmp_path))
+    store.update("w", txs, tx_fingerprint(txs, 100))
+    # New blocks don't matter, new txs do
+    assert store.get("w", tx_fingerprint(txs, 105)) is not None
+    assert store.get("w", tx_fingerprint(txs[1:], 105)) is None
+    assert store.get("unknown", tx_fingerprint(txs, 100)) is None
+
+
+def test_rollup_store_update_skips_current_rollup(tmp_path, txs, monkeypatch):
+    store = RollupStore(str(tmp_path))
+    rollup = store.update("w", txs, tx_fingerprint(txs, 100))
+    monkeypatch.setattr(Rollup, "from_series", None)
+    assert store.update("w", txs, tx_fingerprint(txs, 101)) is rollup
+
+
+@pytest.mark.parametrize("tz", [None, "Asia/Kolkata"])
+@pytest.mark.parametrize("span", plot.SPANS)
+def test_history_cache_reads_rollups(tmp_path, txs, span, tz, monkeypatch):
+    store = RollupStore(str(tmp_path))
+    store.update("w", txs, tx_fingerprint(txs, 100), tz)
+    expected = plot.build_frame(span, TxSeries.from_txs(txs), tz)
+
+    def fail(*args):
+        raise AssertionError("should have been read from the rollup")
+
+    monkeypatch.setattr(TxSeries, "bin_sats", fail)
+    monkeypatch.setattr(TxSeries, "bin_sats_many", fail)
+    pd.testing.assert_frame_equal(HistoryCache(rollups=store).get_frame("w", txs, 101, span, tz=tz), expected)
+
+
+@pytest.mark.parametrize("span", ["1d", "1m", "1y"])
+def test_history_cache_skips_rollups_of_other_timezones(tmp_path, txs, span):
+    store = RollupStore(str(tmp_path))
+    store.update("w", txs, tx_fingerprint(txs, 100), "Asia/Kolkata")
+    expected = plot.build_frame(span, TxSeries.from_txs(txs), "America/New_York")
+    result = HistoryCache(rollups=store).get_frame("w", txs, 101, span, tz="America/New_York")
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_rollup_store_keeps_a_rollup_per_timezone(tmp_path, txs):
+    fingerprint = tx_fingerprint(txs, 100)
+    store = RollupStore(str(tmp_path))
+    for tz in ("Asia/Kolkata", "Europe/Berlin"):
+        assert store.update("w", txs, fingerprint, tz).tz == tz
+    # A fresh store reads both of them from disk
+    store = RollupStore(str(tmp_path))
+    for tz in ("Asia/Kolkata", "Europe/Berlin"):
+        assert store.get("w", fingerprint, tz).tz == tz
+    assert store.get("w", fingerprint) is None
+
+
+def test_rollup_store_skips_rollups_of_another_timezone(tmp_path, txs):
+    # Before there was a rollup per timezone, the default timezone's rollup was stored under the wallet's name alone
+    fingerprint = tx_fingerprint(txs, 100)
+    Rollup.from_series(TxSeries.from_txs(txs), fingerprint, "Asia/Kolkata").save(
+        RollupStore(str(tmp_path))._path("w", None)
+    )
+    store = RollupStore(str(tmp_path))
+    assert store.get("w", fingerprint) is None
+    assert store.update("w", txs, fingerprint).tz is None
+
+
+def test_rollup_window_after_last_bin(txs):
+    rollup = Rollup.from_series(TxSeries.from_txs(txs), tx_fingerprint(txs, 100))
+    start_dt = dt.datetime.now() + dt.timedelta(days=400)
+    edges = binning.bin_edges(start_dt, start_dt + dt.timedelta(days=60), Interval.MONTH)
+    bins, prior_count = rollup.window(edges, Interval.MONTH)
+    assert not bins.any()
+    assert prior_count == TxSeries.from_txs(txs).sats.sum()
+
+
+def test_rollup_window_in_another_timezone(txs):
+    rollup = Rollup.from_series(TxSeries.from_txs(txs), tx_fingerprint(txs, 100), "Asia/Kolkata")
+    start_dt, end_dt, interval = plot.span_window("1m", TxSeries.from_txs(txs), "America/New_York")
+    assert rollup.window(binning.bin_edges(start_dt, end_dt, interval, "America/New_York"), interval) is None
+
+
+@pytest.mark.parametrize("local_timezone", ["Asia/Kolkata"], indirect=True)
+@pytest.mark.parametrize("span", ["1d", "1m", "1y"])
+def test_rollup_store_rebuilds_when_the_local_timezone_changes(tmp_path, txs, span, local_timezone, monkeypatch):
+    fingerprint = tx_fingerprint(txs, 100)
+    RollupStore(str(tmp_path)).update("w", txs, fingerprint)
+    store = RollupStore(str(tmp_path))
+    assert store.get("w", fingerprint) is not None
+
+    # The server moved to another timezone, so the rollups in its local time are stale
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    assert store.get("w", fingerprint) is None
+    assert RollupStore(str(tmp_path)).get("w", fingerprint) is None
+    expected = plot.build_frame(span, TxSeries.from_txs(txs))
+    pd.testing.assert_frame_equal(HistoryCache(rollups=store).get_frame("w", txs, 101, span), expected)
+    assert store.update("w", txs, fingerprint).zone == dtutil.resolve_timezone()
+    assert RollupStore(str(tmp_path)).get("w", fingerprint) is not None
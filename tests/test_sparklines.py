@@ -0,0 +1,101 @@
+import datetime as dt
+import re
+
+import numpy as np
+import pytest
+
+from cryptoadvance.specterext.stacktrack.helpers import binning, plot, sparklines
+from cryptoadvance.specterext.stacktrack.helpers.cache import tx_fingerprint
+from cryptoadvance.specterext.stacktrack.helpers.core import Interval
+from cryptoadvance.specterext.stacktrack.helpers.sparklines import SparklineCache
+from cryptoadvance.specterext.stacktrack.helpers.tx_series import TxSeries
+
+
+@pytest.fixture
+def txlists(recent_txs):
+    return [recent_txs(count, seed=seed) for seed, count in enumerate([0, 1, 300, 2000])]
+
+
+def test_sparkline_window():
+    start_dt, end_dt, interval = sparklines.sparkline_window(dt.datetime(2022, 10, 5, 14))
+    assert interval == Interval.WEEK
+    assert end_dt == dt.datetime(2022, 10, 10)
+    assert start_dt == end_dt - dt.timedelta(weeks=52)
+
+
+def test_balances_match_frames(txlists):
+    window = sparklines.sparkline_window()
+    series_list = [TxSeries.from_txs(txs) for txs in txlists]
+    result = sparklines.balances(series_list, binning.bin_edges(*window))
+    assert result.shape == (len(txlists), 52)
+    for row, series in zip(result, series_list):
+        assert row.tolist() == plot.build_window_frame(window, series)["sats_cusum"].tolist()
+
+
+def test_sparkline_svg():
+    svg = sparklines.sparkline_svg(np.array([0, 10, 5]))
+    points = re.search(r'points="([^"]*)"', svg).group(1).split(" ")
+    assert points == ["1.5,22.5", "60.0,1.5", "118.5,12.0"]
+    assert svg.startswith('<svg class="stacktrack_sparkline" width="120" height="24"')
+    # Flat and empty lines are drawn in the middle
+    assert 'points="1.5,12.0 60.0,12.0 118.5,12.0"' in sparklines.sparkline_svg(np.array([7, 7, 7]))
+    assert 'points="1.5,12.0 118.5,12.0"' in sparklines.sparkline_svg(np.array([], dtype=np.int64))
+
+
+def test_cache_redraws_stale_sparklines(txlists):
+    cache = SparklineCache()
+    loaded = []
+
+    def wallets(lists):
+        return [
+            (f"w{i}", tx_fingerprint(txs, 100), lambda txs=txs, i=i: loaded.append(i) or TxSeries.from_txs(txs))
+            for i, txs in enumerate(lists)
+        ]
+
+    first = cache.get(wallets(txlists))
+    assert list(first) == ["w0", "w1", "w2", "w3"]
+    assert loaded == [0, 1, 2, 3]
+
+    assert cache.get(wallets(txlists)) == first
+    assert loaded == [0, 1, 2, 3]
+
+    changed = txlists[:2] + [txlists[2][1:]] + txlists[3:]
+    second = cache.get(wallets(changed))
+    assert loaded == [0, 1, 2, 3, 2]
+    assert second["w3"] == first["w3"]
+
+    # The window moves on each week
+    later = sparklines.sparkline_window(dt.datetime.now() + dt.timedelta(weeks=1))
+    cache.get(wallets(changed), later)
+    assert loaded == [0, 1, 2, 3, 2, 0, 1, 2, 3]
+
+
+def test_sparklines_dont_build_a_chart(synthetic_txs, monkeypatch):
+    series_list = [TxSeries.from_txs(synthetic_txs(500, seed=seed)) for seed in range(40)]
+    wallets = [(f"w{i}", i, lambda series=series: series) for i, series in enumerate(series_list)]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("sparklines shouldn't build a chart")
+
+    for name in ("build_frame", "build_window_frame", "build_figure", "figure_html", "build_chart_from_df"):
+        monkeypatch.setattr(plot, name, fail)
+    monkeypatch.setattr(plot.go, "Figure", fail)
+    monkeypatch.setattr(plot.plotly.io, "to_html", fail)
+
+    # One set of bin edges for all wallets, and a single lookup into the cumulative sums of each
+    calls = {"bin_edges": 0, "bin_sats": 0}
+    bin_edges, bin_sats = binning.bin_edges, TxSeries.bin_sats
+
+    def counted_bin_edges(*args):
+        calls["bin_edges"] += 1
+        return bin_edges(*args)
+
+    def counted_bin_sats(self, edges):
+        calls["bin_sats"] += 1
+        return bin_sats(self, edges)
+
+    monkeypatch.setattr(binning, "bin_edges", counted_bin_edges)
+    monkeypatch.setattr(TxSeries, "bin_sats", counted_bin_sats)
+    svgs = SparklineCache().get(wallets)
+    assert len(svgs) == len(series_list)
+    assert calls == {"bin_edges": 1, "bin_sats": len(series_list)}
@@ -0,0 +1,38 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["numpy", "pandas", "plotly"]
+
+# Runs in a fresh interpreter, so nothing is imported yet. It lists which of the heavy modules are loaded after
+# importing the extension, and after importing the chart helpers.
+IMPORT_SCRIPT = """
+import json, sys
+from flask import Blueprint
+from cryptoadvance.specterext.stacktrack.service import StacktrackService
+
+StacktrackService.blueprint = Blueprint("stacktrack_endpoint", "cryptoadvance.specterext.stacktrack.controller")
+from cryptoadvance.specterext.stacktrack import controller
+
+loaded_by_import = [m for m in HEAVY_MODULES if m in sys.modules]
+from cryptoadvance.specterext.stacktrack.helpers import plot
+loaded_by_chart = [m for m in HEAVY_MODULES if m in sys.modules]
+print(json.dumps({"loaded_by_import": loaded_by_import, "loaded_by_chart": loaded_by_chart}))
+"""
+
+
+@pytest.fixture(scope="module")
+def loaded_modules():
+    script = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n{IMPORT_SCRIPT}"
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_import_does_not_load_chart_dependencies(loaded_modules):
+    assert loaded_modules["loaded_by_import"] == []
+
+
+def test_chart_helpers_load_chart_dependencies(loaded_modules):
+    assert loaded_modules["loaded_by_chart"] == HEAVY_MODULES
@@ -0,0 +1,46 @@
+import random
+import sys
+
+from cryptoadvance.specterext.stacktrack.helpers import binning
+from cryptoadvance.specterext.stacktrack.helpers.tx_series import TxSeries
+
+
+def test_from_txs(synthetic_txs):
+    txs = synthetic_txs(100, unconfirmed=3)
+    series = TxSeries.from_txs(txs)
+    assert len(series) == 100
+    # Oldest first, the reverse of Wallet.txlist()
+    assert series.timestamps.tolist() == [tx["time"] for tx in reversed(txs)]
+    assert series.sats.tolist() == binning.tx_arrays(txs)[1][::-1].tolist()
+    assert series.blockheights.tolist() == [tx["blockheight"] or 0 for tx in reversed(txs)]
+    assert series.first_time == txs[-1]["time"]
+    assert (series.blockheights == 0).sum() == 3
+
+
+def test_from_txs_unsorted(synthetic_txs):
+    txs = synthetic_txs(100)
+    shuffled = list(txs)
+    random.Random(1).shuffle(shuffled)
+    series = TxSeries.from_txs(shuffled)
+    assert series.timestamps.tolist() == sorted(tx["time"] for tx in txs)
+    assert series.sats.sum() == TxSeries.from_txs(txs).sats.sum()
+
+
+def test_empty():
+    assert len(TxSeries.empty()) == 0
+    assert TxSeries.empty().first_time is None
+    assert len(TxSeries.from_txs([])) == 0
+
+
+def test_concat(synthetic_txs):
+    old_txs = synthetic_txs(50, seed=1)
+    new_txs = synthetic_txs(20, seed=2)
+    series = TxSeries.from_txs(old_txs).concat(TxSeries.from_txs(new_txs))
+    expected = TxSeries.from_txs(old_txs + new_txs)
+    assert series.timestamps.tolist() == expected.timestamps.tolist()
+    assert sorted(series.sats.tolist()) == sorted(expected.sats.tolist())
+
+
+def test_smaller_than_txs(synthetic_txs):
+    txs = synthetic_txs(1000)
+    assert TxSeries.from_txs(txs).nbytes < sum(sys.getsizeof(tx) for tx in txs) / 5
@@ -0,0 +1,122 @@
+import datetime as dt
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cryptoadvance.specterext.stacktrack.helpers import plot
+from cryptoadvance.specterext.stacktrack.helpers.cache import HistoryCache
+from cryptoadvance.specterext.stacktrack.helpers.tx_series import TxSeries
+from cryptoadvance.specterext.stacktrack.helpers.tx_store import TxStore
+from fix_txs import FakeTx
+
+
+@pytest.fixture
+def txs(recent_txs):
+    return recent_txs(1000)
+
+
+def assert_series_equal(series: TxSeries, expected: TxSeries):
+    assert series.timestamps.tolist() == expected.timestamps.tolist()
+    assert series.sats.tolist() == expected.sats.tolist()
+    assert series.blockheights.tolist() == expected.blockheights.tolist()
+    assert series.sats_cusum().tolist() == np.cumsum(expected.sats).tolist()
+
+
+def test_sync(tmp_path, txs):
+    series = TxStore(str(tmp_path)).sync("w", txs)
+    assert isinstance(series.timestamps, np.memmap)
+    assert_series_equal(series, TxSeries.from_txs(txs))
+
+    # A fresh store, e.g. after a restart, maps the same files
+    assert_series_equal(TxStore(str(tmp_path)).sync("w", txs), TxSeries.from_txs(txs))
+
+
+def test_sync_appends_new_txs(tmp_path, txs, monkeypatch):
+    store = TxStore(str(tmp_path))
+    old_series = store.sync("w", txs[200:])
+    monkeypatch.setattr(store, "_write", None)
+    series = store.sync("w", txs)
+    assert_series_equal(series, TxSeries.from_txs(txs))
+    # Series handed out earlier keep their length
+    assert len(old_series) == 800
+
+
+def test_sync_rewrites_changed_history(tmp_path, txs):
+    store = TxStore(str(tmp_path))
+    store.sync("w", txs)
+    dropped = txs[:500] + txs[501:]
+    assert_series_equal(store.sync("w", dropped), TxSeries.from_txs(dropped))
+    assert_series_equal(store.sync("w", txs[1:]), TxSeries.from_txs(txs[1:]))
+
+
+def test_sync_rewrites_older_new_txs(tmp_path, synthetic_txs):
+    store = TxStore(str(tmp_path))
+    new_txs = synthetic_txs(100, seed=1)
+    store.sync("w", new_txs)
+    # The count and newest tx would allow an append, but the txs are older than the stored ones
+    old_txs = synthetic_txs(10, seed=2, end=dt.datetime(2016, 1, 1))
+    txs = new_txs[:1] + old_txs + new_txs[1:]
+    txs = sorted(txs, key=lambda tx: tx["time"], reverse=True)
+    assert_series_equal(store.sync("w", txs), TxSeries.from_txs(txs))
+
+
+def test_sync_rewrites_on_new_legs_of_the_newest_tx(tmp_path, txs):
+    store = TxStore(str(tmp_path))
+    store.sync("w", txs)
+    # A newer leg of the newest tx takes over its netted flow, see txs.net_transfers
+    legs = [FakeTx(txs[0], time=txs[0]["time"] + 60, flow_amount=0.1), FakeTx(txs[0], flow_amount=0)]
+    netted = legs + txs[1:]
+    assert_series_equal(store.sync("w", netted), TxSeries.from_txs(netted))
+
+
+def test_sync_rewrites_on_new_legs_of_older_txs(tmp_path, txs):
+    store = TxStore(str(tmp_path))
+    store.sync("w", txs)
+    # A new leg of the second newest tx, which is listed as of the newest tx's time
+    legs = [FakeTx(txs[1], time=txs[0]["time"], flow_amount=0.1), FakeTx(txs[1], flow_amount=0)]
+    netted = [legs[0], txs[0], legs[1]] + txs[2:]
+    assert_series_equal(store.sync("w", netted), TxSeries.from_txs(netted))
+
+
+def test_sync_drops_interrupted_append(tmp_path, txs):
+    store = TxStore(str(tmp_path))
+    store.sync("w", txs[200:])
+    with open(os.path.join(store._wallet_folder("w"), "sats.i8"), "ab") as f:
+        f.write(b"\xff" * 24)
+    assert_series_equal(store.sync("w", txs), TxSeries.from_txs(txs))
+
+
+def test_load_adds_unconfirmed_txs(tmp_path, synthetic_txs):
+    store = TxStore(str(tmp_path))
+    txs = synthetic_txs(100, unconfirmed=5)
+    assert len(store.sync("w", txs)) == 95
+    assert_series_equal(store.load("w", txs), TxSeries.from_txs(txs))
+
+
+def test_load_empty(tmp_path, synthetic_txs):
+    store = TxStore(str(tmp_path))
+    assert len(store.load("w", [])) == 0
+    txs = synthetic_txs(3, unconfirmed=3)
+    assert_series_equal(store.load("w", txs), TxSeries.from_txs(txs))
+
+
+@pytest.mark.parametrize("span", plot.SPANS)
+def test_history_cache_uses_tx_store(tmp_path, txs, span):
+    cache = HistoryCache(tx_store=TxStore(str(tmp_path)))
+    pd.testing.assert_frame_equal(
+        cache.get_frame("w", txs[200:], 100, span), plot.build_frame(span, TxSeries.from_txs(txs[200:]))
+    )
+    assert isinstance(cache._entries["w"].series.timestamps, np.memmap)
+
+    pd.testing.assert_frame_equal(cache.get_frame("w", txs, 101, span), plot.build_frame(span, TxSeries.from_txs(txs)))
+    assert isinstance(cache._entries["w"].series.timestamps, np.memmap)
+    assert len(cache._entries["w"].series) == 1000
+
+
+def test_history_cache_skips_tx_store_for_small_wallets(tmp_path, txs):
+    cache = HistoryCache(tx_store=TxStore(str(tmp_path)), tx_store_min_txs=len(txs) + 1)
+    cache.get_frame("w", txs, 100, "1y")
+    assert not isinstance(cache._entries["w"].series.timestamps, np.memmap)
+    assert os.listdir(tmp_path) == []
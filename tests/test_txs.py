@@ -0,0 +1,109 @@
+import heapq
+import time
+
+import pytest
+
+from cryptoadvance.specterext.stacktrack.helpers import binning
+from cryptoadvance.specterext.stacktrack.helpers.txs import merge_txlists, net_transfers, split_unconfirmed
+from fix_txs import FakeTx
+
+
+def test_merge_txlists(synthetic_txs):
+    txlists = [synthetic_txs(100, seed=seed) for seed in range(5)]
+    merged = merge_txlists(txlists)
+    assert len(merged) == 500
+    assert [tx["time"] for tx in merged] == sorted((tx["time"] for txs in txlists for tx in txs), reverse=True)
+
+
+def test_merge_txlists_unconfirmed(synthetic_txs):
+    confirmed = synthetic_txs(10, seed=1)
+    unconfirmed = synthetic_txs(10, seed=2, unconfirmed=3)
+    merged = merge_txlists([confirmed, unconfirmed])
+    assert len(merged) == 20
+    assert sum(1 for tx in merged if tx["blockheight"] is None) == 3
+
+
+def test_merge_txlists_empty():
+    assert merge_txlists([]) == []
+    assert merge_txlists([[], []]) == []
+
+
+def test_net_transfers(synthetic_txs):
+    sender = synthetic_txs(10, seed=1)
+    receiver = synthetic_txs(10, seed=2)
+    # 0.5 BTC from the sender's newest tx went to the receiver, the fee was 1000 sats
+    transfer = sender[0]
+    sender[0] = FakeTx(transfer, flow_amount=-0.50001)
+    receiver = merge_txlists([receiver, [FakeTx(transfer, flow_amount=0.5)]])
+    merged = merge_txlists([sender, receiver])
+    netted = net_transfers(merged)
+    assert len(netted) == len(merged) == 21
+    legs = [i for i, tx in enumerate(netted) if tx["txid"] == transfer["txid"]]
+    assert binning.tx_arrays([netted[i] for i in legs])[1].tolist() == [-1000, 0]
+    # All other txs are passed through
+    assert all(netted[i] is merged[i] for i in range(len(merged)) if i not in legs)
+
+
+def test_net_transfers_without_shared_txs(synthetic_txs):
+    merged = merge_txlists([synthetic_txs(10, seed=1), synthetic_txs(10, seed=2)])
+    assert net_transfers(merged) is merged
+    assert net_transfers([]) == []
+
+
+def test_split_unconfirmed(synthetic_txs):
+    txs = synthetic_txs(20, unconfirmed=3)
+    confirmed, pending = split_unconfirmed(txs)
+    assert confirmed == txs[3:]
+    assert pending == txs[:3]
+    # Without pending txs the list itself is returned
+    assert split_unconfirmed(confirmed) == (confirmed, [])
+    assert split_unconfirmed(confirmed)[0] is confirmed
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("num_wallets,num_txs", [(40, 5_000), (200, 2_000)])
+def test_benchmark_merge_txlists(synthetic_txs, num_wallets, num_txs):
+    txlists = [synthetic_txs(num_txs, seed=seed) for seed in range(num_wallets)]
+
+    start = time.perf_counter()
+    concatenated = []
+    for txs in txlists:
+        concatenated = concatenated + txs
+    concatenated = sorted(concatenated, key=lambda tx: tx["time"], reverse=True)
+    concat_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    heap_merged = list(heapq.merge(*txlists, key=lambda tx: tx["time"], reverse=True))
+    heap_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    merged = merge_txlists(txlists)
+    merge_time = time.perf_counter() - start
+
+    print(
+        f"\n{num_wallets} wallets x {num_txs} txs: concatenate and sort {concat_time:.3f}s, "
+        f"heapq.merge {heap_time:.3f}s, merge_txlists {merge_time:.3f}s"
+    )
+    times = [tx["time"] for tx in merged]
+    assert times == [tx["time"] for tx in concatenated] == [tx["time"] for tx in heap_merged]
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("num_wallets,num_txs", [(40, 5_000), (200, 2_000)])
+def test_benchmark_net_transfers(synthetic_txs, num_wallets, num_txs):
+    txlists = [synthetic_txs(num_txs, seed=seed) for seed in range(num_wallets)]
+    # Every wallet sent a tenth of its txs to the next one
+    received = [[FakeTx(tx, flow_amount=-tx["flow_amount"]) for tx in txs[::10]] for txs in txlists[:-1]]
+    merged = merge_txlists(txlists + received)
+
+    start = time.perf_counter()
+    merge_txlists(txlists + received)
+    merge_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    netted = net_transfers(merged)
+    net_time = time.perf_counter() - start
+
+    print(f"\n{num_wallets} wallets x {num_txs} txs: merge_txlists {merge_time:.3f}s, net_transfers {net_time:.3f}s")
+    assert len(netted) == len(merged)
+    assert sum(1 for tx in netted if tx.flow_amount == 0) >= (num_wallets - 1) * num_txs // 10